@@ -0,0 +1,104 @@
+# deep_pages.py - benchmark for fetching a deep page of a collection
+#
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Measures the latency of fetching a deep page of a large collection,
+with and without a deferred join.
+
+The database is an in-memory SQLite database containing one million
+rows, each with a wide text column, so building the fixture takes a
+while. With Flask-Restless installed (for example, with ``pip install
+-e .``), run::
+
+    python benchmarks/deep_pages.py
+
+On SQLite 3.40 with SQLAlchemy 1.2 and Python 3.6, both ways take about
+16 ms for page 5000, since the primary key is the rowid of the table
+and SQLite skips the rows before the offset without reading their
+columns; the deferred join is meant for databases like PostgreSQL and
+MySQL, which read each skipped row in full.
+
+"""
+from __future__ import print_function
+
+import timeit
+
+from flask import Flask
+from sqlalchemy import Column
+from sqlalchemy import create_engine
+from sqlalchemy import Integer
+from sqlalchemy import Unicode
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm import sessionmaker
+
+from flask_restless import APIManager
+from flask_restless.views import helpers
+
+#: The number of rows in the table.
+NUM_ROWS = 1000000
+
+#: The number of rows inserted by each statement while building the
+#: fixture.
+BATCH_SIZE = 10000
+
+#: The page to fetch.
+PAGE_NUMBER = 5000
+
+#: The number of resources on each page.
+PAGE_SIZE = 10
+
+#: The number of times to repeat the measurement.
+REPEAT = 5
+
+Base = declarative_base()
+
+
+class Article(Base):
+    __tablename__ = 'article'
+    id = Column(Integer, primary_key=True)
+    title = Column(Unicode)
+    body = Column(Unicode)
+
+
+def main():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    session = scoped_session(sessionmaker(bind=engine))
+    body = u'x' * 1000
+    insert = Article.__table__.insert()
+    for start in range(0, NUM_ROWS, BATCH_SIZE):
+        rows = [dict(id=i, title=u'title {0}'.format(i), body=body)
+                for i in range(start, start + BATCH_SIZE)]
+        session.execute(insert, rows)
+    session.commit()
+
+    app = Flask(__name__)
+    manager = APIManager(app, session=session)
+    # Counting is measured elsewhere; it would dominate the latency.
+    manager.create_api(Article, count_policy='none')
+    client = app.test_client()
+    query_string = {'page[number]': PAGE_NUMBER, 'page[size]': PAGE_SIZE,
+                    'sort': '-id'}
+
+    def fetch():
+        response = client.get('/api/article', query_string=query_string)
+        assert response.status_code == 200
+
+    min_offset = helpers.DEFERRED_JOIN_MIN_OFFSET
+    for label, offset in ('without deferred join', NUM_ROWS + 1), \
+            ('with deferred join', min_offset):
+        helpers.DEFERRED_JOIN_MIN_OFFSET = offset
+        times = timeit.repeat(fetch, repeat=REPEAT, number=1)
+        print('{0}: {1:.1f} ms'.format(label, min(times) * 1e3))
+    helpers.DEFERRED_JOIN_MIN_OFFSET = min_offset
+
+
+if __name__ == '__main__':
+    main()
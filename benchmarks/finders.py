@@ -0,0 +1,108 @@
+# finders.py - microbenchmark for the global lookup functions
+#
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Measures the cost of the global :func:`model_for`,
+:func:`collection_name`, :func:`url_for`, and :func:`primary_key_for`
+functions when many models have APIs.
+
+The APIs are created either by a single :class:`APIManager` or by one
+:class:`APIManager` for each model. With Flask-Restless installed (for
+example, with ``pip install -e .``), run::
+
+    python benchmarks/finders.py
+
+"""
+from __future__ import print_function
+
+import timeit
+
+from flask import Flask
+from sqlalchemy import Column
+from sqlalchemy import create_engine
+from sqlalchemy import Integer
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm import sessionmaker
+
+from flask_restless import APIManager
+from flask_restless import collection_name
+from flask_restless import model_for
+from flask_restless import primary_key_for
+from flask_restless import url_for
+
+#: The number of models for which APIs are created.
+NUM_MODELS = 200
+
+#: The number of times to repeat the measurement.
+REPEAT = 5
+
+#: The number of lookups of each model in each measurement.
+NUMBER = 20
+
+
+def create_models(base, prefix):
+    """Returns a list of :data:`NUM_MODELS` models derived from `base`,
+    whose names begin with `prefix`.
+
+    """
+    models = []
+    for i in range(NUM_MODELS):
+        name = '{0}{1}'.format(prefix.capitalize(), i)
+        attributes = dict(__tablename__='{0}{1}'.format(prefix, i),
+                          id=Column(Integer, primary_key=True))
+        models.append(type(name, (base, ), attributes))
+    return models
+
+
+def measure(label, app, models):
+    """Prints the mean time of a call to each lookup function, over all
+    `models`.
+
+    """
+    names = [collection_name(model) for model in models]
+    calls = [
+        ('model_for', lambda: [model_for(name) for name in names]),
+        ('collection_name', lambda: [collection_name(m) for m in models]),
+        ('primary_key_for', lambda: [primary_key_for(m) for m in models]),
+        ('url_for', lambda: [url_for(m, resource_id=1) for m in models]),
+    ]
+    with app.test_request_context():
+        for function, call in calls:
+            times = timeit.repeat(call, repeat=REPEAT, number=NUMBER)
+            mean = min(times) / (NUMBER * len(models))
+            print('{0}, {1}: {2:.1f} us'.format(label, function, mean * 1e6))
+
+
+def main():
+    engine = create_engine('sqlite://')
+    session = scoped_session(sessionmaker(bind=engine))
+
+    # All of the APIs are created by one manager.
+    Base = declarative_base()
+    models = create_models(Base, 'shared')
+    app = Flask(__name__)
+    manager = APIManager(app, session=session)
+    for model in models:
+        manager.create_api(model)
+    measure('one manager', app, models)
+
+    # Each API is created by a manager of its own.
+    Base = declarative_base()
+    models = create_models(Base, 'own')
+    app = Flask(__name__)
+    for i, model in enumerate(models):
+        manager = APIManager(app, session=session,
+                             url_prefix='/api{0}'.format(i))
+        manager.create_api(model)
+    measure('one manager per model', app, models)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# serialization.py - microbenchmark for serializing resources
+#
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Measures the cost of serializing a single instance of a model.
+
+The instances are loaded into the session before timing starts, so this
+measures the serializer itself rather than the database. With
+Flask-Restless installed (for example, with ``pip install -e .``), run::
+
+    python benchmarks/serialization.py
+
+"""
+from __future__ import print_function
+
+from datetime import datetime
+import timeit
+
+from flask import Flask
+from sqlalchemy import Column
+from sqlalchemy import create_engine
+from sqlalchemy import DateTime
+from sqlalchemy import ForeignKey
+from sqlalchemy import Integer
+from sqlalchemy import Unicode
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship
+from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm import sessionmaker
+
+from flask_restless import APIManager
+from flask_restless import serializer_for
+
+#: The number of instances to serialize in each call to `serialize_many`.
+NUM_INSTANCES = 100
+
+#: The number of times to repeat the measurement.
+REPEAT = 5
+
+#: The number of calls to `serialize_many` in each measurement.
+NUMBER = 20
+
+Base = declarative_base()
+
+
+class Person(Base):
+    __tablename__ = 'person'
+    id = Column(Integer, primary_key=True)
+    name = Column(Unicode)
+
+
+class Article(Base):
+    __tablename__ = 'article'
+    id = Column(Integer, primary_key=True)
+    title = Column(Unicode)
+    body = Column(Unicode)
+    rating = Column(Integer)
+    created_at = Column(DateTime)
+    author_id = Column(Integer, ForeignKey('person.id'))
+    author = relationship(Person)
+
+
+def main():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    session = scoped_session(sessionmaker(bind=engine))
+    author = Person(id=1, name=u'foo')
+    session.add(author)
+    for i in range(NUM_INSTANCES):
+        article = Article(id=i, title=u'title', body=u'body', rating=i,
+                          created_at=datetime(2016, 1, 1), author=author)
+        session.add(article)
+    session.commit()
+
+    app = Flask(__name__)
+    app.config['SERVER_NAME'] = 'localhost'
+    manager = APIManager(app, session=session)
+    manager.create_api(Person)
+    manager.create_api(Article)
+    serializer = serializer_for(Article)
+
+    instances = session.query(Article).all()
+    # Load the related instance and all attributes before timing.
+    for instance in instances:
+        instance.author
+
+    with app.test_request_context():
+
+        def serialize():
+            serializer.serialize_many(instances)
+
+        times = timeit.repeat(serialize, repeat=REPEAT, number=NUMBER)
+    per_instance = min(times) / (NUMBER * NUM_INSTANCES)
+    print('{0:.1f} microseconds per instance'.format(per_instance * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# startup.py - benchmark for creating and routing many APIs
+#
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Measures the time taken to create APIs for many models and to route
+requests to them, with URL rules for each API, with shared routes, and
+with shared routes and lazy APIs.
+
+Startup includes the first URL match, which forces Werkzeug to build its
+URL map. With Flask-Restless installed (for example, with ``pip install
+-e .``), run::
+
+    python benchmarks/startup.py
+
+"""
+from __future__ import print_function
+
+import timeit
+
+from flask import Flask
+from sqlalchemy import Column
+from sqlalchemy import create_engine
+from sqlalchemy import Integer
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm import sessionmaker
+
+from flask_restless import APIManager
+from flask_restless import url_for
+
+#: The number of models for which APIs are created.
+NUM_MODELS = 500
+
+#: The number of times to repeat the routing measurements.
+REPEAT = 5
+
+
+def create_models(base, prefix):
+    """Returns a list of :data:`NUM_MODELS` models derived from `base`,
+    whose names begin with `prefix`.
+
+    """
+    models = []
+    for i in range(NUM_MODELS):
+        name = '{0}{1}'.format(prefix.capitalize(), i)
+        attributes = dict(__tablename__='{0}{1}'.format(prefix, i),
+                          id=Column(Integer, primary_key=True))
+        models.append(type(name, (base, ), attributes))
+    return models
+
+
+def measure(label, session, shared_routes, lazy=False):
+    """Prints the time taken to create APIs for :data:`NUM_MODELS` models
+    and the mean time to match and build the URL of a resource.
+
+    """
+    base = declarative_base()
+    models = create_models(base, label.replace(' ', ''))
+    app = Flask(__name__)
+    start = timeit.default_timer()
+    manager = APIManager(app, session=session, shared_routes=shared_routes)
+    manager.create_apis(base, lazy=lazy)
+    adapter = app.url_map.bind('localhost')
+    adapter.match('/api/{0}/1'.format(models[0].__tablename__))
+    elapsed = timeit.default_timer() - start
+    print('{0}, startup: {1:.1f} ms'.format(label, elapsed * 1e3))
+
+    urls = ['/api/{0}/1'.format(model.__tablename__) for model in models]
+
+    def match():
+        for url in urls:
+            adapter.match(url)
+
+    def build():
+        for model in models:
+            url_for(model, resource_id=1)
+
+    with app.test_request_context():
+        for function, call in ('match', match), ('url_for', build):
+            times = timeit.repeat(call, repeat=REPEAT, number=1)
+            mean = min(times) / len(models)
+            print('{0}, {1}: {2:.1f} us'.format(label, function, mean * 1e6))
+
+
+def main():
+    engine = create_engine('sqlite://')
+    session = scoped_session(sessionmaker(bind=engine))
+    measure('rules for each API', session, shared_routes=False)
+    measure('shared routes', session, shared_routes=True)
+    measure('lazy shared routes', session, shared_routes=True, lazy=True)
+
+
+if __name__ == '__main__':
+    main()
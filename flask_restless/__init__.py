@@ -27,12 +27,14 @@ from .helpers import model_for
 from .helpers import serializer_for
 from .helpers import url_for
 from .helpers import primary_key_for
+from .json_backends import JSONBackend
 from .manager import APIManager
 from .manager import IllegalArgumentError
 from .serialization import DefaultDeserializer
 from .serialization import DefaultSerializer
 from .serialization import DeserializationException
 from .serialization import MultipleExceptions
+from .serialization import RowSerializer
 from .serialization import SerializationException
 from .serialization import simple_serialize
 from .serialization import simple_serialize_many
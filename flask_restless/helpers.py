@@ -27,10 +27,14 @@ import inspect
 from dateutil.parser import parse as parse_datetime
 from sqlalchemy import Date
 from sqlalchemy import DateTime
+from sqlalchemy import event
 from sqlalchemy import Interval
 from sqlalchemy import Time
 from sqlalchemy.exc import NoInspectionAvailable
 from sqlalchemy.ext.associationproxy import AssociationProxy
+from sqlalchemy.ext.hybrid import HYBRID_PROPERTY
+from sqlalchemy.orm import configure_mappers
+from sqlalchemy.orm import Mapper
 from sqlalchemy.orm import RelationshipProperty as RelProperty
 from sqlalchemy.sql import func
 from sqlalchemy.sql.expression import ColumnElement
@@ -64,6 +68,131 @@ def session_query(session, model):
     return session.query(model)
 
 
+class ModelInfo(object):
+    """The metadata of a SQLAlchemy model needed to create, serialize,
+    and deserialize its resources, computed once by inspecting the
+    model.
+
+    The helper functions in this module, like :func:`get_relations` and
+    :func:`is_like_list`, read from the :class:`ModelInfo` of a model
+    (see :func:`model_info`) instead of inspecting the model on each
+    call. The attributes of an instance of this class must not be
+    modified.
+
+    Since relationships defined by backrefs only exist once the mappers
+    have been configured, creating an instance of this class configures
+    them.
+
+    """
+
+    def __init__(self, model):
+        configure_mappers()
+        mapper = sqlalchemy_inspect(model)
+        self.model = model
+        descriptors = list(mapper.all_orm_descriptors.items())
+
+        #: The association proxies of the model, keyed by name.
+        #:
+        #: An association proxy only knows the class that owns it once it
+        #: has been accessed via that class, so each one is got from
+        #: the model before its local and remote attributes are read.
+        self.association_proxies = dict(
+            (name, getattr(model, name)) for name, descriptor in descriptors
+            if isinstance(descriptor, AssociationProxy))
+
+        #: The names of the relationships of the model, not including
+        #: association proxies.
+        self.relationships = frozenset(mapper.relationships.keys())
+
+        #: The names of the relations of the model, as returned by
+        #: :func:`get_relations`.
+        proxied = dict((proxy.local_attr.key, name) for name, proxy
+                       in self.association_proxies.items())
+        self.relations = tuple(proxied.get(name, name)
+                               for name in mapper.relationships.keys())
+
+        #: The names of the hybrid properties of the model.
+        self.hybrid_properties = tuple(
+            name for name, descriptor in descriptors
+            if descriptor.extension_type == HYBRID_PROPERTY)
+
+        #: The names of the primary key columns of the model.
+        self.primary_key_names = tuple(c.name for c in mapper.primary_key)
+
+        #: The columns of the model that contain foreign keys.
+        self.foreign_key_columns = tuple(c for c in mapper.columns
+                                         if c.foreign_keys)
+
+        #: The names of the columns of the model that contain foreign keys.
+        self.foreign_keys = tuple(c.name for c in self.foreign_key_columns)
+
+        #: For each relationship and association proxy, the related
+        #: model, keyed by name.
+        self.related_models = {}
+
+        #: For each relationship and association proxy, whether it is
+        #: list-like, keyed by name.
+        self.uselist = {}
+        for name, descriptor in descriptors:
+            if name in self.relationships:
+                prop = descriptor.property
+            elif name in self.association_proxies:
+                descriptor = self.association_proxies[name]
+                prop = descriptor.local_attr.property
+            else:
+                continue
+            self.related_models[name] = \
+                get_related_model_from_attribute(descriptor)
+            self.uselist[name] = prop.uselist
+
+        #: For each field, whether it may be set by a client, as
+        #: returned by :func:`has_field`, keyed by name.
+        self.settable = {}
+
+        #: For each field, the SQLAlchemy type of the field, as returned
+        #: by :func:`get_field_type`, keyed by name.
+        self.field_types = {}
+        for name, descriptor in descriptors:
+            # Evaluating a hybrid property on the model may raise any
+            # exception; such fields are left to be inspected on each
+            # call to the helper functions.
+            try:
+                self.settable[name] = _is_settable(model, name, descriptor)
+                self.field_types[name] = _field_type(getattr(model, name))
+            except Exception:
+                continue
+
+
+#: The :class:`ModelInfo` of each model, keyed by model.
+#:
+#: This is filled in by :func:`model_info` when the metadata of a model
+#: is first needed, and not when its API is created, since inspecting the
+#: model configures the mappers, which fails if a related model has not
+#: been defined yet.
+model_infos = {}
+
+
+def model_info(model):
+    """Returns the :class:`ModelInfo` of `model`, creating it if
+    necessary.
+
+    """
+    info = model_infos.get(model)
+    if info is None:
+        info = model_infos[model] = ModelInfo(model)
+    return info
+
+
+@event.listens_for(Mapper, 'after_configured')
+def _discard_model_infos():
+    """Discards the metadata of the models whenever new mappers are
+    configured, since they may have added relationships to existing
+    models (by a backref, for example).
+
+    """
+    model_infos.clear()
+
+
 def get_relations(model):
     """Returns a list of relation names of `model` (as a list of strings).
 
@@ -98,19 +227,12 @@ def get_relations(model):
         ['tags']
 
     """
-    mapper = sqlalchemy_inspect(model)
     # If we didn't have to deal with association proxies, we could just
-    # do `return list(mapper.relationships)`, but we want to replace all
-    # association attributes with the actual remote attributes, as the
-    # user would expect. Therefore, we get a dictionary mapping
-    # relationship name to association proxy local attribute name, then
-    # replace the key with the value wherever such a key appears in the
-    # list of relationships.
-    alldescriptors = mapper.all_orm_descriptors.items()
-    # TODO In Python 2.7+, this should be a dict comprehension.
-    association_proxies = dict((v.local_attr.key, k) for k, v in alldescriptors
-                               if isinstance(v, AssociationProxy))
-    return [association_proxies.get(r, r) for r in mapper.relationships.keys()]
+    # return the names of the relationships of the mapper, but we want
+    # to replace all association attributes with the actual remote
+    # attributes, as the user would expect. The :class:`ModelInfo`
+    # constructor does this once for each model.
+    return list(model_info(model).relations)
 
 
 def get_related_model(model, relationname):
@@ -141,6 +263,9 @@ def get_related_model(model, relationname):
     the model of the proxied remote relation.
 
     """
+    related_models = model_info(model).related_models
+    if relationname in related_models:
+        return related_models[relationname]
     mapper = sqlalchemy_inspect(model)
     attribute = mapper.all_orm_descriptors[relationname]
     # HACK This is required for Python 3.3 only. I'm guessing it lazily
@@ -171,8 +296,7 @@ def foreign_key_columns(model):
     foreign keys for relationships in the specified model class.
 
     """
-    mapper = sqlalchemy_inspect(model)
-    return [c for c in mapper.columns if c.foreign_keys]
+    return list(model_info(model).foreign_key_columns)
 
 
 def foreign_keys(model):
@@ -180,7 +304,7 @@ def foreign_keys(model):
     relationships in the specified model class.
 
     """
-    return [column.name for column in foreign_key_columns(model)]
+    return list(model_info(model).foreign_keys)
 
 
 def has_field(model, fieldname):
@@ -188,13 +312,24 @@ def has_field(model, fieldname):
     settable hybrid property for this field name.
 
     """
+    settable = model_info(model).settable
+    if fieldname in settable:
+        return settable[fieldname]
     mapper = sqlalchemy_inspect(model)
     # Get all descriptors, which include columns, relationships, and
     # other things like association proxies and hybrid properties.
     descriptors = mapper.all_orm_descriptors
     if fieldname not in descriptors:
         return False
-    field = descriptors[fieldname]
+    return _is_settable(model, fieldname, descriptors[fieldname])
+
+
+def _is_settable(model, fieldname, field):
+    """Returns whether the field named `fieldname` of `model`, whose ORM
+    descriptor is `field`, may be set, as described in
+    :func:`has_field`.
+
+    """
     # First, we check whether `fieldname` specifies a settable hybrid
     # property. This is a bit flimsy: we check whether the `fset`
     # attribute has been set on the `hybrid_property` instance. The
@@ -219,8 +354,7 @@ def is_relationship(model, fieldname):
     proxies.
 
     """
-    mapper = sqlalchemy_inspect(model)
-    return fieldname in mapper.relationships
+    return fieldname in model_info(model).relationships
 
 
 def get_field_type(model, fieldname):
@@ -230,7 +364,17 @@ def get_field_type(model, fieldname):
     specifies a hybrid property, this function returns `None`.
 
     """
-    field = getattr(model, fieldname)
+    field_types = model_info(model).field_types
+    if fieldname in field_types:
+        return field_types[fieldname]
+    return _field_type(getattr(model, fieldname))
+
+
+def _field_type(field):
+    """Returns the SQLAlchemy type of the attribute `field` of a model,
+    as described in :func:`get_field_type`.
+
+    """
     if isinstance(field, ColumnElement):
         return field.type
     if isinstance(field, AssociationProxy):
@@ -249,8 +393,7 @@ def primary_key_names(model):
     The returned list contains the name of each primary key as a string.
 
     """
-    mapper = sqlalchemy_inspect(model)
-    return [column.name for column in mapper.primary_key]
+    return list(model_info(model).primary_key_names)
 
 
 def primary_key_value(instance, as_string=False):
@@ -267,10 +410,18 @@ def primary_key_value(instance, as_string=False):
     result = getattr(instance, primary_key_for(instance))
     if not as_string:
         return result
+    return primary_key_string(result)
+
+
+def primary_key_string(value):
+    """Returns the given primary key value coerced to a string, as
+    required for the ``id`` element of a JSON API resource object.
+
+    """
     try:
-        return str(result)
+        return str(value)
     except UnicodeEncodeError:
-        return url_quote_plus(result.encode('utf-8'))
+        return url_quote_plus(value.encode('utf-8'))
 
 
 def is_like_list(model_or_instance, relationname):
@@ -292,6 +443,9 @@ def is_like_list(model_or_instance, relationname):
         model = get_model(model_or_instance)
     else:
         model = model_or_instance
+    uselist = model_info(model).uselist
+    if relationname in uselist:
+        return uselist[relationname]
     mapper = sqlalchemy_inspect(model)
     relation = mapper.all_orm_descriptors[relationname]
     if isinstance(relation, AssociationProxy):
@@ -312,6 +466,28 @@ def is_mapped_class(cls):
         return True
 
 
+def declarative_models(base):
+    """Returns a list of the mapped classes derived from the declarative
+    base class `base`, ordered by name.
+
+    Classes that use single table inheritance are excluded, since their
+    instances are stored in the table of their parent class.
+
+    """
+    # In SQLAlchemy 1.4 and later, the mapped classes are known to the
+    # registry of the base class; before that, they were stored in its
+    # class registry, along with markers for their modules.
+    registry = getattr(base, 'registry', None)
+    if registry is not None and hasattr(registry, 'mappers'):
+        classes = [mapper.class_ for mapper in registry.mappers]
+    else:
+        classes = base._decl_class_registry.values()
+    models = [cls for cls in classes
+              if isinstance(cls, type) and issubclass(cls, base) and
+              is_mapped_class(cls) and not sqlalchemy_inspect(cls).single]
+    return sorted(models, key=lambda model: model.__name__)
+
+
 def query_by_primary_key(session, model, pk_value, primary_key=None):
     """Returns a SQLAlchemy query object containing the result of querying
     `model` for instances whose primary key has the value `pk_value`.
@@ -351,12 +527,21 @@ def string_to_datetime(model, fieldname, value):
     object corresponding to `value`. Otherwise, the `value` is returned
     unchanged.
 
+    """
+    if value is None:
+        return value
+    return string_to_type(get_field_type(model, fieldname), value)
+
+
+def string_to_type(field_type, value):
+    """Casts `value` as :func:`string_to_datetime` does for a field of
+    the SQLAlchemy type `field_type`, which may be ``None``.
+
     """
     if value is None:
         return value
     # If this is a date, time or datetime field, parse it and convert it to
     # the appropriate type.
-    field_type = get_field_type(model, fieldname)
     if isinstance(field_type, (Date, Time, DateTime)):
         # If the string is empty, no datetime can be inferred from it.
         if value.strip() == '':
@@ -436,6 +621,43 @@ class Singleton(_Singleton('SingletonMeta', (object,), {})):
     pass
 
 
+class APIIndex(object):
+    """Indexes of the APIs created by :class:`APIManager` objects, so
+    that the manager that created an API for a given model or collection
+    name can be found without asking each manager in turn.
+
+    """
+
+    def __init__(self):
+        #: A mapping from model to the list of :class:`APIManager`
+        #: objects that have created an API for it, in order of creation.
+        self.managers_by_model = {}
+
+        #: A mapping from collection name to the list of
+        #: :class:`APIManager` objects that have created an API with
+        #: that collection name, in order of creation.
+        self.managers_by_collection_name = {}
+
+    def add(self, apimanager, model, collection_name):
+        """Records that `apimanager` has created an API for `model` with
+        the specified collection name.
+
+        """
+        self.managers_by_model.setdefault(model, []).append(apimanager)
+        managers = self.managers_by_collection_name
+        managers.setdefault(collection_name, []).append(apimanager)
+
+    def clear(self):
+        """Forgets all APIs."""
+        self.managers_by_model.clear()
+        self.managers_by_collection_name.clear()
+
+
+#: The index of the APIs created by all :class:`APIManager` objects,
+#: which is updated by :meth:`APIManager.create_api_blueprint`.
+api_index = APIIndex()
+
+
 class KnowsAPIManagers:
     """An object that allows client code to register :class:`APIManager`
     objects.
@@ -452,6 +674,34 @@ class KnowsAPIManagers:
         """
         self.created_managers.add(apimanager)
 
+    def _first_registered(self, managers):
+        """Returns the first of the :class:`APIManager` objects in the
+        list `managers` that has been registered with this object, or
+        ``None`` if there is no such manager.
+
+        """
+        for manager in managers:
+            if manager in self.created_managers:
+                return manager
+        return None
+
+    def manager_for(self, model):
+        """Returns the registered :class:`APIManager` that created an
+        API for `model`, or ``None`` if there is no such manager.
+
+        """
+        managers = api_index.managers_by_model.get(model, ())
+        return self._first_registered(managers)
+
+    def manager_for_collection_name(self, collection_name):
+        """Returns the registered :class:`APIManager` that created an
+        API with the specified collection name, or ``None`` if there is
+        no such manager.
+
+        """
+        managers = api_index.managers_by_collection_name
+        return self._first_registered(managers.get(collection_name, ()))
+
 
 class ModelFinder(KnowsAPIManagers, Singleton):
     """The singleton class that backs the :func:`model_for` function."""
@@ -460,11 +710,9 @@ class ModelFinder(KnowsAPIManagers, Singleton):
         if _apimanager is not None:
             # This may raise ValueError.
             return _apimanager.model_for(resource_type, **kw)
-        for manager in self.created_managers:
-            try:
-                return self(resource_type, _apimanager=manager, **kw)
-            except ValueError:
-                pass
+        manager = self.manager_for_collection_name(resource_type)
+        if manager is not None:
+            return manager.model_for(resource_type, **kw)
         message = ('No model with collection name {0} is known to any'
                    ' APIManager objects; maybe you have not set the'
                    ' `collection_name` keyword argument when calling'
@@ -482,11 +730,9 @@ class CollectionNameFinder(KnowsAPIManagers, Singleton):
                            ' {1}').format(_apimanager, model)
                 raise ValueError(message)
             return _apimanager.collection_name(model, **kw)
-        for manager in self.created_managers:
-            try:
-                return self(model, _apimanager=manager, **kw)
-            except ValueError:
-                pass
+        manager = self.manager_for(model)
+        if manager is not None:
+            return manager.collection_name(model, **kw)
         message = ('Model {0} is not known to any APIManager'
                    ' objects; maybe you have not called'
                    ' APIManager.create_api() for this model.').format(model)
@@ -509,15 +755,12 @@ class UrlFinder(KnowsAPIManagers, Singleton):
                                        relation_name=relation_name,
                                        related_resource_id=related_resource_id,
                                        relationship=relationship, **kw)
-        for manager in self.created_managers:
-            try:
-                return self(model, resource_id=resource_id,
-                            relation_name=relation_name,
-                            related_resource_id=related_resource_id,
-                            relationship=relationship, _apimanager=manager,
-                            **kw)
-            except ValueError:
-                pass
+        manager = self.manager_for(model)
+        if manager is not None:
+            return manager.url_for(model, resource_id=resource_id,
+                                   relation_name=relation_name,
+                                   related_resource_id=related_resource_id,
+                                   relationship=relationship, **kw)
         message = ('Model {0} is not known to any APIManager'
                    ' objects; maybe you have not called'
                    ' APIManager.create_api() for this model.').format(model)
@@ -534,11 +777,9 @@ class SerializerFinder(KnowsAPIManagers, Singleton):
                            ' {1}').format(_apimanager, model)
                 raise ValueError(message)
             return _apimanager.serializer_for(model, **kw)
-        for manager in self.created_managers:
-            try:
-                return self(model, _apimanager=manager, **kw)
-            except ValueError:
-                pass
+        manager = self.manager_for(model)
+        if manager is not None:
+            return manager.serializer_for(model, **kw)
         message = ('Model {0} is not known to any APIManager'
                    ' objects; maybe you have not called'
                    ' APIManager.create_api() for this model.').format(model)
@@ -555,13 +796,14 @@ class PrimaryKeyFinder(KnowsAPIManagers, Singleton):
             model = instance_or_model.__class__
 
         if _apimanager is not None:
-            managers_to_search = [_apimanager]
+            if model in _apimanager.created_apis_for:
+                manager = _apimanager
+            else:
+                manager = None
         else:
-            managers_to_search = self.created_managers
-        for manager in managers_to_search:
-            if model in manager.created_apis_for:
-                primary_key = manager.primary_key_for(model, **kw)
-                break
+            manager = self.manager_for(model)
+        if manager is not None:
+            primary_key = manager.primary_key_for(model, **kw)
         else:
             message = ('Model "{0}" is not known to {1}; maybe you have not'
                        ' called APIManager.create_api() for this model?')
@@ -0,0 +1,122 @@
+# json_backends.py - pluggable JSON encoders and decoders
+#
+# Copyright 2011 Lincoln de Sousa <lincoln@comum.org>.
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Backends for encoding JSON API documents to and decoding them from
+JSON.
+
+By default, Flask-Restless uses the JSON functions provided by Flask,
+which respect the JSON encoder configured on the Flask application. If
+one of the faster third-party libraries `orjson`_ or `ujson`_ is
+installed, an :class:`~flask.ext.restless.APIManager` can be configured
+to use it instead.
+
+.. _orjson: https://github.com/ijl/orjson
+.. _ujson: https://github.com/ultrajson/ultrajson
+
+"""
+from collections import namedtuple
+
+from flask import current_app
+from flask import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+#: A JSON encoder and decoder pair.
+#:
+#: `name` is a string identifying the backend. `dumps` is a function that
+#: takes a JSON-serializable object and returns its JSON encoding as a
+#: bytestring. `loads` is a function that takes a string or bytestring
+#: containing a JSON document and returns the decoded object; it must
+#: raise :exc:`ValueError` if the document is not valid JSON.
+JSONBackend = namedtuple('JSONBackend', ['name', 'dumps', 'loads'])
+
+
+def _default(obj):
+    """Encodes objects the third-party libraries do not know how to
+    encode using the JSON encoder of the current Flask application.
+
+    """
+    return current_app.json_encoder().default(obj)
+
+
+def _flask_dumps(obj):
+    return json.dumps(obj).encode('utf-8')
+
+
+#: The backend that uses the JSON functions provided by Flask.
+FLASK_JSON = JSONBackend('flask', _flask_dumps, json.loads)
+
+#: A mapping from name to JSON backend for each backend whose library is
+#: installed.
+JSON_BACKENDS = {FLASK_JSON.name: FLASK_JSON}
+
+if orjson is not None:
+
+    def _orjson_dumps(obj):
+        return orjson.dumps(obj, default=_default,
+                            option=orjson.OPT_NON_STR_KEYS)
+
+    JSON_BACKENDS['orjson'] = JSONBackend('orjson', _orjson_dumps,
+                                          orjson.loads)
+
+if ujson is not None:
+
+    def _ujson_dumps(obj):
+        # The `default` keyword argument is only available in version 5
+        # and later.
+        return ujson.dumps(obj, ensure_ascii=False,
+                           escape_forward_slashes=False).encode('utf-8')
+
+    JSON_BACKENDS['ujson'] = JSONBackend('ujson', _ujson_dumps, ujson.loads)
+
+#: The names of all the JSON backends known to Flask-Restless, whether or
+#: not their libraries are installed.
+KNOWN_JSON_BACKENDS = frozenset(['flask', 'orjson', 'ujson'])
+
+
+def find_json_backend(preference=None):
+    """Returns the :data:`JSONBackend` to use given the user's
+    preference.
+
+    `preference` may be ``None``, in which case the Flask backend,
+    :data:`FLASK_JSON`, is returned. It may also be a
+    :data:`JSONBackend` object, which is returned unchanged. Otherwise,
+    `preference` must be the name of a backend or a list of such names
+    in order of preference, in which case the first backend whose
+    library is installed is returned. If none of them is installed, the
+    Flask backend is returned.
+
+    If `preference` contains a name not in :data:`KNOWN_JSON_BACKENDS`,
+    this function raises :exc:`ValueError`.
+
+    """
+    if preference is None:
+        return FLASK_JSON
+    if isinstance(preference, JSONBackend):
+        return preference
+    if not isinstance(preference, (list, tuple)):
+        preference = [preference]
+    unknown = set(preference) - KNOWN_JSON_BACKENDS
+    if unknown:
+        message = 'Unknown JSON backends: {0}'.format(', '.join(sorted(unknown)))
+        raise ValueError(message)
+    for name in preference:
+        if name in JSON_BACKENDS:
+            return JSON_BACKENDS[name]
+    return FLASK_JSON
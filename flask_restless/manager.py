@@ -17,20 +17,40 @@ their SQLAlchemy models.
 """
 from collections import defaultdict
 from collections import namedtuple
+from threading import Lock
 from uuid import uuid1
 import sys
 
+try:
+    from urllib.parse import urljoin
+except ImportError:
+    from urlparse import urljoin
+
+from flask import _request_ctx_stack
+from flask import abort
 from flask import Blueprint
+from flask import current_app
+from flask import request
 from flask import url_for as flask_url_for
+from werkzeug.exceptions import MethodNotAllowed
+from werkzeug.routing import BuildError
+from werkzeug.urls import url_quote
 
+from .helpers import api_index
 from .helpers import collection_name
+from .helpers import declarative_models
 from .helpers import model_for
 from .helpers import primary_key_for
 from .helpers import serializer_for
 from .helpers import url_for
+from .json_backends import find_json_backend
+from .search.operators import VALUE_LIST_MIN_LENGTH
 from .serialization import DefaultSerializer
 from .serialization import DefaultDeserializer
+from .serialization import RowSerializer
 from .views import API
+from .views import COUNT_POLICIES
+from .views import CountCache
 from .views import FunctionAPI
 from .views import RelationshipAPI
 
@@ -47,6 +67,32 @@ ALL_METHODS = READONLY_METHODS | WRITEONLY_METHODS
 #: The default URL prefix for APIs created by instance of :class:`APIManager`.
 DEFAULT_URL_PREFIX = '/api'
 
+#: The names of the keyword arguments to :meth:`APIManager.url_for`
+#: whose values can be filled into a cached URL template.
+URL_TEMPLATE_ARGUMENTS = frozenset(('resource_id', 'relation_name',
+                                    'related_resource_id'))
+
+#: The name of the view that dispatches requests to the APIs created by
+#: an :class:`APIManager` with shared routes.
+#:
+#: The views for relationships and function evaluation are named by
+#: appending ``'.relationships'`` and ``'.eval'``, respectively, as for
+#: the view of an API with routes of its own.
+DISPATCHER_NAME = 'dispatch'
+
+#: The string that stands in for the value of a URL argument when
+#: building a URL template.
+#:
+#: This must consist only of characters that are not escaped in URLs.
+URL_PLACEHOLDER = 'FLASKRESTLESS{0}PLACEHOLDER'
+
+#: The maximum number of URL templates cached by each
+#: :class:`APIManager`.
+#:
+#: A template is computed for each URL root at which a request arrives,
+#: so when this many templates have been cached, the cache is emptied.
+MAX_CACHED_URL_TEMPLATES = 1024
+
 if sys.version_info < (3, ):
     STRING_TYPES = (str, unicode)
 else:
@@ -72,9 +118,25 @@ else:
 #: - `serializer`, the subclass of :class:`Serializer` provided for the
 #:   model exposed by this API.
 #: - `primary_key`, the primary key used by the model
+#: - `shared_routes`, whether requests to this API are routed by the
+#:   URL rules shared by all APIs with the same URL prefix (see
+#:   :class:`APIDispatcher`).
 #:
 APIInfo = namedtuple('APIInfo', ['collection_name', 'blueprint_name',
-                                 'serializer', 'primary_key'])
+                                 'serializer', 'primary_key',
+                                 'shared_routes'])
+
+
+def quote_url_value(value):
+    """Returns the given value of a URL argument quoted as Werkzeug
+    would quote it when building a URL.
+
+    """
+    # Integers are by far the most common primary keys, and never need
+    # to be quoted.
+    if isinstance(value, int):
+        return str(value)
+    return url_quote(value)
 
 
 class IllegalArgumentError(Exception):
@@ -85,6 +147,153 @@ class IllegalArgumentError(Exception):
     pass
 
 
+class LazyAPI(object):
+    """Creates the view functions of an API when they are first needed.
+
+    `create_views` is a function that returns a tuple containing the
+    view functions of the API; it is called at most once, by
+    :meth:`create`.
+
+    """
+
+    def __init__(self, create_views):
+        self._create_views = create_views
+        self._lock = Lock()
+
+        #: The tuple of view functions returned by the function given in
+        #: the constructor, or ``None`` if it has not been called yet.
+        self.views = None
+
+    def create(self):
+        """Creates the view functions of the API, if they have not been
+        created yet, and returns them.
+
+        """
+        if self.views is None:
+            with self._lock:
+                if self.views is None:
+                    self.views = self._create_views()
+        return self.views
+
+    def view(self, index, name):
+        """Returns a view function with the given name that calls the
+        view function at the specified index in the tuple returned by
+        :meth:`create`.
+
+        """
+        def view(*args, **kw):
+            return self.create()[index](*args, **kw)
+
+        view.__name__ = name
+        return view
+
+
+class APIDispatcher(object):
+    """Routes requests to the APIs for many models through a single set
+    of URL rules.
+
+    The URL rules of the blueprint created by this class, accessible at
+    :attr:`blueprint`, have the collection name as an argument, for
+    example ``/<collection_name>/<resource_id>``. Each request is
+    dispatched to the view of the API registered for the requested
+    collection name with :meth:`add`, so the number of URL rules does
+    not grow with the number of APIs, and APIs added after the blueprint
+    has been registered on a Flask application are immediately
+    available.
+
+    `name` is the name of the blueprint and `url_prefix` is the URL
+    prefix at which it is registered.
+
+    """
+
+    def __init__(self, name, url_prefix):
+
+        #: A mapping from the collection name and the kind of view
+        #: (``'api'``, ``'relationships'``, or ``'eval'``) to a pair
+        #: containing the view function for that collection and the
+        #: set of HTTP methods it allows.
+        self.views = {}
+
+        #: The blueprint containing the URL rules shared by the APIs.
+        self.blueprint = Blueprint(name, __name__, url_prefix=url_prefix)
+
+        add_rule = self.blueprint.add_url_rule
+        api_view = self._dispatcher('api', DISPATCHER_NAME)
+        relationship_name = '{0}.relationships'.format(DISPATCHER_NAME)
+        relationship_view = self._dispatcher('relationships',
+                                             relationship_name)
+        eval_name = '{0}.eval'.format(DISPATCHER_NAME)
+        eval_view = self._dispatcher('eval', eval_name)
+
+        # These are the same URL rules as those created for a single
+        # API in :meth:`APIManager.create_api_blueprint`; see the
+        # comments there.
+        collection_url = '/<collection_name>'
+        resource_url = '{0}/<resource_id>'.format(collection_url)
+        related_resource_url = '{0}/<relation_name>'.format(resource_url)
+        to_many_resource_url = \
+            '{0}/<related_resource_id>'.format(related_resource_url)
+        relationship_url = \
+            '{0}/relationships/<relation_name>'.format(resource_url)
+        add_rule(relationship_url, methods=ALL_METHODS,
+                 view_func=relationship_view)
+        add_rule(collection_url, view_func=api_view, methods=['POST'])
+        collection_defaults = dict(resource_id=None, relation_name=None,
+                                   related_resource_id=None)
+        add_rule(collection_url, view_func=api_view, methods=['GET'],
+                 defaults=collection_defaults)
+        add_rule(resource_url, view_func=api_view,
+                 methods=['DELETE', 'PATCH'])
+        resource_defaults = dict(relation_name=None, related_resource_id=None)
+        add_rule(resource_url, view_func=api_view, methods=['GET'],
+                 defaults=resource_defaults)
+        related_resource_defaults = dict(related_resource_id=None)
+        add_rule(related_resource_url, view_func=api_view, methods=['GET'],
+                 defaults=related_resource_defaults)
+        add_rule(to_many_resource_url, view_func=api_view, methods=['GET'])
+        # This rule takes precedence over the resource URL rule, so no
+        # collection may be named ``'eval'``.
+        add_rule('/eval{0}'.format(collection_url), view_func=eval_view,
+                 methods=['GET'])
+
+    def _dispatcher(self, kind, name):
+        """Returns the view function that dispatches requests for the
+        specified kind of view to the view for the requested collection.
+
+        `name` is the name of the returned function.
+
+        If no API has been added for the requested collection name, the
+        view function responds with :http:statuscode:`404`. If the API
+        does not allow the HTTP method of the request, it responds with
+        :http:statuscode:`405`.
+
+        """
+        def dispatch(collection_name, **kw):
+            try:
+                view, methods = self.views[collection_name, kind]
+            except KeyError:
+                abort(404)
+            method = request.method
+            # Flask allows :http:method:`head` wherever it allows
+            # :http:method:`get`.
+            if method == 'HEAD':
+                method = 'GET'
+            if method not in methods:
+                raise MethodNotAllowed(valid_methods=sorted(methods))
+            return view(**kw)
+
+        dispatch.__name__ = name
+        return dispatch
+
+    def add(self, collection_name, kind, view, methods):
+        """Dispatches requests for the specified kind of view of the
+        collection with the given name to `view`, a view function, if
+        the HTTP method of the request is one of `methods`.
+
+        """
+        self.views[collection_name, kind] = (view, frozenset(methods))
+
+
 class APIManager(object):
     """Provides a method for creating a public ReSTful JSON API with respect
     to a given :class:`~flask.Flask` application object.
@@ -147,6 +356,23 @@ class APIManager(object):
     information on using preprocessors and postprocessors, see
     :doc:`processors`.
 
+    `json_backend` specifies the library used to decode request bodies
+    and encode responses for APIs created by this instance. It may be
+    the name of a JSON backend (``'flask'``, ``'orjson'``, or
+    ``'ujson'``), a list of such names in order of preference, or a
+    :class:`JSONBackend` object. The first
+    named backend whose library is installed is used; if none is, or if
+    this is ``None``, the JSON functions provided by Flask are used. For
+    more information, see :ref:`jsonbackends`.
+
+    If `shared_routes` is ``True``, the APIs created by this instance
+    with the same URL prefix share a single set of URL rules, which
+    dispatch each request to the API for the requested collection,
+    instead of each API adding URL rules of its own. This keeps routing
+    fast and the startup of the application short when there are many
+    APIs. This is ``False`` by default. For more information, see
+    :ref:`sharedroutes`.
+
     """
 
     #: The format of the name of the API view for a given model.
@@ -156,7 +382,8 @@ class APIManager(object):
     APINAME_FORMAT = '{0}api'
 
     def __init__(self, app=None, session=None, flask_sqlalchemy_db=None,
-                 preprocessors=None, postprocessors=None, url_prefix=None):
+                 preprocessors=None, postprocessors=None, url_prefix=None,
+                 json_backend=None, shared_routes=False):
         if session is None and flask_sqlalchemy_db is None:
             msg = 'must specify either `flask_sqlalchemy_db` or `session`'
             raise ValueError(msg)
@@ -180,10 +407,33 @@ class APIManager(object):
         #: those models.
         self.created_apis_for = {}
 
+        #: A mapping from collection name to the model for which this
+        #: object has created an API with that collection name; the
+        #: inverse of :attr:`created_apis_for`.
+        self.models_by_collection_name = {}
+
         #: List of blueprints created by :meth:`create_api` to be registered
         #: to the app when calling :meth:`init_app`.
         self.blueprints = []
 
+        #: Whether the APIs created by this manager share URL rules.
+        self.shared_routes = shared_routes
+
+        #: A mapping from URL prefix to the :class:`APIDispatcher` that
+        #: routes requests to the APIs created by this manager with that
+        #: prefix, if :attr:`shared_routes` is ``True``.
+        self.dispatchers = {}
+
+        #: List of the :class:`LazyAPI` objects of the APIs created by
+        #: this manager with ``lazy=True``, whose views are created by
+        #: :meth:`warmup`.
+        self.lazy_apis = []
+
+        #: A mapping from the Flask application, URL root, endpoint,
+        #: URL arguments, and HTTP method of a URL to a template for that
+        #: URL, as computed by :meth:`_url_template`.
+        self._url_templates = {}
+
         # If a Flask-SQLAlchemy object is provided, prefer the session
         # from that object.
         if flask_sqlalchemy_db is not None:
@@ -202,6 +452,10 @@ class APIManager(object):
         #: :meth:`create_api` method.
         self.url_prefix = url_prefix
 
+        #: The JSON encoder and decoder used by APIs created by this
+        #: manager.
+        self.json_backend = find_json_backend(json_backend)
+
         # if self.app is not None:
         #     self.init_app(self.app)
 
@@ -237,19 +491,14 @@ class APIManager(object):
             <class 'mymodels.Person'>
 
         """
-        # Reverse the dictionary.
-        #
-        # TODO In Python 3 this should be a dict comprehension.
-        models = dict((info.collection_name, model)
-                      for model, info in self.created_apis_for.items())
         try:
-            return models[collection_name]
+            return self.models_by_collection_name[collection_name]
         except KeyError:
             raise ValueError('Collection name {0} unknown. Be sure to set the'
                              ' `collection_name` keyword argument when calling'
                              ' `create_api()`.'.format(collection_name))
 
-    def url_for(self, model, **kw):
+    def url_for(self, model, _absolute_url=False, **kw):
         """Returns the URL for the specified model, similar to
         :func:`flask.url_for`.
 
@@ -260,25 +509,121 @@ class APIManager(object):
         This method only returns URLs for endpoints created by this
         :class:`APIManager`.
 
+        If `_absolute_url` is ``True``, the returned URL is joined to the
+        URL root of the current request. This requires a `Flask request
+        context`_.
+
         The remaining keyword arguments are passed directly on to
-        :func:`flask.url_for`.
+        :func:`flask.url_for`. As with that function, this method raises
+        :exc:`~werkzeug.routing.BuildError` if there is no endpoint that
+        matches the arguments.
+
+        URLs for resources, relationships, and related resources are
+        built from templates computed the first time such a URL is
+        requested, so building one of these URLs requires only string
+        formatting.
 
         .. _Flask request context: http://flask.pocoo.org/docs/0.10/reqcontext/
 
         """
-        collection_name = self.created_apis_for[model].collection_name
-        blueprint_name = self.created_apis_for[model].blueprint_name
-        api_name = APIManager.api_name(collection_name)
-        parts = [blueprint_name, api_name]
+        info = self.created_apis_for[model]
+        if info.shared_routes:
+            api_name = DISPATCHER_NAME
+            # The collection name is an argument of the shared URL rules.
+            kw['collection_name'] = info.collection_name
+        else:
+            api_name = APIManager.api_name(info.collection_name)
+        parts = [info.blueprint_name, api_name]
         # If we are looking for a relationship URL, the view name ends with
         # '.relationships'.
         if 'relationship' in kw and kw.pop('relationship'):
             parts.append('relationships')
-        url = flask_url_for('.'.join(parts), **kw)
-        # if _absolute_url:
-        #     url = urljoin(request.url_root, url)
+        endpoint = '.'.join(parts)
+        method = kw.pop('_method', None)
+        # Flask ignores arguments whose value is `None`.
+        #
+        # TODO In Python 2.7 and later, this should be a dict comprehension.
+        values = dict((k, v) for k, v in kw.items() if v is not None)
+        arguments = set(values)
+        if info.shared_routes:
+            arguments.discard('collection_name')
+        # A template can be used only if all of the arguments are
+        # placeholders in the routes created by this class, and only if
+        # the Flask application does not modify URLs being built.
+        ctx = _request_ctx_stack.top
+        if ctx is not None:
+            app, url_root = ctx.app, ctx.request.url_root
+        else:
+            app, url_root = current_app._get_current_object(), None
+        if (arguments <= URL_TEMPLATE_ARGUMENTS and
+                not app.url_default_functions and
+                not app.url_build_error_handlers):
+            template = self._url_template(app, url_root, endpoint,
+                                          frozenset(values), method,
+                                          _absolute_url)
+            if template is None:
+                raise BuildError(endpoint, values, method)
+            # TODO In Python 2.7 and later, this should be a dict
+            # comprehension.
+            return template % dict((k, quote_url_value(v))
+                                   for k, v in values.items())
+        url = flask_url_for(endpoint, _method=method, **kw)
+        if _absolute_url:
+            url = urljoin(request.url_root, url)
         return url
 
+    def _url_template(self, app, url_root, endpoint, arguments, method,
+                      absolute):
+        """Returns a template for the URL of the specified endpoint, or
+        ``None`` if the endpoint does not accept the specified HTTP
+        method.
+
+        `arguments` is a set of names of URL arguments. The returned
+        template is a string that contains a ``%(name)s`` placeholder
+        for each of these arguments, suitable for use with the ``%``
+        operator.
+
+        If `absolute` is ``True``, the template is for an absolute URL
+        with the URL root of the current request.
+
+        Templates are built once by :func:`flask.url_for` and cached
+        for each Flask application `app` and URL root `url_root` (which
+        is ``None`` outside of a request context), since the prefix of
+        a blueprint and the script root can only be known at that time.
+
+        This method raises :exc:`~werkzeug.routing.BuildError` if the
+        URL cannot be built at all.
+
+        """
+        key = (app, url_root, endpoint, arguments, method, absolute)
+        try:
+            return self._url_templates[key]
+        except KeyError:
+            pass
+        # TODO In Python 2.7 and later, this should be a dict comprehension.
+        placeholders = dict((name, URL_PLACEHOLDER.format(name.upper()))
+                            for name in arguments)
+        try:
+            url = flask_url_for(endpoint, _method=method, **placeholders)
+        except BuildError:
+            # If the endpoint is not known to the application (for
+            # example, because the blueprint has not been registered
+            # yet), it may become known later, so don't cache this.
+            if endpoint not in app.view_functions:
+                raise
+            template = None
+        else:
+            if absolute:
+                url = urljoin(url_root, url)
+            template = url.replace('%', '%%')
+            for name, placeholder in placeholders.items():
+                template = template.replace(placeholder,
+                                            '%({0})s'.format(name))
+        if len(self._url_templates) >= MAX_CACHED_URL_TEMPLATES:
+            self._url_templates.clear()
+        self._url_templates[key] = template
+        return template
+
     def collection_name(self, model):
         """Returns the collection name for the specified model, as specified by
         the ``collection_name`` keyword argument to
@@ -394,7 +739,11 @@ class APIManager(object):
                              serializer_class=None, deserializer_class=None,
                              includes=None, allow_to_many_replacement=False,
                              allow_delete_from_to_many_relationships=False,
-                             allow_client_generated_ids=False):
+                             allow_client_generated_ids=False,
+                             streaming=False, row_mode=False,
+                             window_count=False, count_policy='exact',
+                             count_ttl=60, lazy=False,
+                             value_list_min_length=VALUE_LIST_MIN_LENGTH):
         """Creates and returns a ReSTful API interface as a blueprint, but does
         not register it on any :class:`flask.Flask` application.
 
@@ -419,7 +768,12 @@ class APIManager(object):
         :meth:`create_api_blueprint` instead, which handles registration
         automatically.
 
-        `name` is the name of the blueprint that will be created.
+        `name` is the name of the blueprint that will be created. If this
+        manager was created with ``shared_routes=True``, the returned
+        blueprint is the one shared by all of the APIs created by this
+        manager with the same URL prefix, and it is created (with this
+        name) only for the first of them; for more information, see
+        :ref:`sharedroutes`.
 
         `model` is the SQLAlchemy model class for which a ReSTful interface
         will be created.
@@ -589,6 +943,46 @@ class APIManager(object):
         this be a UUID. This is ``False`` by default. For more information, see
         :doc:`creating`.
 
+        If `streaming` is ``True``, responses to requests for a collection
+        of resources are streamed to the client as the resources are loaded
+        from the database and serialized, instead of being built in memory
+        in their entirety first. This is ``False`` by default. For more
+        information, see :ref:`streaming`.
+
+        If `row_mode` is ``True``, the primary data in responses to requests
+        for a collection of resources is serialized directly from the rows
+        of the query, without constructing an instance of the model for each
+        resource, using :class:`RowSerializer`. `serializer_class`, if
+        specified, must then be a subclass of :class:`RowSerializer`;
+        otherwise, this method raises :exc:`IllegalArgumentError`. This is
+        ``False`` by default. For more information, see :ref:`rowmode`.
+
+        If `window_count` is ``True``, the total number of resources in a
+        paginated collection is computed in the same database query as the
+        requested page, using a window function, instead of in a separate
+        query. The database must support window functions. This is
+        ``False`` by default. For more information, see :ref:`windowcount`.
+
+        `count_policy` determines how the total number of resources in a
+        collection is computed. It must be one of ``'exact'`` (the
+        default), ``'cached'``, ``'estimated'``, or ``'none'``; otherwise,
+        this method raises :exc:`IllegalArgumentError`. If it is
+        ``'cached'``, `count_ttl` is the number of seconds for which a count
+        is cached. For more information, see :ref:`counting`.
+
+        `value_list_min_length` is the smallest number of values given to
+        the ``in`` or ``not_in`` operator in a filter that are bound to a
+        single parameter, instead of to one parameter each, on databases
+        that support it. This is 500 by default. For more information,
+        see :ref:`valuelists`.
+
+        If `lazy` is ``True``, the URL rules of the API are created, but
+        the views that handle its requests, along with the metadata of
+        the model and the pre- and postprocessors they use, are only
+        created when the API receives its first request (or when
+        :meth:`warmup` is called). This is ``False`` by default. For
+        more information, see :ref:`lazyapis`.
+
         """
         # Perform some sanity checks on the provided keyword arguments.
         if only is not None and exclude is not None:
@@ -600,22 +994,16 @@ class APIManager(object):
         if collection_name == '':
             msg = 'Collection name must be nonempty'
             raise IllegalArgumentError(msg)
+        if count_policy not in COUNT_POLICIES:
+            msg = 'Count policy must be one of {0}'
+            msg = msg.format(', '.join(sorted(COUNT_POLICIES)))
+            raise IllegalArgumentError(msg)
         if collection_name is None:
             collection_name = model.__table__.name
         # convert all method names to upper case
         methods = frozenset((m.upper() for m in methods))
         # the name of the API, for use in creating the view and the blueprint
         apiname = APIManager.api_name(collection_name)
-        # Prepend the universal preprocessors and postprocessors specified in
-        # the constructor of this class.
-        preprocessors_ = defaultdict(list)
-        postprocessors_ = defaultdict(list)
-        preprocessors_.update(preprocessors or {})
-        postprocessors_.update(postprocessors or {})
-        for key, value in self.pre.items():
-            preprocessors_[key] = value + preprocessors_[key]
-        for key, value in self.post.items():
-            postprocessors_[key] = value + postprocessors_[key]
         # Validate that all the additional attributes exist on the model.
         if additional_attributes is not None:
             for attr in additional_attributes:
@@ -629,38 +1017,125 @@ class APIManager(object):
             raise IllegalArgumentError(msg)
         # Create a default serializer and deserializer if none have been
         # provided.
+        if row_mode and serializer_class is not None and \
+                not issubclass(serializer_class, RowSerializer):
+            msg = ('Cannot use row mode with a serializer class that is not'
+                   ' a subclass of RowSerializer')
+            raise IllegalArgumentError(msg)
         if serializer_class is None:
-            serializer_class = DefaultSerializer
+            if row_mode:
+                serializer_class = RowSerializer
+            else:
+                serializer_class = DefaultSerializer
         if deserializer_class is None:
             deserializer_class = DefaultDeserializer
-        # Instantiate the serializer and deserializer.
+        # Instantiate the serializer. This is cheap, since serialization
+        # plans are compiled on first use, and it is needed by other
+        # APIs (through :func:`serializer_for`) even if this API is lazy.
         attrs = additional_attributes
         serializer = serializer_class(only=only, exclude=exclude,
                                       additional_attributes=attrs)
-        acgi = allow_client_generated_ids
-        deserializer = deserializer_class(self.session, model,
-                                          allow_client_generated_ids=acgi)
-        # Create the view function for the API for this model.
-        #
-        # Rename some variables with long names for the sake of brevity.
-        atmr = allow_to_many_replacement
-        api_view = API.as_view(apiname, self.session, model,
-                               preprocessors=preprocessors_,
-                               postprocessors=postprocessors_,
-                               primary_key=primary_key,
-                               validation_exceptions=validation_exceptions,
-                               allow_to_many_replacement=atmr,
-                               page_size=page_size,
-                               max_page_size=max_page_size,
-                               serializer=serializer,
-                               deserializer=deserializer,
-                               includes=includes)
+        # When PATCH is allowed, certain non-PATCH requests are allowed
+        # on relationship URLs.
+        relationship_methods = READONLY_METHODS & methods
+        if 'PATCH' in methods:
+            relationship_methods |= WRITEONLY_METHODS
+        # The names of the views of the API.
+        relationship_api_name = '{0}.relationships'.format(apiname)
+        eval_api_name = '{0}.eval'.format(apiname)
+
+        def create_views():
+            """Returns the view functions of the API, of its
+            relationships, and for function evaluation (or ``None`` if
+            function evaluation is not allowed).
+
+            """
+            # Prepend the universal preprocessors and postprocessors
+            # specified in the constructor of this class.
+            preprocessors_ = defaultdict(list)
+            postprocessors_ = defaultdict(list)
+            preprocessors_.update(preprocessors or {})
+            postprocessors_.update(postprocessors or {})
+            for key, value in self.pre.items():
+                preprocessors_[key] = value + preprocessors_[key]
+            for key, value in self.post.items():
+                postprocessors_[key] = value + postprocessors_[key]
+            # Counts are cached by the API and relationship views
+            # together.
+            count_cache = None
+            if count_policy == 'cached':
+                count_cache = CountCache(ttl=count_ttl)
+            # Instantiate the deserializer.
+            acgi = allow_client_generated_ids
+            deserializer = deserializer_class(self.session, model,
+                                              allow_client_generated_ids=acgi)
+            # Create the view function for the API for this model.
+            #
+            # Rename some variables with long names for the sake of brevity.
+            atmr = allow_to_many_replacement
+            vexc = validation_exceptions
+            vlml = value_list_min_length
+            api_view = API.as_view(apiname, self.session, model,
+                                   preprocessors=preprocessors_,
+                                   postprocessors=postprocessors_,
+                                   primary_key=primary_key,
+                                   validation_exceptions=vexc,
+                                   allow_to_many_replacement=atmr,
+                                   page_size=page_size,
+                                   max_page_size=max_page_size,
+                                   serializer=serializer,
+                                   deserializer=deserializer,
+                                   includes=includes, streaming=streaming,
+                                   json_backend=self.json_backend,
+                                   window_count=window_count,
+                                   count_policy=count_policy,
+                                   count_cache=count_cache,
+                                   value_list_min_length=vlml)
+
+            # Create the view function for the relationships of this model.
+            rapi_view = RelationshipAPI.as_view
+            adftmr = allow_delete_from_to_many_relationships
+            relationship_api_view = \
+                rapi_view(relationship_api_name, self.session, model,
+                          # Keyword arguments for APIBase.__init__()
+                          preprocessors=preprocessors_,
+                          postprocessors=postprocessors_,
+                          primary_key=primary_key,
+                          validation_exceptions=vexc,
+                          allow_to_many_replacement=atmr,
+                          streaming=streaming,
+                          json_backend=self.json_backend,
+                          window_count=window_count,
+                          count_policy=count_policy,
+                          count_cache=count_cache,
+                          value_list_min_length=vlml,
+                          # Keyword arguments RelationshipAPI.__init__()
+                          allow_delete_from_to_many_relationships=adftmr)
+
+            # if function evaluation is allowed, create a view for an
+            # endpoint at /api/eval/... which responds only to GET
+            # requests and responds with the result of evaluating
+            # functions on all instances of the specified model
+            eval_api_view = None
+            if allow_functions:
+                eval_api_view = FunctionAPI.as_view(eval_api_name,
+                                                    self.session, model)
+            return api_view, relationship_api_view, eval_api_view
+
+        if lazy:
+            # The views, and the metadata and processors they use, are
+            # created by the first request to the API, or by
+            # :meth:`warmup`.
+            lazy_api = LazyAPI(create_views)
+            self.lazy_apis.append(lazy_api)
+            api_view = lazy_api.view(0, apiname)
+            relationship_api_view = lazy_api.view(1, relationship_api_name)
+            eval_api_view = None
+            if allow_functions:
+                eval_api_view = lazy_api.view(2, eval_api_name)
+        else:
+            api_view, relationship_api_view, eval_api_view = create_views()
 
-        # add the URL rules to the blueprint: the first is for methods on the
-        # collection only, the second is for methods which may or may not
-        # specify an instance, the third is for methods which must specify an
-        # instance
-        # TODO what should the second argument here be?
         # TODO should the url_prefix be specified here or in register_blueprint
         if url_prefix is not None:
             prefix = url_prefix
@@ -668,6 +1143,56 @@ class APIManager(object):
             prefix = self.url_prefix
         else:
             prefix = DEFAULT_URL_PREFIX
+
+        if self.shared_routes:
+            # The URL rules for the APIs with this prefix are created
+            # once, by the dispatcher; requests are dispatched to the
+            # views of this API by collection name.
+            if prefix not in self.dispatchers:
+                self.dispatchers[prefix] = APIDispatcher(name, prefix)
+            dispatcher = self.dispatchers[prefix]
+            dispatcher.add(collection_name, 'api', api_view, methods)
+            dispatcher.add(collection_name, 'relationships',
+                           relationship_api_view, relationship_methods)
+            if eval_api_view is not None:
+                dispatcher.add(collection_name, 'eval', eval_api_view,
+                               ['GET'])
+            blueprint = dispatcher.blueprint
+        else:
+            blueprint = self._create_blueprint(name, prefix, collection_name,
+                                               methods, api_view,
+                                               relationship_api_view,
+                                               relationship_methods,
+                                               eval_api_view)
+
+        # Finally, record that this APIManager instance has created an API for
+        # the specified model.
+        self.created_apis_for[model] = APIInfo(collection_name, blueprint.name,
+                                               serializer, primary_key,
+                                               self.shared_routes)
+        self.models_by_collection_name[collection_name] = model
+        api_index.add(self, model, collection_name)
+        return blueprint
+
+    def _create_blueprint(self, name, prefix, collection_name, methods,
+                          api_view, relationship_api_view,
+                          relationship_methods, eval_api_view):
+        """Returns a new blueprint with the given name and URL prefix
+        containing the URL rules for the API for a single collection.
+
+        `methods` is the set of HTTP methods allowed by the API, and
+        `relationship_methods` the set of HTTP methods allowed on its
+        relationship URLs. `api_view` and `relationship_api_view` are
+        the view functions of the API and its relationships. If
+        `eval_api_view` is not ``None``, it is the view function for
+        function evaluation.
+
+        """
+        # add the URL rules to the blueprint: the first is for methods on the
+        # collection only, the second is for methods which may or may not
+        # specify an instance, the third is for methods which must specify an
+        # instance
+        # TODO what should the second argument here be?
         blueprint = Blueprint(name, __name__, url_prefix=prefix)
         add_rule = blueprint.add_url_rule
 
@@ -688,24 +1213,6 @@ class APIManager(object):
         # :http:get:`/api/articles/1/relationships/author` interpret the
         # word `relationships` as the name of a relation of an article
         # object.
-        relationship_api_name = '{0}.relationships'.format(apiname)
-        rapi_view = RelationshipAPI.as_view
-        adftmr = allow_delete_from_to_many_relationships
-        relationship_api_view = \
-            rapi_view(relationship_api_name, self.session, model,
-                      # Keyword arguments for APIBase.__init__()
-                      preprocessors=preprocessors_,
-                      postprocessors=postprocessors_,
-                      primary_key=primary_key,
-                      validation_exceptions=validation_exceptions,
-                      allow_to_many_replacement=allow_to_many_replacement,
-                      # Keyword arguments RelationshipAPI.__init__()
-                      allow_delete_from_to_many_relationships=adftmr)
-        # When PATCH is allowed, certain non-PATCH requests are allowed
-        # on relationship URLs.
-        relationship_methods = READONLY_METHODS & methods
-        if 'PATCH' in methods:
-            relationship_methods |= WRITEONLY_METHODS
         add_rule(relationship_url, methods=relationship_methods,
                  view_func=relationship_api_view)
 
@@ -751,22 +1258,12 @@ class APIManager(object):
         add_rule(to_many_resource_url, view_func=api_view,
                  methods=to_many_resource_methods)
 
-        # if function evaluation is allowed, add an endpoint at /api/eval/...
-        # which responds only to GET requests and responds with the result of
-        # evaluating functions on all instances of the specified model
-        if allow_functions:
-            eval_api_name = '{0}.eval'.format(apiname)
-            eval_api_view = FunctionAPI.as_view(eval_api_name, self.session,
-                                                model)
+        # The endpoint at /api/eval/..., if function evaluation is allowed.
+        if eval_api_view is not None:
             eval_endpoint = '/eval{0}'.format(collection_url)
             eval_methods = ['GET']
             blueprint.add_url_rule(eval_endpoint, methods=eval_methods,
                                    view_func=eval_api_view)
-
-        # Finally, record that this APIManager instance has created an API for
-        # the specified model.
-        self.created_apis_for[model] = APIInfo(collection_name, blueprint.name,
-                                               serializer, primary_key)
         return blueprint
 
     def create_api(self, *args, **kw):
@@ -824,6 +1321,11 @@ class APIManager(object):
         """
         blueprint_name = str(uuid1())
         blueprint = self.create_api_blueprint(blueprint_name, *args, **kw)
+        # With shared routes, the blueprint may be that of an earlier API
+        # with the same URL prefix, which has already been stored and
+        # registered.
+        if blueprint in self.blueprints:
+            return
         # Store the created blueprint
         self.blueprints.append(blueprint)
         # If a Flask application was provided in the constructor of this
@@ -831,3 +1333,43 @@ class APIManager(object):
         # application.
         if self.app is not None:
             self.app.register_blueprint(blueprint)
+
+    def create_apis(self, base, **kw):
+        """Creates and possibly registers a ReSTful API for each model
+        derived from the given declarative base class.
+
+        `base` is a declarative base class, for example the one returned
+        by :func:`sqlalchemy.ext.declarative.declarative_base` or the
+        ``Model`` attribute of a Flask-SQLAlchemy object. Models that
+        use single table inheritance, and models without an ``id``
+        attribute, are skipped, since their APIs cannot be created with
+        the default collection name and primary key.
+
+        The keyword arguments are passed to :meth:`create_api` for each
+        model, except that `lazy` is ``True`` by default, so that only
+        the URL rules of each API are created now; the rest of each API
+        is created when it receives its first request, or when
+        :meth:`warmup` is called. For example::
+
+            manager = APIManager(app, session=session, shared_routes=True)
+            manager.create_apis(Base, methods=['GET', 'POST'])
+
+        For more information, see :ref:`lazyapis`.
+
+        """
+        kw.setdefault('lazy', True)
+        for model in declarative_models(base):
+            if hasattr(model, 'id'):
+                self.create_api(model, **kw)
+
+    def warmup(self):
+        """Creates the views of all of the APIs created by this manager
+        with ``lazy=True`` that have not received a request yet.
+
+        This is useful with servers that fork worker processes after
+        loading the application, so that each worker does not have to
+        create the views of each API on its own.
+
+        """
+        for lazy_api in self.lazy_apis:
+            lazy_api.create()
@@ -17,15 +17,25 @@ given set of filters, sorting rules, etc. The
 relationship on a particular instance of a SQLAlchemy model.
 
 The :func:`create_filters` function is a finer-grained tool: it allows
-you to create the SQLAlchemy expressions without executing them.
+you to create the SQLAlchemy expressions without executing them. The
+:func:`compile_filters` function does the same, caching the expressions
+for filters that differ only in their values.
 
 The :exc:`FilterParsingError` and :exc:`FilterCreationError` exceptions
 are the exceptions that may be raised by the func:`search` and
 :func:`create_filters` functions.
 
 """
+from .filters import filter_cache
+from .filters import filter_schema
+from .filters import filter_schemas
 from .filters import FilterCreationError
 from .filters import FilterParsingError
+from .drivers import count_query
+from .drivers import count_relationship_query
+from .drivers import compile_filters
 from .drivers import create_filters
+from .drivers import keyset_keys
 from .drivers import search
 from .drivers import search_relationship
+from .drivers import seek
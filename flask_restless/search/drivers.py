@@ -16,8 +16,27 @@ filtered queries on a SQLAlchemy model. The latter specifically
 restricts the query to only those instances of a model that are related
 to a particular object via a given to-many relationship.
 
+The :func:`eager_loading_options` function plans how to load the related
+resources that will be included in a compound document, so that they
+can be loaded along with the primary resources. The
+:func:`column_loading_options` function plans which columns of the
+primary resources to load.
+
+The :func:`count_query` and :func:`count_relationship_query` functions
+return queries that yield as many rows as the corresponding search
+queries, but that are cheaper to count.
+
 """
+from functools import partial
+
+from sqlalchemy.exc import UnboundExecutionError
+from sqlalchemy.ext.associationproxy import AssociationProxy
+from sqlalchemy.inspection import inspect as sqlalchemy_inspect
 from sqlalchemy.orm import aliased
+from sqlalchemy.orm import Load
+from sqlalchemy.orm.interfaces import MANYTOONE
+from sqlalchemy.sql import and_
+from sqlalchemy.sql import or_
 from sqlalchemy.sql import false as FALSE
 
 from ..helpers import get_model
@@ -25,28 +44,286 @@ from ..helpers import get_related_model
 from ..helpers import primary_key_names
 from ..helpers import primary_key_value
 from ..helpers import session_query
+from .filters import compile_filters
 from .filters import create_filters
+from .filters import filter_schema
+from .operators import value_list_dialect
+from .operators import VALUE_LIST_MIN_LENGTH
 
+#: The name of the loader strategy used to eagerly load to-many
+#: relationships.
+#:
+#: The "select IN" strategy issues one additional query per relationship
+#: hop that does not repeat the primary query, but it is only available
+#: in SQLAlchemy 1.2 or later. On earlier versions, we fall back to the
+#: "subquery" strategy, which also issues one query per hop.
+if hasattr(Load, 'selectinload'):
+    TO_MANY_LOADER = 'selectinload'
+else:
+    TO_MANY_LOADER = 'subqueryload'
 
-def search_relationship(session, instance, relation, filters=None, sort=None,
-                        group_by=None):
-    """Returns a filtered, sorted, and grouped SQLAlchemy query
-    restricted to those objects related to a given instance.
+#: The name of the loader strategy used to eagerly load to-one
+#: relationships.
+#:
+#: A to-one relationship does not change the number of rows in the
+#: result, so it can be loaded with a join in the primary query.
+TO_ONE_LOADER = 'joinedload'
 
-    `session` is the SQLAlchemy session in which to create the query.
 
-    `instance` is an instance of a SQLAlchemy model whose relationship
-    will be queried.
+def _relationship_hops(model, relation_name):
+    """Returns a list of the relationship attributes that must be
+    traversed to follow the relation named `relation_name` from
+    `model`.
 
-`   `relation` is a string naming a to-many relationship of `instance`.
+    For a plain relationship, this is a list containing only that
+    relationship attribute. For an association proxy, this is a list
+    containing the local relationship attribute followed by the remote
+    relationship attribute.
+
+    If `relation_name` does not name a relationship that can be loaded
+    eagerly (for example, if it names a column, or if it names a
+    dynamic relationship), this function returns an empty list.
+
+    """
+    mapper = sqlalchemy_inspect(model)
+    descriptors = mapper.all_orm_descriptors
+    if relation_name not in descriptors:
+        return []
+    descriptor = descriptors[relation_name]
+    if isinstance(descriptor, AssociationProxy):
+        # HACK This is required for Python 3.3 only, as in
+        # `get_related_model()`.
+        hasattr(model, relation_name)
+        attributes = [descriptor.local_attr, descriptor.remote_attr]
+    else:
+        attributes = [getattr(model, relation_name)]
+    for attribute in attributes:
+        prop = getattr(attribute, 'property', None)
+        if not hasattr(prop, 'uselist') or prop.lazy == 'dynamic':
+            return []
+    return attributes
+
+
+def eager_loading_options(model, paths):
+    """Returns a list of SQLAlchemy loader options that eagerly load
+    the relationships along each of the given relationship paths.
+
+    `model` is the SQLAlchemy model of the primary resources.
+
+    `paths` is an iterable of dot-separated relationship paths, as in
+    the ``include`` query parameter of a JSON API request (for
+    example, ``'comments.author'``).
+
+    The loader strategy is chosen separately for each hop along a
+    path. To-many relationships are loaded with one additional query
+    each (see :data:`TO_MANY_LOADER`) and to-one relationships are
+    loaded by a join in the query for the resources that refer to them
+    (see :data:`TO_ONE_LOADER`). As a result, following a path of depth
+    *d* costs at most *d* queries, regardless of the number of primary
+    resources.
+
+    Path elements that do not name a relationship that can be loaded
+    eagerly are ignored, along with the remainder of that path.
+
+    The returned options can be provided to the
+    :meth:`sqlalchemy.orm.query.Query.options` method.
+
+    """
+    options = []
+    for path in paths:
+        option = Load(model)
+        current_model = model
+        num_hops = 0
+        for relation_name in path.split('.'):
+            attributes = _relationship_hops(current_model, relation_name)
+            if not attributes:
+                break
+            for attribute in attributes:
+                prop = attribute.property
+                if prop.uselist:
+                    strategy = TO_MANY_LOADER
+                else:
+                    strategy = TO_ONE_LOADER
+                option = getattr(option, strategy)(attribute)
+                current_model = prop.mapper.class_
+                num_hops += 1
+        if num_hops > 0:
+            options.append(option)
+    return options
+
+
+def column_loading_options(model, columns):
+    """Returns a list of SQLAlchemy loader options that load only the
+    given columns of `model`, deferring the rest.
+
+    `columns` is an iterable of names of column attributes of `model`.
+    Primary key and foreign key columns are always loaded, since they
+    are needed to identify each resource and to compute the linkage of
+    its relationships, as is the column that determines the version of
+    an instance, if any.
+
+    If `model` uses polymorphic loading, this function returns an empty
+    list, since the columns to load may differ for each subclass.
+
+    The returned options can be provided to the
+    :meth:`sqlalchemy.orm.query.Query.options` method.
+
+    """
+    mapper = sqlalchemy_inspect(model)
+    if mapper.polymorphic_on is not None:
+        return []
+    columns = set(columns)
+    for prop in mapper.column_attrs:
+        for column in prop.columns:
+            if (getattr(column, 'primary_key', False) or
+                    getattr(column, 'foreign_keys', None) or
+                    column is mapper.version_id_col):
+                columns.add(prop.key)
+    # Preserve the order of the columns as defined on the model.
+    keys = [key for key in mapper.column_attrs.keys() if key in columns]
+    # There is nothing to defer if all of the columns are loaded anyway.
+    if len(keys) == len(mapper.column_attrs):
+        return []
+    return [Load(model).load_only(*keys)]
+
+
+def _join_filters(model, filters):
+    """Returns a two-tuple containing a list of the relationship filters
+    among `filters` that can be applied by joining the related model,
+    and a list of the remaining filters.
+
+    `filters` is a list of filter objects on `model`, which are combined
+    by conjunction, as are the elements of an ``and`` filter object at
+    its top level. Each element of the first list is a two-tuple
+    containing a relationship attribute of `model` and the list of
+    filter objects on the related model given as the arguments of the
+    ``has`` filter objects on that relationship.
 
-    `filters`, `sort`, and `group_by` are identical to the corresponding
-    arguments of :func:`.search`.
+    A ``has`` filter on a many-to-one relationship requires the related
+    row to exist and satisfy the filter, which an inner join on the
+    relationship does without a correlated subquery, and without
+    changing the number of rows. This is only done for filters that are
+    not nested in a disjunction or negation, where an inner join would
+    change the meaning of the formula, and for relationships to a model
+    whose table is not already in the query: neither `model` itself nor
+    a model already joined for a filter on another relationship (for
+    example, both the author and the editor of an article). Such
+    filters are left among the remaining filters, since joining the
+    same table again would make its columns ambiguous.
+    Filters that only compare the primary key of the related model are
+    left out, since they are compared to the foreign key without a join
+    or subquery (see :meth:`.FieldSchema.compares_foreign_key`).
+
+    Filter objects that are not well-formed are left among the remaining
+    filters, to be reported when they are compiled.
+
+    """
+    # Flatten any conjunctions at the top level of the formula.
+    conjuncts = []
+    pending = list(filters)
+    while pending:
+        f = pending.pop(0)
+        if isinstance(f, dict) and list(f) == ['and'] and \
+                isinstance(f['and'], list):
+            pending[:0] = f['and']
+        else:
+            conjuncts.append(f)
+    fields = filter_schema(model).fields
+    tables = set(sqlalchemy_inspect(model).tables)
+    joins = {}
+    order = []
+    remaining = []
+    for f in conjuncts:
+        field = None
+        if isinstance(f, dict) and f.get('op') == 'has' and \
+                'field' not in f and isinstance(f.get('val'), dict) and \
+                not isinstance(f.get('name'), (dict, list)):
+            field = fields.get(f.get('name'))
+        if field is None or not field.joinable or \
+                field.compares_foreign_key(f['val']):
+            remaining.append(f)
+            continue
+        name = f['name']
+        if name not in joins:
+            related_mapper = sqlalchemy_inspect(field.related_model)
+            related_tables = set(related_mapper.tables)
+            if tables & related_tables:
+                remaining.append(f)
+                continue
+            tables |= related_tables
+            joins[name] = (field.attribute, [])
+            order.append(name)
+        joins[name][1].append(f['val'])
+    return [joins[name] for name in order], remaining
+
+
+def _value_list_dialect(session, model):
+    """Returns the name of the database dialect of the engine to which
+    `session` binds `model`, if lists of values can be bound to a single
+    parameter on it (see :func:`.operators.value_list_dialect`), or
+    ``None`` otherwise.
+
+    """
+    try:
+        bind = session.get_bind(mapper=sqlalchemy_inspect(model))
+    except UnboundExecutionError:
+        return None
+    return value_list_dialect(bind)
+
+
+def _filter(query, model, filters,
+            value_list_min_length=VALUE_LIST_MIN_LENGTH):
+    """Returns `query` restricted to the instances of `model` that
+    satisfy the list of filter objects `filters`.
+
+    Relationship filters that can be applied with a join are planned by
+    :func:`_join_filters`; the rest are compiled by
+    :func:`.filters.compile_filters`, which compares the foreign key
+    column where possible and uses a correlated ``EXISTS`` subquery
+    otherwise. Values in the filters are bound as parameters of the
+    query, in a way that may depend on the database dialect; lists of at
+    least `value_list_min_length` values are bound to a single parameter
+    where the database supports it.
+
+    This function raises the same exceptions as
+    :func:`.filters.compile_filters`.
+
+    """
+    if not filters:
+        return query
+    dialect = _value_list_dialect(query.session, model)
+    compile_ = partial(compile_filters, dialect=dialect,
+                       value_list_min_length=value_list_min_length)
+    joins, filters = _join_filters(model, filters)
+    for i, (attribute, subfilters) in enumerate(joins):
+        related_model = attribute.property.mapper.class_
+        prefix = '_join{0}'.format(i)
+        expressions, parameters = compile_(related_model, subfilters,
+                                           prefix=prefix)
+        query = query.join(attribute).filter(*expressions)
+        query = query.params(parameters)
+    expressions, parameters = compile_(model, filters)
+    return query.filter(*expressions).params(parameters)
+
+
+def _relationship_query(session, instance, relation):
+    """Returns a two-tuple containing the model of the objects related
+    to `instance` via the to-many relationship named `relation` and a
+    query restricted to those objects.
+
+    If `relation` names a relationship, the query is restricted by the
+    join condition of the relationship, so the related objects are never
+    loaded into memory. An association proxy has no such condition, so
+    in that case the query is restricted to the primary keys of the
+    related objects.
 
     """
     model = get_model(instance)
     related_model = get_related_model(model, relation)
     query = session_query(session, related_model)
+    if relation in sqlalchemy_inspect(model).relationships:
+        return related_model, query.with_parent(instance,
+                                                getattr(model, relation))
 
     # Filter by only those related values that are related to `instance`.
     relationship = getattr(instance, relation)
@@ -56,15 +333,90 @@ def search_relationship(session, instance, relation, filters=None, sort=None,
     # filtering operation by simply returning an intentionally empty
     # query.
     if not primary_keys:
-        return query.filter(FALSE())
+        return related_model, query.filter(FALSE())
     query = query.filter(primary_key_value(related_model).in_(primary_keys))
+    return related_model, query
+
 
+def search_relationship(session, instance, relation, filters=None, sort=None,
+                        group_by=None, include=None, columns=None,
+                        value_list_min_length=VALUE_LIST_MIN_LENGTH):
+    """Returns a filtered, sorted, and grouped SQLAlchemy query
+    restricted to those objects related to a given instance.
+
+    `session` is the SQLAlchemy session in which to create the query.
+
+    `instance` is an instance of a SQLAlchemy model whose relationship
+    will be queried.
+
+`   `relation` is a string naming a to-many relationship of `instance`.
+
+    `filters`, `sort`, `group_by`, `include`, `columns`, and
+    `value_list_min_length` are identical to the corresponding arguments
+    of :func:`.search`.
+
+    """
+    related_model, query = _relationship_query(session, instance, relation)
     return search(session, related_model, filters=filters, sort=sort,
-                  group_by=group_by, _initial_query=query)
+                  group_by=group_by, include=include, columns=columns,
+                  value_list_min_length=value_list_min_length,
+                  _initial_query=query)
+
+
+def count_relationship_query(session, instance, relation, filters=None,
+                             sort=None, group_by=None,
+                             value_list_min_length=VALUE_LIST_MIN_LENGTH):
+    """Returns a SQLAlchemy query that yields as many rows as the query
+    returned by :func:`search_relationship` with the same arguments.
+
+    The arguments are as in :func:`search_relationship`; for more
+    information, see :func:`count_query`.
+
+    """
+    related_model, query = _relationship_query(session, instance, relation)
+    return count_query(session, related_model, filters=filters, sort=sort,
+                       group_by=group_by,
+                       value_list_min_length=value_list_min_length,
+                       _initial_query=query)
+
+
+def _grouped_query(session, model, filters=None, group_by=None,
+                   value_list_min_length=VALUE_LIST_MIN_LENGTH,
+                   _initial_query=None):
+    """Returns a SQLAlchemy query on `model` restricted by `filters` and
+    grouped by `group_by`, with the joins that the grouping requires.
+
+    This is the part of the query shared by :func:`search` and
+    :func:`count_query`, which add their own ordering, joins, and loader
+    options to it. The arguments are as in :func:`search`.
+
+    """
+    query = _initial_query
+    if query is None:
+        query = session_query(session, model)
+
+    # Filter the query.
+    #
+    # This function call may raise an exception.
+    query = _filter(query, model, filters, value_list_min_length)
+
+    # Group the query.
+    for field_name in group_by or ():
+        if '.' in field_name:
+            field_name, field_name_in_relation = field_name.split('.')
+            relation_model = aliased(get_related_model(model, field_name))
+            field = getattr(relation_model, field_name_in_relation)
+            query = query.join(relation_model)
+            query = query.group_by(field)
+        else:
+            query = query.group_by(getattr(model, field_name))
+
+    return query
 
 
 def search(session, model, filters=None, sort=None, group_by=None,
-           _initial_query=None):
+           include=None, columns=None,
+           value_list_min_length=VALUE_LIST_MIN_LENGTH, _initial_query=None):
     """Returns a filtered, sorted, and grouped SQLAlchemy query.
 
     `session` is the SQLAlchemy session in which to create the query.
@@ -74,7 +426,7 @@ def search(session, model, filters=None, sort=None, group_by=None,
     `filters` is a list of filter objects. Each filter object is a
     dictionary representation of the filters to apply to the
     query. (This dictionary is provided directly to the
-    :func:`.filters.create_filters` function.) For more information on
+    :func:`.filters.compile_filters` function.) For more information on
     the format of this dictionary, see :doc:`filtering`.
 
     `sort` is a list of pairs of the form ``(direction, fieldname)``,
@@ -85,23 +437,40 @@ def search(session, model, filters=None, sort=None, group_by=None,
     `group_by` is a list of dot-separated relationship paths on which to
     group the query results.
 
+    `include` is an iterable of dot-separated relationship paths naming
+    the related resources that will be included in a compound document
+    along with the results of this query. Loader options are added to
+    the query so that these related resources are loaded eagerly; for
+    more information, see :func:`eager_loading_options`. Related
+    resources are not loaded eagerly if `group_by` is specified, since
+    the eager joins would interfere with the grouping.
+
+    `columns` is either ``None`` or an iterable of names of column
+    attributes of `model` whose values are needed by the caller, for
+    example to serialize a sparse fieldset. If it is not ``None``, the
+    other columns (except for primary and foreign keys) are deferred, so
+    that they are not loaded from the database unless they are
+    accessed; for more information, see :func:`column_loading_options`.
+    Columns are not deferred if `group_by` is specified.
+
+    `value_list_min_length` is the smallest number of values given to
+    the ``in`` or ``not_in`` operator in `filters` that are bound to a
+    single parameter, instead of to one parameter each, where the
+    database supports it (see :func:`.filters.compile_filters`).
+
     If `_initial_query` is provided, the filters, sorting, and grouping
     will be appended to this query. Otherwise, an empty query will be
     created for the specified model.
 
-    When building the query, filters are applied first, then sorting,
-    then grouping.
+    When building the query, filters are applied first, then grouping
+    (see :func:`_grouped_query`), then sorting.
 
     """
-    query = _initial_query
-    if query is None:
-        query = session_query(session, model)
-
-    # Filter the query.
-    #
     # This function call may raise an exception.
-    filters = create_filters(model, filters)
-    query = query.filter(*filters)
+    query = _grouped_query(session, model, filters=filters,
+                           group_by=group_by,
+                           value_list_min_length=value_list_min_length,
+                           _initial_query=_initial_query)
 
     # Order the query. If no order field is specified, order by primary
     # key.
@@ -125,17 +494,151 @@ def search(session, model, filters=None, sort=None, group_by=None,
         pk_order = (getattr(model, field).asc() for field in pks)
         query = query.order_by(*pk_order)
 
-    # Group the query.
-    if group_by:
-        for field_name in group_by:
-            if '.' in field_name:
-                field_name, field_name_in_relation = field_name.split('.')
-                relation_model = aliased(get_related_model(model, field_name))
-                field = getattr(relation_model, field_name_in_relation)
-                query = query.join(relation_model)
-                query = query.group_by(field)
-            else:
-                field = getattr(model, field_name)
-                query = query.group_by(field)
+    # Eagerly load any related resources that will be included in the
+    # response.
+    if include and not group_by:
+        query = query.options(*eager_loading_options(model, include))
+
+    # Defer loading of any columns that will not be used.
+    if columns is not None and not group_by:
+        query = query.options(*column_loading_options(model, columns))
 
     return query
+
+
+def _is_cardinality_neutral(model, relation_name):
+    """Returns whether joining `model` to the model related via the
+    relationship named `relation_name` yields exactly one row for each
+    instance of `model`.
+
+    This is the case for a many-to-one relationship whose foreign key
+    columns are all non-nullable, since each such foreign key refers to
+    exactly one row of the related table.
+
+    """
+    attribute = getattr(model, relation_name, None)
+    prop = getattr(attribute, 'property', None)
+    if getattr(prop, 'direction', None) is not MANYTOONE:
+        return False
+    if prop.secondary is not None:
+        return False
+    return all(column.foreign_keys and not column.nullable
+               for column in prop.local_columns)
+
+
+def count_query(session, model, filters=None, sort=None, group_by=None,
+                value_list_min_length=VALUE_LIST_MIN_LENGTH,
+                _initial_query=None):
+    """Returns a SQLAlchemy query that yields as many rows as the query
+    returned by :func:`search` with the same arguments, but that is
+    cheaper to count.
+
+    The returned query has no ``ORDER BY`` clause and no eager loader
+    options. A join that :func:`search` would add only to sort by a
+    field of a related model is omitted if it cannot change the number
+    of rows (see :func:`_is_cardinality_neutral`). Joins that may change
+    the number of rows, for example joins on to-many relationships or
+    on nullable foreign keys, are kept, as are the joins and grouping
+    specified by `group_by`.
+
+    If neither `sort` nor `group_by` requires a join, counting the
+    returned query therefore amounts to counting the rows of a single
+    table that satisfy the filters.
+
+    """
+    # This function call may raise an exception.
+    query = _grouped_query(session, model, filters=filters,
+                           group_by=group_by,
+                           value_list_min_length=value_list_min_length,
+                           _initial_query=_initial_query)
+
+    for (symbol, field_name) in sort or ():
+        if '.' not in field_name:
+            continue
+        field_name = field_name.split('.')[0]
+        if _is_cardinality_neutral(model, field_name):
+            continue
+        query = query.join(aliased(get_related_model(model, field_name)))
+
+    return query
+
+
+def keyset_keys(model, sort=None):
+    """Returns the list of sort keys that define a total order on the
+    instances of `model` consistent with `sort`.
+
+    `sort` is as in :func:`search`. The returned list contains pairs of
+    the form ``(attribute_name, ascending)``, where `attribute_name` is
+    the name of an attribute of `model` and `ascending` is a Boolean
+    indicating the direction of the sort. The primary key attributes of
+    `model` that do not already appear in `sort` are appended, in
+    ascending order, as a tiebreaker.
+
+    If `sort` contains a field of a related model, this function raises
+    :exc:`ValueError`, since the values of such fields cannot be
+    compared in a filter on the query returned by :func:`search`.
+
+    """
+    keys = []
+    for symbol, field_name in sort or ():
+        if '.' in field_name:
+            msg = 'cannot seek on the field of a related model: {0}'
+            raise ValueError(msg.format(field_name))
+        keys.append((field_name, symbol == '+'))
+    names = set(name for name, ascending in keys)
+    mapper = sqlalchemy_inspect(model)
+    for column in mapper.primary_key:
+        name = mapper.get_property_by_column(column).key
+        if name not in names:
+            keys.append((name, True))
+    return keys
+
+
+def seek(query, model, keys, values=None, before=False, inclusive=False):
+    """Returns `query` ordered by the specified sort keys and restricted
+    to the rows that come after the row whose sort key values are
+    `values`.
+
+    `keys` is a list of sort keys as returned by :func:`keyset_keys` and
+    `values` is a list of the same length containing the value of each
+    of those keys in a particular row. If `values` is ``None``, the
+    query is ordered but not restricted.
+
+    If `before` is ``True``, the order is reversed, so the returned
+    query yields the rows that come before the specified row, from the
+    nearest to the farthest. If `inclusive` is ``True``, the specified
+    row itself is included.
+
+    Since the sort keys include the primary key, this is equivalent to
+    paginating with an offset, but the database can use an index on the
+    sort keys to find the first row instead of reading and discarding
+    all the preceding rows.
+
+    """
+    columns = [getattr(model, name) for name, ascending in keys]
+    ascending = [direction != before for name, direction in keys]
+    order = [column.asc() if direction else column.desc()
+             for column, direction in zip(columns, ascending)]
+    query = query.order_by(None).order_by(*order)
+    if values is None:
+        return query
+    # The rows after a row with values (v1, v2, ..., vn) are those
+    # satisfying
+    #
+    #     k1 > v1 or (k1 = v1 and k2 > v2) or ... or
+    #     (k1 = v1 and ... and kn-1 = vn-1 and kn > vn)
+    #
+    # where each comparison is reversed for a descending sort key. This
+    # is used instead of a row value comparison, which is not supported
+    # by all databases and cannot express mixed sort directions.
+    clauses = []
+    last = len(columns) - 1
+    for i, (column, direction, value) in enumerate(zip(columns, ascending,
+                                                       values)):
+        equal = [c == v for c, v in zip(columns[:i], values[:i])]
+        if inclusive and i == last:
+            beyond = column >= value if direction else column <= value
+        else:
+            beyond = column > value if direction else column < value
+        clauses.append(and_(*(equal + [beyond])))
+    return query.filter(or_(*clauses))
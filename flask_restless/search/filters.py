@@ -16,6 +16,10 @@ expressions that can be used by the :meth:`sqlalchemy.orm.Query.filter`
 method. It parses a dictionary representation of a filter as described
 in :doc:`filtering` into an executable SQLAlchemy expression.
 
+The :func:`compile_filters` function does the same, but caches the
+expressions for each distinct shape of filter objects, so that filters
+that differ only in their values are parsed only once.
+
 The :exc:`FilterParsingError` and :exc:`FilterCreationError` exceptions
 provide information about problems that arise from parsing filters and
 generating the SQLAlchemy expressions, respectively.
@@ -23,16 +27,37 @@ generating the SQLAlchemy expressions, respectively.
 """
 from operator import methodcaller
 from functools import partial
+from itertools import count
+from threading import Lock
+import sys
 
 from sqlalchemy import and_
+from sqlalchemy import bindparam
+from sqlalchemy import event
+from sqlalchemy import Integer
 from sqlalchemy import not_
+from sqlalchemy import Numeric
 from sqlalchemy import or_
-
+from sqlalchemy.ext.associationproxy import AssociationProxy
+from sqlalchemy.ext.hybrid import hybrid_method
+from sqlalchemy.inspection import inspect as sqlalchemy_inspect
+from sqlalchemy.orm import configure_mappers
+from sqlalchemy.orm import Mapper
+from sqlalchemy.orm import RelationshipProperty
+from sqlalchemy.orm.exc import UnmappedColumnError
+from sqlalchemy.orm.interfaces import MANYTOONE
+from sqlalchemy.sql.expression import ClauseElement
+
+from ..helpers import get_field_type
 from ..helpers import get_related_model_from_attribute
-from ..helpers import string_to_datetime
+from ..helpers import string_to_type
 from .operators import create_operation
 from .operators import NO_ARGUMENT
+from .operators import OPERATORS
 from .operators import OperatorCreationError
+from .operators import uses_value_list
+from .operators import VALUE_LIST_MIN_LENGTH
+from .operators import ValueList
 
 
 class FilterCreationError(Exception):
@@ -123,6 +148,29 @@ class FieldFilter(Filter):
             raise FilterCreationError(str(exception))
 
 
+class ForeignKeyFilter(FieldFilter):
+    """Represents a filter that compares a foreign key column in place
+    of the primary key of the related model, as an equivalent of a
+    ``has`` filter on the relationship.
+
+    If `nullable` is ``True``, the expression also requires the foreign
+    key to be non-null, so that its negation, like the negation of the
+    ``has`` filter it replaces, includes the rows with a null foreign
+    key.
+
+    """
+
+    def __init__(self, field, operator, argument, nullable=False):
+        super(ForeignKeyFilter, self).__init__(field, operator, argument)
+        self.nullable = nullable
+
+    def to_expression(self):
+        expression = super(ForeignKeyFilter, self).to_expression()
+        if self.nullable:
+            expression = and_(self.field != None, expression)  # NOQA
+        return expression
+
+
 class BooleanFilter(Filter):
     """A Boolean expression comprising other filters.
 
@@ -183,7 +231,291 @@ class DisjunctionFilter(JunctionFilter):
         return or_(f.to_expression() for f in self.subfilters)
 
 
-def from_dictionary(model, dictionary):
+if sys.version_info < (3, ):
+    STRING_TYPES = (str, unicode)
+else:
+    STRING_TYPES = (str, )
+
+#: The names of the operators that compare a field to a pattern, whose
+#: argument is therefore never converted to the type of the field.
+PATTERN_OPERATORS = frozenset(('like', 'ilike', 'not_like'))
+
+#: The names of the operators that do not take an argument.
+UNARY_OPERATORS = frozenset(('is_null', 'is_not_null'))
+
+#: The names of the operators that can be applied to a column.
+COLUMN_OPERATORS = frozenset(operator for operator in OPERATORS
+                             if operator not in ('has', 'any'))
+
+#: The names of the operators that can be applied to a to-one
+#: relationship.
+TO_ONE_OPERATORS = UNARY_OPERATORS | frozenset(('has', ))
+
+#: The names of the operators that can be applied to a to-many
+#: relationship.
+TO_MANY_OPERATORS = UNARY_OPERATORS | frozenset(('any', ))
+
+#: The names of the operators that, when applied to the primary key of
+#: the target of a many-to-one relationship in the argument of a ``has``
+#: operator, can be applied to the foreign key column instead.
+FOREIGN_KEY_OPERATORS = frozenset(('==', 'eq', 'equals', 'equal_to', 'in'))
+
+
+def _number_coercer(field_type):
+    """Returns a function that converts a string to a number of the
+    Python type of the numeric SQLAlchemy type `field_type`, or ``None``
+    if `field_type` is not numeric.
+
+    """
+    if not isinstance(field_type, (Integer, Numeric)):
+        return None
+    try:
+        python_type = field_type.python_type
+    except NotImplementedError:
+        return None
+
+    def coerce(value):
+        if not isinstance(value, STRING_TYPES):
+            return value
+        try:
+            return python_type(value)
+        except (ArithmeticError, ValueError):
+            message = 'invalid argument value "{0}"'.format(value)
+            raise FilterParsingError(message)
+
+    return coerce
+
+
+class FieldSchema(object):
+    """Describes how a field of a model may be filtered.
+
+    `attribute` is the attribute of the model (a column, relationship,
+    association proxy, or hybrid property) on which the filter operates.
+
+    `field_type` is the SQLAlchemy type of the field, if any, which
+    determines how a value compared to it is converted before it is
+    given to an operator (see :meth:`argument`).
+
+    `operators` is the set of names of the operators that may be applied
+    to the field.
+
+    `related_model` is the model to which the field refers, if it is a
+    relationship or an association proxy of a relationship. It is the
+    model on which the filter given as the argument of a ``has`` or
+    ``any`` operator operates.
+
+    If the field is a many-to-one relationship through a single foreign
+    key column, `foreign_key` is a three-tuple containing the attribute
+    of that column, the name of the attribute of `related_model` to
+    which it refers, and whether the column is nullable. Otherwise it is
+    ``None``.
+
+    """
+
+    def __init__(self, attribute, field_type=None, operators=None,
+                 related_model=None, foreign_key=None):
+        self.attribute = attribute
+        self.field_type = field_type
+        self.operators = operators
+        self.related_model = related_model
+        self.foreign_key = foreign_key
+        self._to_number = _number_coercer(field_type)
+
+    def coerce(self, value):
+        """Returns `value` converted to the type of this field.
+
+        Dates, times, and intervals are converted as by
+        :func:`~flask.ext.restless.helpers.string_to_datetime` and
+        numeric strings are converted to numbers. Each element of a list
+        is converted separately.
+
+        This method raises :exc:`FilterParsingError` if `value` cannot
+        be converted.
+
+        """
+        if isinstance(value, list):
+            return [self.coerce(item) for item in value]
+        if self._to_number is not None:
+            return self._to_number(value)
+        try:
+            return string_to_type(self.field_type, value)
+        except (AttributeError, TypeError, ValueError, OverflowError):
+            message = 'invalid argument value "{0}"'.format(value)
+            raise FilterParsingError(message)
+
+    @property
+    def joinable(self):
+        """Whether the field is a many-to-one relationship, so that
+        joining its model to `related_model` yields at most one row for
+        each row of its model.
+
+        """
+        prop = getattr(self.attribute, 'property', None)
+        return (isinstance(prop, RelationshipProperty) and
+                prop.direction is MANYTOONE and prop.secondary is None)
+
+    def compares_foreign_key(self, dictionary):
+        """Returns whether the filter object `dictionary`, given as the
+        argument of the ``has`` operator applied to this field, only
+        compares the primary key of the related model to a value, so
+        that the foreign key of this field can be compared instead.
+
+        """
+        if self.foreign_key is None or not isinstance(dictionary, dict):
+            return False
+        column, remote_name, nullable = self.foreign_key
+        return (dictionary.get('name') == remote_name and
+                dictionary.get('op') in FOREIGN_KEY_OPERATORS and
+                'field' not in dictionary)
+
+    def argument(self, operator, value):
+        """Returns `value` converted for use as the argument of the
+        operator named `operator` applied to this field.
+
+        The argument of a pattern matching operator is never converted.
+
+        """
+        if operator in PATTERN_OPERATORS:
+            return value
+        return self.coerce(value)
+
+
+class FilterSchema(object):
+    """The fields of a model that may be filtered, and how.
+
+    The fields are the columns, relationships, association proxies, and
+    hybrid properties of `model`. They are inspected once, when an
+    instance of this class is created, so that parsing a filter object
+    is reduced to dictionary lookups (see :meth:`field`).
+
+    Since relationships defined by backrefs only exist once the mappers
+    have been configured, creating an instance of this class configures
+    them, which may raise an exception if a model has not been defined
+    yet.
+
+    """
+
+    def __init__(self, model):
+        self.model = model
+        #: A mapping from field name to :class:`FieldSchema`.
+        self.fields = {}
+        configure_mappers()
+        mapper = sqlalchemy_inspect(model)
+        for name, descriptor in mapper.all_orm_descriptors.items():
+            if name.startswith('__'):
+                continue
+            if isinstance(descriptor, hybrid_method):
+                continue
+            try:
+                field = self._field_schema(name, descriptor)
+            # A hybrid property without a SQL expression may raise any
+            # exception when it is evaluated on the model; it cannot be
+            # filtered in any case.
+            except Exception:
+                continue
+            self.fields[name] = field
+
+    def _field_schema(self, name, descriptor):
+        """Returns the :class:`FieldSchema` for the field named `name`,
+        given its ORM descriptor.
+
+        """
+        attribute = getattr(self.model, name)
+        if isinstance(descriptor, AssociationProxy):
+            related_model = None
+            remote = getattr(attribute.remote_attr, 'property', None)
+            if isinstance(remote, RelationshipProperty):
+                related_model = get_related_model_from_attribute(attribute)
+            field_type = get_field_type(self.model, name)
+            return FieldSchema(attribute, field_type, OPERATORS,
+                               related_model)
+        prop = getattr(attribute, 'property', None)
+        if isinstance(prop, RelationshipProperty):
+            if prop.uselist:
+                operators = TO_MANY_OPERATORS
+            else:
+                operators = TO_ONE_OPERATORS
+            return FieldSchema(attribute, operators=operators,
+                               related_model=prop.mapper.class_,
+                               foreign_key=self._foreign_key(prop))
+        field_type = get_field_type(self.model, name)
+        return FieldSchema(attribute, field_type, COLUMN_OPERATORS)
+
+    def _foreign_key(self, prop):
+        """Returns the foreign key of the relationship `prop`, as
+        described in :class:`FieldSchema`, or ``None`` if it is not a
+        many-to-one relationship through a single mapped column.
+
+        """
+        if prop.direction is not MANYTOONE or prop.secondary is not None:
+            return None
+        pairs = prop.local_remote_pairs
+        if len(pairs) != 1:
+            return None
+        local, remote = pairs[0]
+        mapper = sqlalchemy_inspect(self.model)
+        related_mapper = prop.mapper
+        # The remote column must be the primary key of the related
+        # model, which is what the ``has`` filter compares.
+        if list(related_mapper.primary_key) != [remote]:
+            return None
+        try:
+            local_prop = mapper.get_property_by_column(local)
+            remote_prop = related_mapper.get_property_by_column(remote)
+        except UnmappedColumnError:
+            return None
+        column = getattr(self.model, local_prop.key)
+        return column, remote_prop.key, local.nullable
+
+    def field(self, name):
+        """Returns the :class:`FieldSchema` for the field named `name`.
+
+        This method raises :exc:`FilterParsingError` if the model has no
+        such field.
+
+        """
+        try:
+            return self.fields[name]
+        except (KeyError, TypeError):
+            message = 'no such field "{0}"'.format(name)
+            raise FilterParsingError(message)
+
+
+#: A mapping from model to its :class:`FilterSchema`.
+#:
+#: A schema is added by :func:`filter_schema` the first time a filter
+#: operates on a model, and not when its API is created, since inspecting
+#: the model configures the mappers, which fails if a related model has
+#: not been defined yet.
+filter_schemas = {}
+
+
+def filter_schema(model):
+    """Returns the :class:`FilterSchema` for `model`, creating it if it
+    does not exist yet.
+
+    """
+    schema = filter_schemas.get(model)
+    if schema is None:
+        schema = filter_schemas[model] = FilterSchema(model)
+    return schema
+
+
+@event.listens_for(Mapper, 'after_configured')
+def _discard_filter_schemas():
+    """Discards the filter schemas whenever new mappers are configured,
+    since they may have added relationships to existing models (by a
+    backref, for example).
+
+    """
+    filter_schemas.clear()
+
+
+def _convert(field, operator, value):
+    return field.argument(operator, value)
+
+
+def from_dictionary(model, dictionary, convert=_convert):
     """Returns a new :class:`Filter` object with arguments parsed from
     `dictionary`.
 
@@ -217,6 +549,19 @@ def from_dictionary(model, dictionary):
     representing the root of the Boolean formula parsed from the given
     dictionary.
 
+    The fields and operators are looked up in the :class:`FilterSchema`
+    of `model` (see :func:`filter_schema`), so a filter object that
+    names a field that does not exist, or an operator that cannot be
+    applied to that field, is rejected before any SQL expression is
+    created.
+
+    `convert` is the function that converts the value of the ``val``
+    element of a dictionary before it is given to a binary operator,
+    other than a relationship operator. It is called with three
+    arguments, the :class:`FieldSchema` of the field, the name of the
+    operator, and the value, and by default it returns the result of
+    :meth:`FieldSchema.argument`.
+
     This method raises :exc:`FilterParsingError` if one of several
     possible errors occurs while parsing the dictionary.
 
@@ -228,23 +573,25 @@ def from_dictionary(model, dictionary):
         # First, get the field on which to operate.
         if 'name' not in dictionary:
             raise FilterParsingError('missing field name')
+        schema = filter_schema(model)
         fieldname = dictionary.get('name')
-        if not hasattr(model, fieldname):
-            message = 'no such field "{0}"'.format(fieldname)
-            raise FilterParsingError(message)
-        field = getattr(model, fieldname)
+        field_schema = schema.field(fieldname)
+        field = field_schema.attribute
         # Next, get the operator to apply to the field.
         if 'op' not in dictionary:
             raise FilterParsingError('missing operator')
         operator = dictionary.get('op')
+        if operator not in OPERATORS:
+            message = 'unknown operator "{0}"'.format(operator)
+            raise FilterParsingError(message)
+        if operator not in field_schema.operators:
+            message = 'operator "{0}" cannot be applied to field "{1}"'
+            raise FilterParsingError(message.format(operator, fieldname))
         # Finally, get the second argument to the operator. The argument
         # may be another field, a simple value, or another filter.
         if 'field' in dictionary:
             otherfield = dictionary.get('field')
-            if not hasattr(model, otherfield):
-                message = 'no such field "{0}"'.format(otherfield)
-                raise FilterParsingError(message)
-            argument = getattr(model, otherfield)
+            argument = schema.field(otherfield).attribute
             return FieldFilter(field, operator, argument)
         else:
             # We need to be able to distinguish the case of an argument
@@ -257,16 +604,32 @@ def from_dictionary(model, dictionary):
             # another filter object entirely, so we need to recursively
             # construct a filter from the argument.
             if operator in ('has', 'any'):
-                # Get the remote model of the relationship, since
-                # `field` is either an InstrumentedAttribute or an
-                # AssociationProxy.
-                related_model = get_related_model_from_attribute(field)
-                argument = from_dictionary(related_model, argument)
+                related_model = field_schema.related_model
+                if related_model is None:
+                    message = 'field "{0}" is not a relationship'
+                    raise FilterParsingError(message.format(fieldname))
+                if not isinstance(argument, dict):
+                    message = 'argument of "{0}" must be a filter object'
+                    raise FilterParsingError(message.format(operator))
+                subfilter = from_dictionary(related_model, argument,
+                                            convert=convert)
+                # A comparison of the primary key of the related model
+                # is a comparison of the foreign key of this model, which
+                # needs no subquery.
+                if operator == 'has' and \
+                        field_schema.compares_foreign_key(argument):
+                    column, remote_name, nullable = field_schema.foreign_key
+                    return ForeignKeyFilter(column, subfilter.operator,
+                                            subfilter.argument,
+                                            nullable=nullable)
+                return FieldFilter(field, operator, subfilter)
+            # The argument of a unary operator is ignored, and a missing
+            # argument is reported when the operation is created.
+            if operator in UNARY_OPERATORS or argument is NO_ARGUMENT:
                 return FieldFilter(field, operator, argument)
-            # HACK: need to deal with the special case of converting dates.
-            argument = string_to_datetime(model, fieldname, argument)
+            argument = convert(field_schema, operator, argument)
             return FieldFilter(field, operator, argument)
-    from_dict = partial(from_dictionary, model)
+    from_dict = partial(from_dictionary, model, convert=convert)
     # If there is an OR or an AND in the dictionary, recurse on the
     # provided list of filters.
     if 'or' in dictionary:
@@ -311,3 +674,329 @@ def create_filters(model, filters):
     #
     # TODO In Python 3.3+, this should be `yield from ...`.
     return map(methodcaller('to_expression'), filters)
+
+
+class _Slot(object):
+    """A placeholder for the value of a filter object in the shape of a
+    list of filter objects, as computed by :func:`_shape`.
+
+    `index` is the position of the value in the list of values of the
+    filter objects and `length` is the number of elements of the value
+    if it is a list bound with one parameter for each element, or
+    ``None`` otherwise. If the value is a list bound to a single
+    parameter instead (see :func:`.operators.uses_value_list`),
+    `dialect` is the name of the database dialect that binds it.
+
+    """
+
+    def __init__(self, index, length=None, dialect=None):
+        self.index = index
+        self.length = length
+        self.dialect = dialect
+
+
+def _shape(dictionary, values, dialect=None,
+           min_length=VALUE_LIST_MIN_LENGTH):
+    """Returns a hashable representation of the filter object
+    `dictionary` with its values left out, or ``None`` if it cannot be
+    compiled with bound parameters in place of its values.
+
+    `dictionary` is as in :func:`from_dictionary`. Each value left out is
+    appended to the list `values`. `dialect` and `min_length` are as in
+    :func:`.operators.uses_value_list`.
+
+    Only the structure of `dictionary` is examined, not the fields of
+    the model, so this is much cheaper than parsing `dictionary`. Filter
+    objects that are not well-formed, and comparisons to ``None`` (which
+    must be rendered as ``IS NULL`` instead of with a bound parameter),
+    have no shape, so that parsing them raises the usual exceptions.
+
+    """
+    if not isinstance(dictionary, dict):
+        return None
+    for junction in 'or', 'and':
+        if junction in dictionary:
+            subfilters = dictionary[junction]
+            if not isinstance(subfilters, list):
+                return None
+            shapes = tuple(_shape(d, values, dialect, min_length)
+                           for d in subfilters)
+            if None in shapes:
+                return None
+            return (junction, shapes)
+    if 'not' in dictionary:
+        shape = _shape(dictionary['not'], values, dialect, min_length)
+        return None if shape is None else ('not', shape)
+    fieldname = dictionary.get('name')
+    operator = dictionary.get('op')
+    if any(isinstance(x, (dict, list)) for x in (fieldname, operator)):
+        return None
+    if fieldname is None or operator not in OPERATORS:
+        return None
+    if 'field' in dictionary:
+        otherfield = dictionary['field']
+        if isinstance(otherfield, (dict, list)):
+            return None
+        return (fieldname, operator, 'field', otherfield)
+    if operator in ('is_null', 'is_not_null'):
+        return (fieldname, operator)
+    if operator in ('has', 'any'):
+        shape = _shape(dictionary.get('val'), values, dialect, min_length)
+        return None if shape is None else (fieldname, operator, shape)
+    value = dictionary.get('val')
+    if value is None:
+        return None
+    if isinstance(value, list):
+        values.append(value)
+        if uses_value_list(operator, value, dialect, min_length):
+            return (fieldname, operator, 'values', dialect)
+        return (fieldname, operator, 'list', len(value))
+    values.append(value)
+    return (fieldname, operator, 'val')
+
+
+def _template(dictionary, slots, dialect=None,
+              min_length=VALUE_LIST_MIN_LENGTH):
+    """Returns a copy of the filter object `dictionary` in which each
+    value left out of its shape is replaced by a :class:`_Slot`.
+
+    `slots` is an iterator over the indices of the values, in the same
+    order as :func:`_shape` left them out, and `dialect` and
+    `min_length` are as in :func:`_shape`.
+
+    """
+    for junction in 'or', 'and':
+        if junction in dictionary:
+            return {junction: [_template(d, slots, dialect, min_length)
+                               for d in dictionary[junction]]}
+    if 'not' in dictionary:
+        return {'not': _template(dictionary['not'], slots, dialect,
+                                 min_length)}
+    template = dict(dictionary)
+    operator = dictionary['op']
+    if 'field' in dictionary or operator in ('is_null', 'is_not_null'):
+        return template
+    value = dictionary['val']
+    if operator in ('has', 'any'):
+        template['val'] = _template(value, slots, dialect, min_length)
+    elif isinstance(value, list):
+        if uses_value_list(operator, value, dialect, min_length):
+            template['val'] = _Slot(next(slots), dialect=dialect)
+        else:
+            template['val'] = _Slot(next(slots), len(value))
+    else:
+        template['val'] = _Slot(next(slots))
+    return template
+
+
+def _parameter_name(prefix, index, element=None):
+    """Returns the name of the bound parameter for the value at `index`
+    or, if the value is a list, for the element at `element` in it.
+
+    The name begins with `prefix`, so that the parameters of several
+    lists of filter objects applied to the same query are distinct.
+
+    """
+    if element is None:
+        return '{0}_{1}'.format(prefix, index)
+    return '{0}_{1}_{2}'.format(prefix, index, element)
+
+
+class CompiledFilters(object):
+    """The SQLAlchemy expressions for a list of filter objects, with
+    bound parameters in place of the values of the filter objects.
+
+    `expressions` is the list of expressions and `converters` is a list
+    containing, for each value, the function of one argument that
+    converts the value before it is bound (for example, a string to a
+    date). `prefix` is the prefix of the names of the bound parameters.
+
+    `value_lists` is the set of indices of the values that are lists
+    bound to a single parameter, as opposed to one parameter for each
+    element.
+
+    """
+
+    def __init__(self, expressions, converters, prefix='_filter',
+                 value_lists=frozenset()):
+        self.expressions = expressions
+        self.converters = converters
+        self.prefix = prefix
+        self.value_lists = value_lists
+
+    def parameters(self, values):
+        """Returns a dictionary mapping the name of each bound parameter
+        in :attr:`expressions` to its value, given the list of `values`
+        of a list of filter objects of the same shape as the one from
+        which these expressions were compiled.
+
+        If one of the converted values cannot be bound as a parameter
+        (for example, a SQL function that computes the current date),
+        this method returns ``None``.
+
+        """
+        name = partial(_parameter_name, self.prefix)
+        parameters = {}
+        for index, (convert, value) in enumerate(zip(self.converters,
+                                                     values)):
+            value = convert(value)
+            if index in self.value_lists:
+                parameters[name(index)] = value
+            elif isinstance(value, list):
+                for element, item in enumerate(value):
+                    parameters[name(index, element)] = item
+            elif value is None or isinstance(value, ClauseElement):
+                return None
+            else:
+                parameters[name(index)] = value
+        return parameters
+
+
+def _compile(model, filters, prefix='_filter', dialect=None,
+             min_length=VALUE_LIST_MIN_LENGTH):
+    """Returns the :class:`CompiledFilters` for the list of filter
+    objects `filters` on `model`, with bound parameters whose names
+    begin with `prefix`, for execution on the database dialect named
+    `dialect`. `min_length` is as in :func:`_shape`.
+
+    This function raises the same exceptions as :func:`create_filters`.
+
+    """
+    slots = count()
+    templates = [_template(d, slots, dialect, min_length) for d in filters]
+    # A mapping from the index of each slot to the function that
+    # converts its value.
+    converters = {}
+    value_lists = set()
+    name = partial(_parameter_name, prefix)
+
+    def convert(field, operator, slot):
+        converters[slot.index] = partial(field.argument, operator)
+        if slot.dialect is not None:
+            value_lists.add(slot.index)
+            return ValueList(name(slot.index), slot.dialect)
+        if slot.length is None:
+            return bindparam(name(slot.index))
+        return [bindparam(name(slot.index, element))
+                for element in range(slot.length)]
+
+    from_dict = partial(from_dictionary, model, convert=convert)
+    filters = [from_dict(template) for template in templates]
+    # The subfilters of a Boolean formula may be parsed only when its
+    # expression is created, so the converters are only known after.
+    expressions = [f.to_expression() for f in filters]
+    converters = [converters[index] for index in sorted(converters)]
+    return CompiledFilters(expressions, converters, prefix,
+                           frozenset(value_lists))
+
+
+class FilterCache(object):
+    """A least recently used cache of the :class:`CompiledFilters` for
+    lists of filter objects, keyed by model and by the shape of the
+    filter objects (along with the prefix of the names of their bound
+    parameters).
+
+    `maxsize` is the maximum number of entries in the cache; when it
+    is full, the least recently used half of the entries are
+    discarded.
+
+    The cache is shared by all the threads handling requests, so each
+    method holds a lock while it reads or changes the entries.
+
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        #: A mapping from key to a two-tuple containing the compiled
+        #: filters and the tick at which they were last used.
+        self._entries = {}
+        self._ticks = count()
+        self._lock = Lock()
+
+    def get(self, model, shape):
+        """Returns the compiled filters for the list of filter objects
+        of the specified shape on `model`.
+
+        `shape` is a hashable key containing the shape of each filter
+        object, as returned by :func:`_shape`. If there are no compiled
+        filters for `shape` in the cache, this method returns ``None``.
+
+        """
+        key = (model, shape)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            compiled = entry[0]
+            self._entries[key] = (compiled, next(self._ticks))
+        return compiled
+
+    def put(self, model, shape, compiled):
+        """Stores the compiled filters for the list of filter objects of
+        the specified shape on `model`.
+
+        """
+        with self._lock:
+            if len(self._entries) >= self.maxsize:
+                entries = sorted(self._entries.items(),
+                                 key=lambda item: item[1][1])
+                for key, entry in entries[:len(entries) // 2 + 1]:
+                    del self._entries[key]
+            self._entries[(model, shape)] = (compiled, next(self._ticks))
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        with self._lock:
+            self._entries.clear()
+
+
+#: The cache used by :func:`compile_filters`.
+filter_cache = FilterCache()
+
+
+def compile_filters(model, filters, prefix='_filter', dialect=None,
+                    value_list_min_length=VALUE_LIST_MIN_LENGTH):
+    """Returns a two-tuple containing a list of SQLAlchemy filter
+    expressions and a dictionary of values for the bound parameters in
+    them.
+
+    `model` and `filters` are as in :func:`create_filters`. The
+    expressions can be given to :meth:`sqlalchemy.orm.Query.filter` and
+    the dictionary to :meth:`sqlalchemy.orm.Query.params`. The names of
+    the bound parameters begin with `prefix`, which must therefore be
+    distinct for each list of filter objects applied to the same query.
+
+    The expressions are cached in :data:`filter_cache`, keyed by the
+    model and by the structure of `filters` (their field names,
+    operators, and Boolean connectives) without their values, so a
+    list of filter objects is parsed only the first time a list of the
+    same structure is seen. Filters that cannot be compiled with bound
+    parameters (for example, a comparison of a date to the string
+    ``'CURRENT_DATE'``) are parsed each time, as by
+    :func:`create_filters`, and the returned dictionary is empty.
+
+    `dialect` is the name of the database dialect on which the
+    expressions will be executed, if lists of values can be bound to a
+    single parameter on it (as returned by
+    :func:`.operators.value_list_dialect`). On such a dialect, a list of
+    at least `value_list_min_length` values (by default,
+    :data:`.operators.VALUE_LIST_MIN_LENGTH`) given to the ``in`` or
+    ``not_in`` operator is bound to a single parameter, instead of to
+    one parameter for each value.
+
+    This function raises the same exceptions as :func:`create_filters`.
+
+    """
+    values = []
+    min_length = value_list_min_length
+    shape = tuple(_shape(d, values, dialect, min_length) for d in filters)
+    if None not in shape:
+        key = (prefix, shape)
+        compiled = filter_cache.get(model, key)
+        if compiled is None:
+            compiled = _compile(model, filters, prefix, dialect, min_length)
+            filter_cache.put(model, key, compiled)
+        parameters = compiled.parameters(values)
+        if parameters is not None:
+            return compiled.expressions, parameters
+    return list(create_filters(model, filters)), {}
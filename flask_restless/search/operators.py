@@ -17,7 +17,24 @@ SQLAlchemy operation that can be used by the
 :exc:`.OperatorCreationError` exception is raised when there is a problem
 creating the expression.
 
+The :class:`ValueList` class represents the argument of an ``in`` or
+``not_in`` operator whose values are bound to a single parameter, using
+one of the strategies in :data:`VALUE_LIST_STRATEGIES`, if the
+:func:`value_list_dialect` function finds that the database supports it.
+
 """
+import json
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import __version__ as SQLALCHEMY_VERSION
+from sqlalchemy import bindparam
+from sqlalchemy import select
+from sqlalchemy import UnicodeText
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.sql import func
+from sqlalchemy.sql import literal_column
+from sqlalchemy.types import TypeDecorator
+
 #: Special symbol that represents the absence of a `val` element in a
 #: dictionary representing a filter object.
 NO_ARGUMENT = object()
@@ -103,11 +120,13 @@ def not_like(arg1, arg2):
 
 
 def in_(arg1, arg2):
+    if isinstance(arg2, ValueList):
+        return arg2.contains(arg1)
     return arg1.in_(arg2)
 
 
 def not_in(arg1, arg2):
-    return ~arg1.in_(arg2)
+    return ~in_(arg1, arg2)
 
 
 def has(arg1, arg2):
@@ -118,6 +137,195 @@ def any_(arg1, arg2):
     return arg1.any(arg2)
 
 
+class JSONList(TypeDecorator):
+    """A list of values of the SQLAlchemy type `item_type`, bound as a
+    JSON array.
+
+    Each element is converted as it would be if it were bound on its
+    own, so the elements of the array compare equal to the values stored
+    in a column of type `item_type`.
+
+    """
+
+    impl = UnicodeText
+
+    cache_ok = True
+
+    def __init__(self, item_type, *args, **kw):
+        super(JSONList, self).__init__(*args, **kw)
+        self.item_type = item_type
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        item_type = self.item_type.dialect_impl(dialect)
+        process = item_type.bind_processor(dialect)
+        if process is not None:
+            value = [process(item) for item in value]
+        # Values that JSON cannot represent, like decimals, are given as
+        # strings, which the database converts to the type of the column.
+        return json.dumps(value, default=str)
+
+
+def _select_value(from_clause):
+    """Returns a ``SELECT`` statement for the column named ``value`` of
+    the table-valued function `from_clause`.
+
+    """
+    column = literal_column('value')
+    # SQLAlchemy 1.4 and later accept (and 2.0 and later require) the
+    # columns of the statement as positional arguments.
+    if tuple(map(int, SQLALCHEMY_VERSION.split('.')[:2])) < (1, 4):
+        return select([column]).select_from(from_clause)
+    return select(column).select_from(from_clause)
+
+
+def any_array(field, name):
+    """Returns an expression that is true when `field` equals one of the
+    elements of the array bound to the parameter `name`.
+
+    This is rendered as ``field = ANY(:name)``, which PostgreSQL plans as
+    it would an ``IN`` list with one parameter for each element.
+
+    """
+    return field == func.any(bindparam(name, type_=ARRAY(field.type)))
+
+
+def json_each(field, name):
+    """Returns an expression that is true when `field` equals one of the
+    elements of the JSON array bound to the parameter `name`.
+
+    This is rendered as ``field IN (SELECT value FROM json_each(:name))``,
+    which requires the JSON functions of SQLite (built in to SQLite 3.38
+    and later, and available as an extension before that).
+
+    """
+    parameter = bindparam(name, type_=JSONList(field.type))
+    return field.in_(_select_value(func.json_each(parameter)))
+
+
+#: Functions that create an expression testing whether a field is in a
+#: list of values bound to a single parameter, keyed by the name of the
+#: database dialect on which they can be used.
+#:
+#: Each function accepts two arguments, the field and the name of the
+#: bound parameter. Lists of values compared to a field on other
+#: dialects, or with fewer than :data:`VALUE_LIST_MIN_LENGTH` elements,
+#: are bound with one parameter for each element.
+VALUE_LIST_STRATEGIES = {
+    'postgresql': any_array,
+    'sqlite': json_each,
+}
+
+
+def has_json_each(engine):
+    """Returns whether the SQLite library used by the DBAPI module of
+    `engine` provides the ``json_each`` function.
+
+    The check is made on a new in-memory database, so that it does not
+    affect any transaction in progress on a connection of `engine`.
+
+    """
+    dbapi = engine.dialect.dbapi
+    try:
+        connection = dbapi.connect(':memory:')
+    except Exception:
+        return False
+    try:
+        connection.execute("SELECT value FROM json_each('[]')")
+    except dbapi.Error:
+        return False
+    finally:
+        connection.close()
+    return True
+
+
+#: Functions that check whether the strategy in
+#: :data:`VALUE_LIST_STRATEGIES` for a database dialect can be used on a
+#: particular engine, keyed by the name of the dialect.
+#:
+#: Each function accepts the engine as its only argument. Strategies for
+#: dialects that do not appear here can always be used.
+VALUE_LIST_CHECKS = {
+    'sqlite': has_json_each,
+}
+
+#: The result of the check in :data:`VALUE_LIST_CHECKS` for each engine
+#: on which it has been made.
+_value_list_support = WeakKeyDictionary()
+
+
+def value_list_dialect(bind):
+    """Returns the name of the database dialect of `bind`, an engine or
+    a connection, if lists of values can be bound to a single parameter
+    on it, and ``None`` otherwise.
+
+    The check in :data:`VALUE_LIST_CHECKS` for the dialect, if any, is
+    made only once for each engine.
+
+    """
+    engine = bind.engine
+    dialect = engine.dialect.name
+    if dialect not in VALUE_LIST_STRATEGIES:
+        return None
+    check = VALUE_LIST_CHECKS.get(dialect)
+    if check is None:
+        return dialect
+    supported = _value_list_support.get(engine)
+    if supported is None:
+        supported = _value_list_support[engine] = check(engine)
+    return dialect if supported else None
+
+#: The default smallest number of values in the argument of an ``in`` or
+#: ``not_in`` operator for which the values are bound to a single
+#: parameter (see :data:`VALUE_LIST_STRATEGIES`). It can be changed for
+#: each API with the ``value_list_min_length`` keyword argument of
+#: :meth:`.APIManager.create_api`.
+#:
+#: With one parameter for each value, a long list makes the statement
+#: slow to plan, and may exceed the limit on the number of parameters in
+#: a statement (999 in versions of SQLite before 3.32).
+VALUE_LIST_MIN_LENGTH = 500
+
+
+class ValueList(object):
+    """The argument of an ``in`` or ``not_in`` operator whose values are
+    bound to a single parameter, instead of to one parameter each.
+
+    `name` is the name of the bound parameter and `dialect` is the name
+    of the database dialect on which the expression will be executed,
+    which must be a key of :data:`VALUE_LIST_STRATEGIES`.
+
+    """
+
+    def __init__(self, name, dialect):
+        self.name = name
+        self.dialect = dialect
+
+    def contains(self, field):
+        """Returns an expression that is true when `field` equals one of
+        the values bound to the parameter.
+
+        """
+        return VALUE_LIST_STRATEGIES[self.dialect](field, self.name)
+
+
+def uses_value_list(operator, values, dialect,
+                    min_length=VALUE_LIST_MIN_LENGTH):
+    """Returns whether the list `values`, given as the argument of the
+    operator named `operator`, should be bound to a single parameter (as
+    a :class:`ValueList`) on the database dialect named `dialect`.
+
+    `dialect` is as returned by :func:`value_list_dialect`, and lists
+    with fewer than `min_length` values are never bound to a single
+    parameter.
+
+    """
+    return (operator in ('in', 'not_in') and
+            dialect in VALUE_LIST_STRATEGIES and
+            len(values) >= min_length)
+
+
 #: Operator functions keyed by name.
 #:
 #: Each of these functions accepts either one or two arguments. The
@@ -20,19 +20,19 @@ The implementations here are closely coupled to the rest of the
 Flask-Restless code.
 
 """
+from collections import defaultdict
+from collections import namedtuple
 from datetime import date
 from datetime import datetime
 from datetime import time
 from datetime import timedelta
-try:
-    from urllib.parse import urljoin
-except ImportError:
-    from urlparse import urljoin
+from decimal import Decimal
 
-from flask import request
 from sqlalchemy.exc import NoInspectionAvailable
-from sqlalchemy.ext.hybrid import HYBRID_PROPERTY
 from sqlalchemy.inspection import inspect
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.interfaces import MANYTOONE
+from sqlalchemy.types import TypeDecorator
 from werkzeug.routing import BuildError
 from werkzeug.urls import url_quote_plus
 
@@ -45,8 +45,10 @@ from ..helpers import get_related_model
 from ..helpers import get_relations
 from ..helpers import is_like_list
 from ..helpers import is_mapped_class
+from ..helpers import model_info
 from ..helpers import primary_key_for
 from ..helpers import primary_key_value
+from ..helpers import primary_key_string
 from ..helpers import serializer_for
 from ..helpers import url_for
 
@@ -58,6 +60,84 @@ COLUMN_BLACKLIST = ('_sa_polymorphic_on', )
 #: Flask-Restless.
 JSONAPI_VERSION = '1.0'
 
+#: The maximum number of serialization plans cached by each serializer.
+#:
+#: A plan is computed for each model and each sparse fieldset requested
+#: by a client; when this many plans have been cached, the cache is
+#: emptied.
+MAX_CACHED_PLANS = 256
+
+#: The maximum number of primary keys of instances bound as parameters
+#: of a single query that computes the resource linkage of a
+#: relationship for many instances.
+#:
+#: This is below the limit on the number of parameters in a statement
+#: imposed by some databases (999 in older versions of SQLite).
+MAX_LINKAGE_IDS = 500
+
+#: The Python types of column values that can be encoded as JSON as they
+#: are, without conversion by the serializer.
+#:
+#: TODO In Python 3, this can just be ``str`` instead of the type of a
+#: Unicode literal.
+SIMPLE_TYPES = frozenset([bool, bytes, Decimal, float, int, str, type(u'')])
+
+#: A tuple that stores the precomputed work required to serialize an
+#: instance of a particular model with a particular sparse fieldset.
+#:
+#: The elements are, in order,
+#:
+#: - `attributes`, a tuple of pairs, each containing the name of an
+#:   attribute to include in the resource object and either ``None`` or
+#:   a function that converts the value of that attribute to a value
+#:   that can be encoded as JSON,
+#: - `relations`, a tuple of the names of the relationships to include in
+#:   the resource object,
+#: - `self_link`, whether to include a self link in the resource object,
+#: - `columns`, a frozenset of the names of the column attributes whose
+#:   values are included in the resource object, or ``None`` if the
+#:   value of some included attribute may depend on any column.
+#:
+SerializationPlan = namedtuple('SerializationPlan', ['attributes', 'relations',
+                                                     'self_link', 'columns'])
+
+#: A tuple that stores the precomputed work required by
+#: :class:`RowSerializer` to serialize rows of the columns of a
+#: particular model with a particular sparse fieldset.
+#:
+#: The elements are, in order,
+#:
+#: - `keys`, a tuple of the names of the column attributes to select;
+#:   the first is always the primary key column of the table,
+#: - `id_index`, the index in each row of the attribute used as the ID
+#:   of the resource,
+#: - `attributes`, a tuple of triples, each containing the name of an
+#:   attribute to include in the resource object, the index of its value
+#:   in each row, and either ``None`` or a function that converts that
+#:   value to a value that can be encoded as JSON,
+#: - `relations`, a tuple of :data:`RowRelation` objects, one for each
+#:   relationship to include in the resource object,
+#: - `self_link`, whether to include a self link in the resource object.
+#:
+RowPlan = namedtuple('RowPlan', ['keys', 'id_index', 'attributes',
+                                 'relations', 'self_link'])
+
+#: A tuple that describes how to compute a relationship object from a row.
+#:
+#: The elements are, in order,
+#:
+#: - `name`, the name of the relationship,
+#: - `foreign_key_index`, the index in each row of the foreign key from
+#:   which the resource linkage can be built, or ``None``,
+#: - `linkage_plan`, if `foreign_key_index` is ``None``, the plan for
+#:   computing the resource linkage with one query for all rows,
+#: - `related_type`, the type of the related resources,
+#: - `related_link`, whether to include a related link.
+#:
+RowRelation = namedtuple('RowRelation', ['name', 'foreign_key_index',
+                                         'linkage_plan', 'related_type',
+                                         'related_link'])
+
 
 # TODO In Python 2.7 or later, we can just use `timedelta.total_seconds()`.
 if hasattr(timedelta, 'total_seconds'):
@@ -71,7 +151,233 @@ else:
         return (td.microseconds + secs * 10**6) / 10**6
 
 
-def create_relationship(model, instance, relation):
+def _isoformat(value):
+    return None if value is None else value.isoformat()
+
+
+def _total_seconds(value):
+    return None if value is None else total_seconds(value)
+
+
+def is_simple(column_property):
+    """Decides whether the values of the given column property are
+    always of one of the :data:`SIMPLE_TYPES`, and so need no
+    conversion before being encoded as JSON.
+
+    `column_property` is a
+    :class:`~sqlalchemy.orm.properties.ColumnProperty`, for example, an
+    element of the ``column_attrs`` of a SQLAlchemy mapper.
+
+    The values of a column whose type is a user-defined
+    :class:`~sqlalchemy.types.TypeDecorator` are never considered
+    simple, since the decorator may return values of any type.
+
+    """
+    if len(column_property.columns) != 1:
+        return False
+    column_type = column_property.columns[0].type
+    if isinstance(column_type, TypeDecorator):
+        return False
+    try:
+        python_type = column_type.python_type
+    except NotImplementedError:
+        return False
+    return python_type in SIMPLE_TYPES
+
+
+def row_converter(column_property, default):
+    """Returns a function that converts the values of the given column
+    property to values that can be encoded as JSON, based on the type of
+    the column.
+
+    If the type of the column does not determine a more specific
+    conversion, `default` is returned.
+
+    """
+    if len(column_property.columns) != 1:
+        return default
+    column_type = column_property.columns[0].type
+    if isinstance(column_type, TypeDecorator):
+        return default
+    try:
+        python_type = column_type.python_type
+    except NotImplementedError:
+        return default
+    if python_type in (date, datetime, time):
+        return _isoformat
+    if python_type is timedelta:
+        return _total_seconds
+    return default
+
+
+def to_one_foreign_key(model, relation):
+    """Returns the name of the attribute of `model` that holds the
+    primary key of the resource related via the to-one relationship
+    named `relation`, or ``None`` if there is no such attribute.
+
+    If this function returns the name of an attribute, the resource
+    linkage of the relationship can be built from the value of that
+    (foreign key) attribute, without loading the related instance.
+    This is possible only for a many-to-one relationship with a single
+    foreign key column that refers to the column used as the primary
+    key of the related resource, and only if the related model is not
+    polymorphic (otherwise the type of the related resource cannot be
+    known without loading it).
+
+    """
+    mapper = inspect(model)
+    if relation not in mapper.relationships:
+        return None
+    prop = mapper.relationships[relation]
+    if prop.direction is not MANYTOONE or prop.secondary is not None:
+        return None
+    if len(prop.local_remote_pairs) != 1:
+        return None
+    local_column, remote_column = prop.local_remote_pairs[0]
+    related_mapper = prop.mapper
+    if len(list(related_mapper.self_and_descendants)) > 1:
+        return None
+    try:
+        related_primary_key = primary_key_for(related_mapper.class_)
+    except ValueError:
+        return None
+    related_props = related_mapper.column_attrs
+    if related_primary_key not in related_props:
+        return None
+    if related_props[related_primary_key].columns != [remote_column]:
+        return None
+    for column_prop in mapper.column_attrs:
+        if column_prop.columns == [local_column]:
+            return column_prop.key
+    return None
+
+
+def _bulk_linkage_plan(model, relation):
+    """Returns the information required to compute the resource linkage
+    of the relationship named `relation` for many instances of `model`
+    with a single query, or ``None`` if that is not possible.
+
+    The returned value is a four-tuple containing the relationship
+    property, the (possibly aliased) related model to join, the type of
+    the related resources, and the name of their primary key.
+
+    """
+    mapper = inspect(model)
+    if relation not in mapper.relationships or len(mapper.primary_key) != 1:
+        return None
+    # The resource linkage of some to-one relationships can be computed
+    # from a foreign key of each instance, which is cheaper still.
+    if to_one_foreign_key(model, relation) is not None:
+        return None
+    prop = mapper.relationships[relation]
+    related_mapper = prop.mapper
+    related_model = related_mapper.class_
+    # The type of each related resource is the same only if the related
+    # model has no subclasses.
+    if len(list(related_mapper.self_and_descendants)) > 1:
+        return None
+    # If an API has not been created for the related model, we let
+    # `create_relationship()` raise the exception for each instance.
+    try:
+        related_type = collection_name(related_model)
+        related_primary_key = primary_key_for(related_model)
+    except ValueError:
+        return None
+    # If the relationship refers to the same table (for example, a
+    # self-referential relationship), the related model must be aliased
+    # in the join. In that case, the `order_by` of the relationship,
+    # which refers to the unaliased table, cannot be used.
+    if set(mapper.tables) & set(related_mapper.tables):
+        if prop.order_by:
+            return None
+        related = aliased(related_model)
+    else:
+        related = related_model
+    return prop, related, related_type, related_primary_key
+
+
+def _bulk_linkage(session, model, relation, plan, ids):
+    """Returns a dictionary mapping the identity of each instance of
+    `model` whose primary key is in `ids` to the resource linkage of its
+    relationship named `relation`.
+
+    `plan` is the value returned by :func:`_bulk_linkage_plan`.
+
+    The resource linkage is computed with one query for every
+    :data:`MAX_LINKAGE_IDS` primary keys in `ids`.
+
+    """
+    prop, related, related_type, related_primary_key = plan
+    local_key = inspect(model).primary_key[0]
+    remote_key = getattr(related, related_primary_key)
+    query = session.query(local_key, remote_key).select_from(model)
+    query = query.join(related, getattr(model, relation))
+    if prop.order_by:
+        query = query.order_by(*prop.order_by)
+    else:
+        query = query.order_by(remote_key)
+    # TODO In Python 2.7 and later, this should be a dict comprehension.
+    if prop.uselist:
+        result = dict(((id_, ), []) for id_ in ids)
+    else:
+        result = dict(((id_, ), None) for id_ in ids)
+    # Each primary key is a separate bound parameter of the query, and
+    # databases limit the number of parameters in a single statement.
+    for start in range(0, len(ids), MAX_LINKAGE_IDS):
+        chunk = ids[start:start + MAX_LINKAGE_IDS]
+        for local_id, remote_id in query.filter(local_key.in_(chunk)):
+            identifier = {'id': primary_key_string(remote_id),
+                          'type': related_type}
+            if prop.uselist:
+                result[(local_id, )].append(identifier)
+            else:
+                result[(local_id, )] = identifier
+    return result
+
+
+def relationship_linkage(model, instances, relation):
+    """Returns the resource linkage of the relationship named `relation`
+    for each of the given instances of `model`, computed with a single
+    database query.
+
+    `model` is the model class of the primary resources.
+
+    `instances` is an iterable of instances of `model`.
+
+    `relation` is the name of a relationship of `model` given as a
+    string.
+
+    This function returns a dictionary mapping the identity of an
+    instance (as given by :attr:`sqlalchemy.orm.state.InstanceState.identity`)
+    to its resource linkage: a list of resource identifier objects for
+    a to-many relationship, or a single resource identifier object (or
+    ``None``) for a to-one relationship.
+
+    Only persistent instances whose relationship has not already been
+    loaded appear in the returned dictionary; the resource linkage of
+    any other instance can be computed from the related value without
+    an additional query. If the resource linkage cannot be computed in
+    bulk at all (for example, if `relation` names an association proxy,
+    or if the related model is polymorphic), the returned dictionary is
+    empty.
+
+    """
+    plan = _bulk_linkage_plan(model, relation)
+    if plan is None:
+        return {}
+    states = [inspect(instance) for instance in instances]
+    states = [state for state in states
+              if state.key is not None and relation in state.unloaded]
+    if not states:
+        return {}
+    session = states[0].session
+    if session is None:
+        return {}
+    ids = [state.identity[0] for state in states]
+    return _bulk_linkage(session, model, relation, plan, ids)
+
+
+def create_relationship(model, instance, relation, linkage=None):
     """Creates a relationship from the given relation name.
 
     Returns a dictionary representing a relationship as described in
@@ -86,6 +392,11 @@ def create_relationship(model, instance, relation):
     `relation` is the name of the relation of `instance` given as a
     string.
 
+    `linkage` is an optional dictionary as returned by
+    :func:`relationship_linkage`. If the identity of `instance` appears
+    in it, the resource linkage is taken from there instead of being
+    computed from the (possibly not yet loaded) related value.
+
     This function may raise :exc:`ValueError` if an API has not been
     created for the primary model, `model`, or the model of the
     relation.
@@ -109,6 +420,28 @@ def create_relationship(model, instance, relation):
         pass
     else:
         result['links']['related'] = related_link
+    # If the resource linkage has already been computed along with that
+    # of other instances, there is no need to load the related value.
+    state = inspect(instance)
+    if linkage:
+        identity = state.identity
+        if identity in linkage:
+            result['data'] = linkage[identity]
+            return result
+    # For a many-to-one relationship, the primary key of the related
+    # resource may already be known from the foreign key of `instance`,
+    # in which case there is no need to load the related value.
+    if relation in state.unloaded:
+        foreign_key = to_one_foreign_key(model, relation)
+        if foreign_key is not None and foreign_key not in state.unloaded:
+            related_id = getattr(instance, foreign_key)
+            if related_id is None:
+                result['data'] = None
+            else:
+                related_type = collection_name(related_model)
+                result['data'] = {'id': primary_key_string(related_id),
+                                  'type': related_type}
+            return result
     # Get the related value so we can see if it is a to-many
     # relationship or a to-one relationship.
     related_value = getattr(instance, relation)
@@ -199,6 +532,22 @@ class Serializer(object):
         """
         raise NotImplementedError
 
+    def columns_to_load(self, model, only=None):
+        """Returns the names of the column attributes of `model` whose
+        values are needed to serialize instances of `model`, or ``None``
+        if the values of all columns may be needed.
+
+        `only` is as in :meth:`serialize`. Columns not named in the
+        returned collection need not be loaded from the database when
+        fetching the instances to serialize. Primary key and foreign key
+        columns are always loaded, so they need not be named.
+
+        This base class returns ``None``. Subclasses may override this
+        method to avoid loading columns that will not be serialized.
+
+        """
+        return None
+
 
 class DefaultSerializer(Serializer):
     """A default implementation of a JSON API serializer for SQLAlchemy
@@ -257,61 +606,122 @@ class DefaultSerializer(Serializer):
         self.default_fields = only
         self.exclude = exclude
         self.additional_attributes = additional_attributes
+        #: A dictionary mapping a pair containing a model and a sparse
+        #: fieldset to the :data:`SerializationPlan` for that model.
+        self._plans = {}
+
+    def _plan(self, model, only=None):
+        """Returns the :data:`SerializationPlan` for instances of `model`
+        given the `only` list provided to :meth:`_dump`.
+
+        Plans are computed once per model and sparse fieldset and cached
+        on this serializer. This method may raise
+        :exc:`~sqlalchemy.exc.NoInspectionAvailable` if `model` is not
+        a SQLAlchemy model.
 
-    def _dump(self, instance, only=None):
+        """
         # Always include at least the type and ID, regardless of what
         # the user requested.
         if only is not None:
             # TODO In Python 2.7 or later, this should be a set literal.
-            only = set(only) | set(['type', 'id'])
-        model = type(instance)
+            only = frozenset(only) | frozenset(['type', 'id'])
+        key = (model, only)
         try:
-            inspected_instance = inspect(model)
-        except NoInspectionAvailable:
-            message = 'failed to get columns for model {0}'.format(model)
-            raise SerializationException(instance, message=message)
-        column_attrs = inspected_instance.column_attrs.keys()
-        descriptors = inspected_instance.all_orm_descriptors.items()
-        # hybrid_columns = [k for k, d in descriptors
-        #                   if d.extension_type == hybrid.HYBRID_PROPERTY
-        #                   and not (deep and k in deep)]
-        hybrid_columns = [k for k, d in descriptors
-                          if d.extension_type == HYBRID_PROPERTY]
-        columns = column_attrs + hybrid_columns
+            return self._plans[key]
+        except KeyError:
+            pass
+        plan = self._compile(model, only)
+        # Clients choose the sparse fieldsets, so don't let the cache
+        # grow without bound.
+        if len(self._plans) >= MAX_CACHED_PLANS:
+            self._plans.clear()
+        self._plans[key] = plan
+        return plan
+
+    def _compile(self, model, only):
+        """Computes the :data:`SerializationPlan` for instances of
+        `model`.
+
+        `only` is either ``None`` or a set of field names that includes
+        ``'type'`` and ``'id'``.
+
+        """
+        column_attrs = inspect(model).column_attrs
+        hybrid_columns = list(model_info(model).hybrid_properties)
+        columns = column_attrs.keys() + hybrid_columns
         # Also include any attributes specified by the user.
         if self.additional_attributes is not None:
             columns += self.additional_attributes
-
         # Only include fields allowed by the user during the instantiation of
         # this object.
         if self.default_fields is not None:
-            columns = (c for c in columns if c in self.default_fields)
+            columns = [c for c in columns if c in self.default_fields]
         # If `only` is a list, only include those columns that are in the list.
         if only is not None:
-            columns = (c for c in columns if c in only)
-
+            columns = [c for c in columns if c in only]
         # Exclude columns specified by the user during the instantiation of
         # this object.
         if self.exclude is not None:
-            columns = (c for c in columns if c not in self.exclude)
+            columns = [c for c in columns if c not in self.exclude]
         # Exclude column names that are blacklisted.
-        columns = (c for c in columns
-                   if not c.startswith('__') and c not in COLUMN_BLACKLIST)
+        columns = [c for c in columns
+                   if not c.startswith('__') and c not in COLUMN_BLACKLIST]
         # Exclude column names that are foreign keys.
         foreign_key_columns = foreign_keys(model)
-        columns = (c for c in columns if c not in foreign_key_columns)
+        columns = [c for c in columns if c not in foreign_key_columns]
+        # Choose how to convert the value of each attribute. The value
+        # of a column whose type is known to hold only simple values
+        # needs no conversion at all.
+        attributes = []
+        for column in columns:
+            if column in column_attrs and is_simple(column_attrs[column]):
+                convert = None
+            else:
+                convert = self._convert
+            attributes.append((column, convert))
+        # Determine the columns whose values must be loaded in order to
+        # serialize an instance. The value of a hybrid property or an
+        # additional attribute may depend on any column, so in that case
+        # all of them must be loaded.
+        names = [name for name, convert in attributes]
+        if all(name in column_attrs for name in names):
+            loaded_columns = frozenset(names)
+        else:
+            loaded_columns = None
+        # Add the self link unless it has been explicitly excluded.
+        is_self_in_default = (self.default_fields is None or
+                              'self' in self.default_fields)
+        is_self_in_only = only is None or 'self' in only
+        self_link = is_self_in_default and is_self_in_only
+        # If there are relations to convert to dictionary form, put them into a
+        # special `links` key as required by JSON API.
+        relations = get_relations(model)
+        if self.default_fields is not None:
+            relations = [r for r in relations if r in self.default_fields]
+        # Only consider those relations listed in `only`.
+        if only is not None:
+            relations = [r for r in relations if r in only]
+        # Exclude relations specified by the user during the instantiation of
+        # this object.
+        if self.exclude is not None:
+            relations = [r for r in relations if r not in self.exclude]
+        return SerializationPlan(tuple(attributes), tuple(relations),
+                                 self_link, loaded_columns)
 
-        # Create a dictionary mapping attribute name to attribute value for
-        # this particular instance.
-        #
-        # TODO In Python 2.7 and later, this should be a dict comprehension.
-        attributes = dict((column, getattr(instance, column))
-                          for column in columns)
+    def columns_to_load(self, model, only=None):
+        try:
+            return self._plan(model, only=only).columns
+        except NoInspectionAvailable:
+            return None
+
+    def _convert(self, value):
+        """Converts the value of an attribute to a value that can be
+        encoded as JSON.
+
+        """
         # Call any functions that appear in the result.
-        #
-        # TODO In Python 2.7 and later, this should be a dict comprehension.
-        attributes = dict((k, (v() if callable(v) else v))
-                          for k, v in attributes.items())
+        if callable(value):
+            value = value()
         # Serialize any date- or time-like objects that appear in the
         # attributes.
         #
@@ -323,33 +733,49 @@ class DefaultSerializer(Serializer):
         # the `jsonify` function, for example). However, we should not
         # rely on that JSON encoder since the user could set any crazy
         # encoder on the Flask application.
-        for key, val in attributes.items():
-            if isinstance(val, (date, datetime, time)):
-                attributes[key] = val.isoformat()
-            elif isinstance(val, timedelta):
-                attributes[key] = total_seconds(val)
+        if isinstance(value, (date, datetime, time)):
+            return value.isoformat()
+        if isinstance(value, timedelta):
+            return total_seconds(value)
         # Recursively serialize any object that appears in the
         # attributes. This may happen if, for example, the return value
         # of one of the callable functions is an instance of another
         # SQLAlchemy model class.
-        for key, val in attributes.items():
-            # This is a bit of a fragile test for whether the object
-            # needs to be serialized: we simply check if the class of
-            # the object is a mapped class.
-            if is_mapped_class(type(val)):
-                model_ = get_model(val)
-                try:
-                    serializer = serializer_for(model_)
-                    serialized_val = serializer.serialize(val)
-                except ValueError:
-                    # TODO Should this cause an exception, or fail
-                    # silently? See similar comments in `views/base.py`.
-                    # # raise SerializationException(instance)
-                    serialized_val = simple_serialize(val)
-                # We only need the data from the JSON API document, not
-                # the metadata. (So really the serializer is doing more
-                # work than it needs to here.)
-                attributes[key] = serialized_val['data']
+        #
+        # This is a bit of a fragile test for whether the object needs
+        # to be serialized: we simply check if the class of the object
+        # is a mapped class.
+        if is_mapped_class(type(value)):
+            model = get_model(value)
+            try:
+                serializer = serializer_for(model)
+                serialized_value = serializer.serialize(value)
+            except ValueError:
+                # TODO Should this cause an exception, or fail
+                # silently? See similar comments in `views/base.py`.
+                # # raise SerializationException(instance)
+                serialized_value = simple_serialize(value)
+            # We only need the data from the JSON API document, not
+            # the metadata. (So really the serializer is doing more
+            # work than it needs to here.)
+            return serialized_value['data']
+        return value
+
+    def _dump(self, instance, only=None, _linkage=None):
+        model = type(instance)
+        try:
+            plan = self._plan(model, only=only)
+        except NoInspectionAvailable:
+            message = 'failed to get columns for model {0}'.format(model)
+            raise SerializationException(instance, message=message)
+        # Create a dictionary mapping attribute name to attribute value for
+        # this particular instance.
+        attributes = {}
+        for name, convert in plan.attributes:
+            value = getattr(instance, name)
+            if convert is not None:
+                value = convert(value)
+            attributes[name] = value
         # Get the ID and type of the resource.
         id_ = attributes.pop('id')
         type_ = collection_name(model)
@@ -357,11 +783,7 @@ class DefaultSerializer(Serializer):
         result = dict(id=id_, type=type_)
         if attributes:
             result['attributes'] = attributes
-        # Add the self link unless it has been explicitly excluded.
-        is_self_in_default = (self.default_fields is None or
-                              'self' in self.default_fields)
-        is_self_in_only = only is None or 'self' in only
-        if is_self_in_default and is_self_in_only:
+        if plan.self_link:
             instance_id = primary_key_value(instance)
             # `url_for` may raise a `BuildError` if the user has not created a
             # GET API endpoint for this model. In this case, we simply don't
@@ -371,23 +793,12 @@ class DefaultSerializer(Serializer):
             # `current_app.build_error_handler` attribute, in which case, the
             # exception may not be raised.
             try:
-                path = url_for(model, instance_id, _method='GET')
+                url = url_for(model, instance_id, _method='GET',
+                              _absolute_url=True)
             except BuildError:
                 pass
             else:
-                url = urljoin(request.url_root, path)
                 result['links'] = dict(self=url)
-        # # add any included methods
-        # if include_methods is not None:
-        #     for method in include_methods:
-        #         if '.' not in method:
-        #             value = getattr(instance, method)
-        #             # Allow properties and static attributes in
-        #             # include_methods
-        #             if callable(value):
-        #                 value = value()
-        #             result[method] = value
-
         # If the primary key is not named "id", we'll duplicate the
         # primary key under the "id" key.
         pk_name = primary_key_for(model)
@@ -402,25 +813,18 @@ class DefaultSerializer(Serializer):
                 result['id'] = str(result['id'])
             except UnicodeEncodeError:
                 result['id'] = url_quote_plus(result['id'].encode('utf-8'))
-        # If there are relations to convert to dictionary form, put them into a
-        # special `links` key as required by JSON API.
-        relations = get_relations(model)
-        if self.default_fields is not None:
-            relations = [r for r in relations if r in self.default_fields]
-        # Only consider those relations listed in `only`.
-        if only is not None:
-            relations = [r for r in relations if r in only]
-        # Exclude relations specified by the user during the instantiation of
-        # this object.
-        if self.exclude is not None:
-            relations = [r for r in relations if r not in self.exclude]
-        if not relations:
+        if not plan.relations:
             return result
+        # `_linkage` maps relation name to the resource linkage computed
+        # by `serialize_many()` for all instances at once.
+        if _linkage is None:
+            _linkage = {}
         # For the sake of brevity, rename this function.
         cr = create_relationship
         # TODO In Python 2.7 and later, this should be a dict comprehension.
-        result['relationships'] = dict((rel, cr(model, instance, rel))
-                                       for rel in relations)
+        result['relationships'] = dict((rel, cr(model, instance, rel,
+                                                _linkage.get(rel)))
+                                       for rel in plan.relations)
         return result
 
     def serialize(self, instance, only=None):
@@ -458,18 +862,39 @@ class DefaultSerializer(Serializer):
         return result
 
     def serialize_many(self, instances, only=None):
-        # Here we are assuming the iterable of instances is homogeneous
-        # (i.e. each instance is of the same type).
-        #
         # Since loading each instance from a given resource object
         # representation could theoretically raise a
         # DeserializationException, we collect all the errors and wrap
         # them in a MultipleExceptions exception object.
+        #
+        # Instead of loading the related values of each instance in
+        # turn, we compute the resource linkage of each relationship for
+        # all instances of a model with one query per relationship. The
+        # instances need not all be of the same model (for example, if
+        # the model is polymorphic), so they are grouped by model first.
+        instances = list(instances)
+        instances_by_model = defaultdict(list)
+        for instance in instances:
+            instances_by_model[get_model(instance)].append(instance)
+        linkages = {}
+        for model, group in instances_by_model.items():
+            try:
+                relations = self._plan(model, only=only).relations
+            except NoInspectionAvailable:
+                # Let `_dump()` report the error for each instance.
+                relations = ()
+            # TODO In Python 2.7 and later, this should be a dict
+            # comprehension.
+            linkages[model] = dict((relation,
+                                    relationship_linkage(model, group,
+                                                         relation))
+                                   for relation in relations)
         resources = []
         failed = []
         for instance in instances:
+            linkage = linkages[get_model(instance)]
             try:
-                resource = self._dump(instance, only=only)
+                resource = self._dump(instance, only=only, _linkage=linkage)
                 resources.append(resource)
             except SerializationException as exception:
                 failed.append(exception)
@@ -480,6 +905,202 @@ class DefaultSerializer(Serializer):
         return result
 
 
+class RowSerializer(DefaultSerializer):
+    """A serializer that can build resource objects directly from the
+    rows of a query, without constructing instances of the model.
+
+    Instances of this class behave exactly like instances of
+    :class:`DefaultSerializer`. In addition, the
+    :meth:`serialize_query` method selects only the columns needed to
+    serialize the requested fields and builds each resource object from
+    a result row, which avoids the cost of creating instances, adding
+    them to the identity map of the session, and accessing instrumented
+    attributes.
+
+    """
+
+    def __init__(self, *args, **kw):
+        super(RowSerializer, self).__init__(*args, **kw)
+
+        #: A mapping from model and sparse fieldset to the
+        #: :data:`RowPlan` for that model, or ``None`` if rows of that
+        #: model cannot be serialized.
+        self._row_plans = {}
+
+    def _row_plan(self, model, only=None):
+        """Returns the :data:`RowPlan` for rows of `model` given the
+        `only` list provided to :meth:`serialize_query`, or ``None`` if
+        such rows cannot be serialized without instances of `model`.
+
+        Plans are cached in the same way as in :meth:`_plan`.
+
+        """
+        if only is not None:
+            # TODO In Python 2.7 or later, this should be a set literal.
+            only = frozenset(only) | frozenset(['type', 'id'])
+        key = (model, only)
+        try:
+            return self._row_plans[key]
+        except KeyError:
+            pass
+        try:
+            plan = self._compile_rows(model, only)
+        except (NoInspectionAvailable, ValueError):
+            plan = None
+        if len(self._row_plans) >= MAX_CACHED_PLANS:
+            self._row_plans.clear()
+        self._row_plans[key] = plan
+        return plan
+
+    def _compile_rows(self, model, only):
+        """Computes the :data:`RowPlan` for rows of `model`, or returns
+        ``None`` if rows of `model` cannot be serialized.
+
+        This method may raise :exc:`ValueError` if no API has been
+        created for `model`.
+
+        """
+        plan = self._plan(model, only=only)
+        # The value of a hybrid property or an additional attribute may
+        # require an instance of the model.
+        if plan.columns is None or 'id' not in plan.columns:
+            return None
+        mapper = inspect(model)
+        if mapper.polymorphic_on is not None or len(mapper.primary_key) != 1:
+            return None
+        column_attrs = mapper.column_attrs
+        primary_key = primary_key_for(model)
+        if primary_key not in column_attrs:
+            return None
+        keys = [mapper.get_property_by_column(mapper.primary_key[0]).key]
+
+        def index(key):
+            if key not in keys:
+                keys.append(key)
+            return keys.index(key)
+
+        # Choose how to convert the value of each column once for its
+        # type, instead of inspecting each value.
+        attributes = []
+        for name, convert in plan.attributes:
+            if convert is not None:
+                convert = row_converter(column_attrs[name], convert)
+            attributes.append((name, index(name), convert))
+        relations = []
+        for relation in plan.relations:
+            if relation not in mapper.relationships:
+                return None
+            related_model = get_related_model(model, relation)
+            foreign_key = to_one_foreign_key(model, relation)
+            if foreign_key is not None:
+                foreign_key_index = index(foreign_key)
+                linkage_plan = None
+                related_type = collection_name(related_model)
+            else:
+                linkage_plan = _bulk_linkage_plan(model, relation)
+                if linkage_plan is None:
+                    return None
+                foreign_key_index = None
+                related_type = linkage_plan[2]
+            # As in `create_relationship()`, only provide a related link
+            # if an API has been created for the related model.
+            try:
+                url_for(related_model)
+            except ValueError:
+                related_link = False
+            else:
+                related_link = True
+            relations.append(RowRelation(relation, foreign_key_index,
+                                         linkage_plan, related_type,
+                                         related_link))
+        return RowPlan(tuple(keys), index(primary_key), tuple(attributes),
+                       tuple(relations), plan.self_link)
+
+    def serialize_query(self, model, query, only=None):
+        """Returns a complete JSON API document as a dictionary
+        containing the resource object representation of each instance
+        of `model` that would be returned by `query` as its primary
+        data, as :meth:`serialize_many` would.
+
+        `query` is a SQLAlchemy query whose sole entity is `model`. It
+        is executed with its entity replaced by only the columns needed
+        to serialize the requested fields, and the resource objects are
+        built from the result rows. The resource linkage of each to-many
+        relationship is computed with one additional query.
+
+        `only` is as in :meth:`serialize_many`.
+
+        If the resource objects cannot be built from rows (for example,
+        if a hybrid property or an additional attribute has been
+        requested, or if the resource linkage of a relationship cannot
+        be computed in bulk), this method returns ``None`` without
+        executing `query`.
+
+        """
+        plan = self._row_plan(model, only=only)
+        if plan is None:
+            return None
+        columns = [getattr(model, key) for key in plan.keys]
+        rows = query.with_entities(*columns).all()
+        # Compute the resource linkage of the relationships that cannot
+        # be computed from a foreign key.
+        ids = [row[0] for row in rows]
+        # TODO In Python 2.7 and later, this should be a dict
+        # comprehension.
+        linkage = dict((relation.name,
+                        _bulk_linkage(query.session, model, relation.name,
+                                      relation.linkage_plan, ids))
+                       for relation in plan.relations
+                       if relation.linkage_plan is not None and ids)
+        type_ = collection_name(model)
+        resources = []
+        for row in rows:
+            attributes = {}
+            for name, i, convert in plan.attributes:
+                value = row[i]
+                if convert is not None:
+                    value = convert(value)
+                attributes[name] = value
+            del attributes['id']
+            instance_id = row[plan.id_index]
+            resource = dict(id=primary_key_string(instance_id), type=type_)
+            if attributes:
+                resource['attributes'] = attributes
+            if plan.self_link:
+                try:
+                    url = url_for(model, instance_id, _method='GET',
+                                  _absolute_url=True)
+                except BuildError:
+                    pass
+                else:
+                    resource['links'] = dict(self=url)
+            if not plan.relations:
+                resources.append(resource)
+                continue
+            relationships = {}
+            for relation in plan.relations:
+                name = relation.name
+                links = {'self': url_for(model, instance_id, name,
+                                         relationship=True)}
+                if relation.related_link:
+                    links['related'] = url_for(model, instance_id, name)
+                if relation.foreign_key_index is None:
+                    data = linkage[name][(row[0], )]
+                else:
+                    related_id = row[relation.foreign_key_index]
+                    if related_id is None:
+                        data = None
+                    else:
+                        data = {'id': primary_key_string(related_id),
+                                'type': relation.related_type}
+                relationships[name] = {'links': links, 'data': data}
+            resource['relationships'] = relationships
+            resources.append(resource)
+        result = JsonApiDocument()
+        result['data'] = resources
+        return result
+
+
 class HeterogeneousSerializer(DefaultSerializer):
     """A serializer for heterogeneous collections of instances (that is,
     collections in which each instance is of a different type).
@@ -18,7 +18,9 @@ that do most of the work.
 
 """
 from .base import CONTENT_TYPE
+from .base import COUNT_POLICIES
 from .base import ProcessingException
+from .helpers import CountCache
 from .resources import API
 from .relationships import RelationshipAPI
 from .function import FunctionAPI
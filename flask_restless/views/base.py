@@ -25,6 +25,7 @@ from functools import wraps
 from itertools import chain
 import math
 import re
+from types import GeneratorType
 # In Python 3...
 try:
     from urllib.parse import urlparse
@@ -38,9 +39,11 @@ from flask import current_app
 from flask import json
 from flask import jsonify
 from flask import request
+from flask import stream_with_context
 from flask.views import MethodView
 from mimerender import FlaskMimeRender
 from mimerender import register_mime
+from sqlalchemy.exc import InvalidRequestError
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm.exc import MultipleResultsFound
 from sqlalchemy.orm.exc import NoResultFound
@@ -56,11 +59,18 @@ from ..helpers import is_relationship
 from ..helpers import primary_key_for
 from ..helpers import primary_key_value
 from ..helpers import serializer_for
+from ..helpers import string_to_datetime
 from ..helpers import url_for
+from ..json_backends import FLASK_JSON
+from ..search import count_query
+from ..search import count_relationship_query
 from ..search import FilterCreationError
 from ..search import FilterParsingError
+from ..search import keyset_keys
 from ..search import search
 from ..search import search_relationship
+from ..search import seek
+from ..search.operators import VALUE_LIST_MIN_LENGTH
 from ..serialization import DeserializationException
 from ..serialization import JsonApiDocument
 from ..serialization import MultipleExceptions
@@ -68,7 +78,15 @@ from ..serialization import simple_heterogeneous_serialize_many
 from ..serialization import simple_relationship_serialize
 from ..serialization import simple_relationship_serialize_many
 from ..serialization import SerializationException
+from .helpers import chunks
 from .helpers import count
+from .helpers import CountCache
+from .helpers import decode_cursor
+from .helpers import encode_cursor
+from .helpers import estimated_count
+from .helpers import has_results
+from .helpers import page_query
+from .helpers import page_and_count
 from .helpers import upper_keys as upper
 
 #: String used internally as a dictionary key for passing header information
@@ -79,6 +97,24 @@ _HEADERS = '__restless_headers'
 #: information from view functions to the :func:`jsonpify` function.
 _STATUS = '__restless_status_code'
 
+#: String used internally as a dictionary key for telling the
+#: :func:`jsonpify` function to stream the response to the client.
+_STREAM = '__restless_stream'
+
+#: The name of the attribute of the current request in which the view
+#: handling the request stores its JSON backend, so that it is available
+#: to the :func:`jsonpify` function.
+_JSON_BACKEND = '_restless_json_backend'
+
+#: The name of the attribute of the current request in which the sparse
+#: fieldsets requested by the client are stored the first time they are
+#: parsed (see :attr:`APIBase.sparse_fields`).
+_SPARSE_FIELDS = '_restless_sparse_fields'
+
+#: The number of resources loaded from the database and serialized at a
+#: time when streaming a response.
+STREAM_BATCH_SIZE = 100
+
 #: The Content-Type we expect for most requests to APIs.
 #:
 #: The JSON API specification requires the content type to be
@@ -125,6 +161,27 @@ PAGE_NUMBER_PARAM = 'page[number]'
 #: :http:method:`get` request.
 PAGE_SIZE_PARAM = 'page[size]'
 
+#: The query parameter key that identifies, in a :http:method:`get`
+#: request, the cursor after which the requested page begins.
+PAGE_AFTER_PARAM = 'page[after]'
+
+#: The query parameter key that identifies, in a :http:method:`get`
+#: request, the cursor before which the requested page ends.
+PAGE_BEFORE_PARAM = 'page[before]'
+
+#: The query parameter key with which the client may specify, in a
+#: :http:method:`get` request, whether the total number of resources in a
+#: collection should be counted.
+PAGE_COUNT_PARAM = 'page[count]'
+
+#: The policies for counting the total number of resources in a
+#: collection that may be given to :class:`APIBase`.
+COUNT_POLICIES = frozenset(['exact', 'cached', 'estimated', 'none'])
+
+#: All the query parameter keys that determine the requested page.
+PAGINATION_PARAMS = (PAGE_NUMBER_PARAM, PAGE_SIZE_PARAM, PAGE_AFTER_PARAM,
+                     PAGE_BEFORE_PARAM)
+
 #: A regular expression for Accept headers.
 #:
 #: For an explanation of "media-range", etc., see Sections 5.3.{1,2} of
@@ -476,9 +533,76 @@ def is_conflict(exception):
     return any(s in exception_string for s in CONFLICT_INDICATORS)
 
 
+def batched(query):
+    """Returns an iterable over the results of `query` that loads the
+    results from the database in batches of :data:`STREAM_BATCH_SIZE`.
+
+    If `query` is not a SQLAlchemy query, or if its eager loading
+    options do not allow the results to be loaded in batches (as is the
+    case for subquery eager loading, for example), `query` is returned
+    unchanged.
+
+    """
+    if not isinstance(query, Query):
+        return query
+    batched_query = query.yield_per(STREAM_BATCH_SIZE)
+    # SQLAlchemy refuses to compile a query with `yield_per()` if one
+    # of its loader options would need to see all of the results.
+    try:
+        batched_query.statement
+    except InvalidRequestError:
+        return query
+    return batched_query
+
+
+def json_backend():
+    """Returns the :class:`JSONBackend` used by the view handling the
+    current request.
+
+    If the request is not being handled by a subclass of
+    :class:`APIBase`, this returns the Flask backend.
+
+    """
+    return getattr(request, _JSON_BACKEND, FLASK_JSON)
+
+
+def json_chunks(document, dumps=FLASK_JSON.dumps):
+    """Yields the JSON encoding of the given dictionary in pieces.
+
+    `dumps` is the function that encodes a JSON-serializable object as a
+    bytestring.
+
+    Each value in `document` that is a generator is encoded as a JSON
+    array, one element at a time, so that the elements need not all be
+    in memory at once. The ``data`` and ``included`` elements, if
+    present, are encoded first, in that order, since the included
+    resources may only be known once the primary data has been
+    generated.
+
+    """
+    first_keys = [key for key in ('data', 'included') if key in document]
+    keys = first_keys + [key for key in document if key not in first_keys]
+    for i, key in enumerate(keys):
+        yield b', ' if i else b'{'
+        yield dumps(key)
+        yield b': '
+        value = document[key]
+        if isinstance(value, GeneratorType):
+            yield b'['
+            for j, element in enumerate(value):
+                if j:
+                    yield b', '
+                yield dumps(element)
+            yield b']'
+        else:
+            yield dumps(value)
+    yield b'}'
+
+
 def jsonpify(*args, **kw):
     """Returns a JSONP response, with the specified arguments passed directly
-    to :func:`flask.jsonify`.
+    to :func:`flask.jsonify` (or to the JSON backend of the current view,
+    as returned by :func:`json_backend`).
 
     If the request has a query parameter ``calback=foo``, then the body of the
     response will be ``foo(<json>)``, where ``<json>`` is the JSON object that
@@ -497,6 +621,11 @@ def jsonpify(*args, **kw):
     its value must be an integer representing the status code of the response.
     Otherwise, the status code of the response will be :http:status:`200`.
 
+    If the keyword arguments include the string specified by :data:`_STREAM`
+    and its value is ``True``, the keyword arguments are taken as a JSON API
+    document, which is streamed to the client as it is encoded by the
+    :func:`json_chunks` function.
+
     """
     # HACK In order to make the headers and status code available in the
     # content of the response, we need to send it from the view function to
@@ -505,12 +634,13 @@ def jsonpify(*args, **kw):
     # code known to the rendering functions.
     headers = kw['meta'].pop(_HEADERS, {}) if 'meta' in kw else {}
     status_code = kw['meta'].pop(_STATUS, 200) if 'meta' in kw else 200
-    response = jsonify(*args, **kw)
+    stream = kw['meta'].pop(_STREAM, False) if 'meta' in kw else False
     callback = request.args.get('callback', False)
+    if stream:
+        return _streamed_response(kw, headers, status_code, callback)
+    backend = json_backend()
     if callback:
-        # Reload the data from the constructed JSON string so we can wrap it in
-        # a JSONP function.
-        document = json.loads(response.data)
+        document = dict(*args, **kw)
         # Force the 'Content-Type' header to be 'application/javascript'.
         #
         # Note that this is different from the mimetype used in Flask for JSON
@@ -521,18 +651,26 @@ def jsonpify(*args, **kw):
         headers['Content-Type'] = mimetype
         # # Add the headers and status code as metadata to the JSONP response.
         # meta = _headers_to_json(headers) if headers is not None else {}
+        #
+        # The status code is added before the document is encoded, so
+        # that the encoded document can be wrapped in the JSONP function
+        # without being decoded and encoded again.
         meta = {}
         meta['status'] = status_code
         if 'meta' in document:
             document['meta'].update(meta)
         else:
             document['meta'] = meta
-        inner = json.dumps(document)
-        content = '{0}({1})'.format(callback, inner)
-        # Note that this is different from the mimetype used in Flask for JSON
-        # responses; Flask uses 'application/json'. We use
-        # 'application/javascript' because a JSONP response is not valid JSON.
+        inner = backend.dumps(document)
+        content = b''.join([callback.encode('utf-8'), b'(', inner, b')'])
         response = current_app.response_class(content, mimetype=mimetype)
+    # The Flask backend uses `jsonify()` so that the response respects
+    # the application's configuration for formatting JSON responses.
+    elif backend is FLASK_JSON:
+        response = jsonify(*args, **kw)
+    else:
+        content = backend.dumps(dict(*args, **kw))
+        response = current_app.response_class(content, mimetype=CONTENT_TYPE)
     if 'Content-Type' not in headers:
         headers['Content-Type'] = CONTENT_TYPE
     # Set the headers on the HTTP response as well.
@@ -543,6 +681,35 @@ def jsonpify(*args, **kw):
     return response
 
 
+def _streamed_response(document, headers, status_code, callback=None):
+    """Returns a response that streams the given JSON API document to
+    the client, as described in :func:`jsonpify`.
+
+    `headers` and `status_code` are the headers and status code of the
+    response. If `callback` is not ``None``, the response is a JSONP
+    response that wraps the document in a call to the function with
+    that name.
+
+    """
+    chunks = json_chunks(document, dumps=json_backend().dumps)
+    if callback:
+        # As in `jsonpify()`, add the status code to the metadata of
+        # the JSONP response and force the Content-Type header.
+        document.setdefault('meta', {})['status'] = status_code
+        headers['Content-Type'] = 'application/javascript'
+        prefix = [callback.encode('utf-8'), b'(']
+        chunks = chain([prefix, chunks, [b')']])
+    # The response must keep the request context so that the remainder
+    # of the document can be generated after this function returns.
+    response = current_app.response_class(stream_with_context(chunks))
+    if 'Content-Type' not in headers:
+        headers['Content-Type'] = CONTENT_TYPE
+    for key, value in headers.items():
+        response.headers.set(key, value)
+    response.status_code = status_code
+    return response
+
+
 def parse_sparse_fields(type_=None):
     """Get the sparse fields as requested by the client.
 
@@ -905,7 +1072,11 @@ class Paginated(object):
     `first`, `last`, `prev`, and `next_` are integers representing the
     number of the first, last, previous, and next pages,
     respectively. These can also be ``None``, in the case that there is
-    no such page.
+    no such page. When paginating by cursor instead of by page number,
+    each of these is instead a pair of the form ``(param, cursor)``,
+    where `param` is :data:`PAGE_AFTER_PARAM` or
+    :data:`PAGE_BEFORE_PARAM` and `cursor` is the value of that query
+    parameter in the link to the page.
 
     `filters`, `sort`, and `group_by` are the filtering, sorting, and
     grouping query parameters from the request that yielded the given
@@ -991,7 +1162,7 @@ class Paginated(object):
         #
         # TODO In Python 3, this should be a dict comprehension.
         new_query = dict((k, v) for k, v in query_params.items()
-                         if k not in (PAGE_NUMBER_PARAM, PAGE_SIZE_PARAM))
+                         if k not in PAGINATION_PARAMS)
         new_query_string = '&'.join(map('='.join, new_query.items()))
         # Join the base URL with the query parameter string.
         return '{0}?{1}'.format(base_url, new_query_string)
@@ -1064,11 +1235,17 @@ class Paginated(object):
                 self._pagination_links[rel] = None
             else:
                 # Each time through this `for` loop we update the page
-                # number in the `query_param` dictionary, so the the
-                # `_to_url` method will give us the correct URL for that
-                # page.
-                query_params[PAGE_NUMBER_PARAM] = str(num)
-                url = Paginated._to_url(base_url, query_params)
+                # number (or cursor) in the `query_param` dictionary, so
+                # the the `_to_url` method will give us the correct URL
+                # for that page.
+                if isinstance(num, tuple):
+                    param, cursor = num
+                    params = dict(query_params)
+                    params[param] = cursor
+                else:
+                    params = query_params
+                    params[PAGE_NUMBER_PARAM] = str(num)
+                url = Paginated._to_url(base_url, params)
                 link_string = '<{0}>; rel="{1}"'.format(url, rel)
                 self._header_links.append(link_string)
                 self._pagination_links[rel] = url
@@ -1155,6 +1332,38 @@ class ModelView(MethodView):
         self.session = session
         self.model = model
 
+    @classmethod
+    def as_view(cls, name, *class_args, **class_kwargs):
+        """Converts this class into a view function, as
+        :meth:`flask.views.View.as_view` does, except that a single
+        instance of this class is created now and used to handle every
+        request, instead of a new instance for each request.
+
+        The configuration of the view is therefore computed only once,
+        so the attributes of an instance must not depend on the current
+        request; state that does (like :attr:`APIBase.sparse_fields`)
+        must be stored on the request instead.
+
+        """
+        instance = cls(*class_args, **class_kwargs)
+
+        def view(*args, **kw):
+            return instance.dispatch_request(*args, **kw)
+
+        if cls.decorators:
+            view.__name__ = name
+            view.__module__ = cls.__module__
+            for decorator in cls.decorators:
+                view = decorator(view)
+        # This is as in :meth:`flask.views.View.as_view`.
+        view.view_class = cls
+        view.view_instance = instance
+        view.__name__ = name
+        view.__doc__ = cls.__doc__
+        view.__module__ = cls.__module__
+        view.methods = cls.methods
+        return view
+
     def collection_parameters(self, resource_id=None, relation_name=None):
         """Gets filtering, sorting, grouping, and other settings from
         the request that affect the collection of resources in a
@@ -1296,6 +1505,22 @@ class APIBase(ModelView):
     `allow_to_many_replacement` is as described in
     :ref:`allowreplacement`.
 
+    `streaming` is as described in :ref:`streaming`.
+
+    `window_count` is as described in :ref:`windowcount`.
+
+    `count_policy` is as described in :ref:`counting`. If it is
+    ``'cached'``, `count_cache` is the :class:`CountCache` in which to
+    cache counts; it must be shared by the instances of this class that
+    serve the same API (the view of the API and that of its
+    relationships).
+
+    `json_backend` is the :class:`JSONBackend` used to decode request
+    bodies and encode responses. If it is ``None``, the JSON functions
+    provided by Flask are used.
+
+    `value_list_min_length` is as described in :ref:`valuelists`.
+
     """
 
     #: List of decorators applied to every method of this class.
@@ -1304,13 +1529,15 @@ class APIBase(ModelView):
     def __init__(self, session, model, preprocessors=None, postprocessors=None,
                  primary_key=None, serializer=None, deserializer=None,
                  validation_exceptions=None, includes=None, page_size=10,
-                 max_page_size=100, allow_to_many_replacement=False, *args,
-                 **kw):
+                 max_page_size=100, allow_to_many_replacement=False,
+                 streaming=False, json_backend=None, window_count=False,
+                 count_policy='exact', count_cache=None,
+                 value_list_min_length=VALUE_LIST_MIN_LENGTH, *args, **kw):
         super(APIBase, self).__init__(session, model, *args, **kw)
 
-        #: The name of the collection specified by the given model class
-        #: to be used in the URL for the ReSTful API created.
-        self.collection_name = collection_name(self.model)
+        # The collection name is only known once the API has been
+        # created, after this view; see :attr:`collection_name`.
+        self._collection_name = None
 
         #: The default set of related resources to include in compound
         #: documents, given as a set of relationship paths.
@@ -1336,6 +1563,34 @@ class APIBase(ModelView):
         #: returned.
         self.max_page_size = max_page_size
 
+        #: Whether to stream responses that consist of a collection of
+        #: resources to the client as they are serialized, instead of
+        #: serializing the entire collection before responding.
+        self.streaming = streaming
+
+        #: Whether to count the resources in a collection in the same
+        #: statement that fetches the requested page, using a window
+        #: function.
+        self.window_count = window_count
+
+        #: How to count the total number of resources in a collection;
+        #: one of the strings in :data:`COUNT_POLICIES`.
+        self.count_policy = count_policy
+
+        #: The cache of counts, if the count policy is ``'cached'``.
+        self.count_cache = count_cache
+        if count_policy == 'cached' and count_cache is None:
+            self.count_cache = CountCache()
+
+        #: The smallest number of values given to the ``in`` or
+        #: ``not_in`` operator in a filter that are bound to a single
+        #: parameter, instead of to one parameter each.
+        self.value_list_min_length = value_list_min_length
+
+        #: The JSON encoder and decoder used for request and response
+        #: bodies.
+        self.json_backend = json_backend or FLASK_JSON
+
         #: A custom serialization function for primary resources; see
         #: :ref:`serialization` for more information.
         #:
@@ -1369,10 +1624,6 @@ class APIBase(ModelView):
         #: the main functionality of that method has been executed.
         self.preprocessors = defaultdict(list, upper(preprocessors or {}))
 
-        #: The mapping from resource type name to requested sparse
-        #: fields for resources of that type.
-        self.sparse_fields = parse_sparse_fields()
-
         # HACK: We would like to use the :attr:`API.decorators` class attribute
         # in order to decorate each view method with a decorator that catches
         # database integrity errors. However, in order to rollback the session,
@@ -1385,6 +1636,38 @@ class APIBase(ModelView):
             if hasattr(self, method):
                 decorate(method, catch_integrity_errors(self.session))
 
+    @property
+    def collection_name(self):
+        """The name of the collection specified by the given model class
+        to be used in the URL for the ReSTful API created.
+
+        """
+        if self._collection_name is None:
+            self._collection_name = collection_name(self.model)
+        return self._collection_name
+
+    @property
+    def sparse_fields(self):
+        """The mapping from resource type name to requested sparse
+        fields for resources of that type, in the current request.
+
+        The fields are parsed from the query parameters the first time
+        this attribute is accessed during a request.
+
+        """
+        sparse_fields = getattr(request, _SPARSE_FIELDS, None)
+        if sparse_fields is None:
+            sparse_fields = parse_sparse_fields()
+            setattr(request, _SPARSE_FIELDS, sparse_fields)
+        return sparse_fields
+
+    def dispatch_request(self, *args, **kw):
+        # HACK The response is rendered by the :func:`jsonpify` function
+        # outside of this view, so we provide the JSON backend to that
+        # function via the current request.
+        setattr(request, _JSON_BACKEND, self.json_backend)
+        return super(APIBase, self).dispatch_request(*args, **kw)
+
     def collection_processor_type(self, *args, **kw):
         """The suffix for the pre- and postprocessor identifiers for
         requests on collections of resources.
@@ -1442,12 +1725,14 @@ class APIBase(ModelView):
         model.
 
         ``instance_or_instances`` is either a SQLAlchemy
-        :class:`~sqlalchemy.orm.query.Query` object representing
-        multiple instances of a SQLAlchemy model, or it is simply one
-        instance of a model. These instances represent the resources
-        that will be returned as primary data in the JSON API
-        response. The resources to include will be computed based on
-        these data and the client's ``include`` query parameter.
+        :class:`~sqlalchemy.orm.query.Query` object or a list
+        representing multiple instances of a SQLAlchemy model, or it is
+        simply one instance of a model. These instances represent the
+        resources that will be returned as primary data in the JSON API
+        response, so for a paginated collection this should be only the
+        current page of resources. The resources to include will be
+        computed based on these data and the client's ``include`` query
+        parameter.
 
         This function raises :exc:`MultipleExceptions` if any included
         resource causes a serialization exception. If this exception is
@@ -1460,7 +1745,7 @@ class APIBase(ModelView):
         # of a SQLAlchemy model, get the resources to include for that
         # one instance. Otherwise, collect the resources to include for
         # each instance in `instances`.
-        if isinstance(instance_or_instances, Query):
+        if isinstance(instance_or_instances, (Query, list)):
             instances = instance_or_instances
             to_include = set(chain(map(self.resources_to_include, instances)))
         else:
@@ -1469,7 +1754,75 @@ class APIBase(ModelView):
         only = self.sparse_fields
         return simple_heterogeneous_serialize_many(to_include, only=only)
 
-    def _paginated(self, items, filters=None, sort=None, group_by=None):
+    def columns_to_load(self, model):
+        """Returns the names of the column attributes of `model` whose
+        values are needed to serialize primary data in the response to
+        the current request, or ``None`` if all of them may be needed.
+
+        The columns are determined by the serializer for `model` and the
+        sparse fieldset requested by the client for resources of that
+        type. Resource identifier objects need only the primary key, so
+        if this view uses resource identifiers, no columns are needed.
+
+        """
+        if self.use_resource_identifiers():
+            return ()
+        try:
+            serializer = serializer_for(model)
+            only = self.sparse_fields.get(collection_name(model))
+        except ValueError:
+            return None
+        return serializer.columns_to_load(model, only=only)
+
+    def _count(self, items, model, filters=None, group_by=None,
+                resource=None):
+        """Returns the total number of resources in the collection
+        `items`, according to the count policy of this API, or ``None``
+        if the count policy is ``'none'`` or the client requested that
+        the resources not be counted.
+
+        `items` is a query that yields as many rows as there are
+        resources in the collection, which are instances of `model`. If
+        the collection is a to-many relation, `resource` is the instance
+        that owns it. `filters` and `group_by` are as in
+        :meth:`_paginated`.
+
+        """
+        if self.count_policy == 'none' or not self.count_requested():
+            return None
+        if self.count_policy == 'estimated':
+            # The statistics of the database only describe entire
+            # tables, not filtered subsets of them.
+            if resource is None and not filters and not group_by:
+                estimate = estimated_count(self.session, model)
+                if estimate is not None:
+                    return estimate
+        elif self.count_policy == 'cached':
+            # A to-many relation is identified by the path of the
+            # request, and a filtered collection by its filters.
+            key = (request.path, json.dumps(filters, sort_keys=True),
+                   tuple(group_by or ()))
+            return self.count_cache.get(key, items,
+                                        partial(count, self.session, items))
+        return count(self.session, items)
+
+    def count_requested(self):
+        """Returns whether the client wants the total number of resources
+        in a collection, as specified by the ``page[count]`` query
+        parameter.
+
+        This method raises :exc:`PaginationError` if the value of the
+        query parameter is not ``true`` or ``false``.
+
+        """
+        value = request.args.get(PAGE_COUNT_PARAM, 'true').lower()
+        if value not in ('true', 'false'):
+            msg = '{0} must be true or false'.format(PAGE_COUNT_PARAM)
+            raise PaginationError(msg)
+        return value == 'true'
+
+    def _paginated(self, items, filters=None, sort=None, group_by=None,
+                   model=None, resource=None, counted=None):
         """Returns a :class:`Paginated` object representing the
         correctly paginated list of resources to return to the client,
         based on the current request.
@@ -1478,6 +1831,19 @@ class APIBase(ModelView):
         containing all requested elements of a collection regardless of
         the page number or size in the client's request.
 
+        `model` is the SQLAlchemy model whose instances `items` yields;
+        if it is not specified, the model of this API is assumed. If
+        `items` represents a to-many relation, `resource` is the
+        instance that owns it.
+
+        The total number of resources is computed according to the count
+        policy of this API; if it is not computed, the returned object
+        has no link to the last page, and its number of results is
+        ``None``. If `counted` is specified, it is a query that yields
+        as many rows as `items` but that is cheaper to count (as
+        returned by :func:`count_query`), and it is counted instead of
+        `items`.
+
         `filters`, `sort`, and `group_by` must have already been
         extracted from the client's request (as by
         :meth:`collection_parameters`) and applied to the query.
@@ -1491,6 +1857,10 @@ class APIBase(ModelView):
         # problem serializing resources.
 
         """
+        if model is None:
+            model = self.model
+        if counted is None:
+            counted = items
         # Determine the client's page size request. Raise an exception
         # if the page size is out of bounds, either too small or too
         # large.
@@ -1519,8 +1889,26 @@ class APIBase(ModelView):
             #
             # but we can't get the length of the list of items until
             # we serialize them.
-            num_results = count(self.session, items)
+            num_results = self._count(counted, model, filters=filters,
+                                      group_by=group_by, resource=resource)
             return Paginated(items, page_size=0, num_results=num_results)
+        # If the client requested a page by cursor instead of by page
+        # number, seek to that page.
+        after = request.args.get(PAGE_AFTER_PARAM)
+        before = request.args.get(PAGE_BEFORE_PARAM)
+        if after is not None or before is not None:
+            if group_by:
+                msg = 'Cannot paginate by cursor when grouping'
+                raise PaginationError(msg)
+            if after is not None and before is not None:
+                msg = 'Cannot specify both {0} and {1}'
+                msg = msg.format(PAGE_AFTER_PARAM, PAGE_BEFORE_PARAM)
+                raise PaginationError(msg)
+            return self._paginated_by_cursor(items, model, page_size,
+                                             after=after, before=before,
+                                             filters=filters, sort=sort,
+                                             resource=resource,
+                                             counted=counted)
         # Determine the client's page number request. Raise an exception
         # if the page number is out of bounds.
         page_number = int(request.args.get(PAGE_NUMBER_PARAM, 1))
@@ -1528,36 +1916,43 @@ class APIBase(ModelView):
             raise PaginationError('Page number must be a positive integer')
         # At this point, we know the page size is positive, so we
         # paginate the response.
-        #
-        # If the query is really a Flask-SQLAlchemy query, we can use
-        # its built-in pagination. Otherwise, we need to manually
-        # compute the page numbers, the number of results, etc.
-        if hasattr(items, 'paginate'):
-            pagination = items.paginate(page_number, page_size,
-                                        error_out=False)
-            num_results = pagination.total
-            first = 1
-            last = pagination.pages
-            prev = pagination.prev_num
-            next_ = pagination.next_num
-            items = pagination.items
+        exact = self.count_policy == 'exact' and self.count_requested()
+        offset = (page_number - 1) * page_size
+        if exact and self.window_count:
+            page, num_results = page_and_count(self.session, items,
+                                               page_size, offset)
+        else:
+            num_results = self._count(counted, model, filters=filters,
+                                      group_by=group_by,
+                                      resource=resource)
+            # A grouped query cannot select only the primary keys of
+            # its rows, so it cannot be paginated by a deferred join.
+            if group_by:
+                page = items.limit(page_size).offset(offset)
+            else:
+                page = page_query(items, model, page_size, offset)
+        first = 1
+        prev = page_number - 1 if page_number > 1 else None
+        # If the resources were not counted, the number of the last
+        # page is unknown, but whether there is a next page can be
+        # determined without counting all the resources.
+        if num_results is None:
+            last = None
+            next_ = None
+            if has_results(self.session, counted, offset + page_size):
+                next_ = page_number + 1
         else:
-            num_results = count(self.session, items)
-            first = 1
             # Handle a special case for an empty collection of items.
             #
-            # There will be no division-by-zero error here because we
-            # have already checked that page size is not equal to zero
-            # above.
+            # There will be no division-by-zero error here because
+            # we have already checked that page size is not equal to
+            # zero above.
             if num_results == 0:
                 last = 1
             else:
                 last = int(math.ceil(num_results / page_size))
-            prev = page_number - 1 if page_number > 1 else None
             next_ = page_number + 1 if page_number < last else None
-            offset = (page_number - 1) * page_size
-            # TODO Use Query.slice() instead, since it's easier to use.
-            items = items.limit(page_size).offset(offset)
+        items = page
         # Wrap the list of results in a Paginated object, which
         # represents the result set and stores some extra information
         # about how it was determined.
@@ -1566,6 +1961,86 @@ class APIBase(ModelView):
                          page_size=page_size, filters=filters, sort=sort,
                          group_by=group_by)
 
+    def _paginated_by_cursor(self, items, model, page_size, after=None,
+                             before=None, filters=None, sort=None,
+                             resource=None, counted=None):
+        """Returns a :class:`Paginated` object representing the page of
+        `items` that comes after the cursor `after` or before the cursor
+        `before`.
+
+        A cursor encodes the values of the sort keys (as determined by
+        `sort` and the primary key of `model`) of the last resource on
+        the previous page or the first resource on the next page. The
+        empty string represents the beginning of the collection when
+        given as `after` and the end of the collection when given as
+        `before`. Exactly one of `after` and `before` must be specified.
+
+        Instead of skipping a number of rows with an offset, the page is
+        found by filtering on the sort keys, which the database can do
+        with an index on those keys, so fetching a deep page costs no
+        more than fetching the first one.
+
+        `items`, `resource`, and `counted` are as in :meth:`_paginated`.
+        The items
+        of the returned object are a query for the requested page, in
+        the order specified by `sort`.
+
+        This method raises :exc:`PaginationError` if `sort` contains a
+        field of a related model or if the cursor is not valid.
+
+        """
+        try:
+            keys = keyset_keys(model, sort)
+        except ValueError as exception:
+            raise PaginationError(str(exception))
+        backward = before is not None
+        cursor = before if backward else after
+        values = None
+        if cursor:
+            try:
+                values = decode_cursor(cursor)
+                if len(values) != len(keys):
+                    raise ValueError
+                values = [string_to_datetime(model, name, value)
+                          for (name, ascending), value in zip(keys, values)]
+            except (AttributeError, TypeError, ValueError, OverflowError):
+                raise PaginationError('Invalid cursor: {0}'.format(cursor))
+        if counted is None:
+            counted = items
+        num_results = self._count(counted, model, filters=filters,
+                                  resource=resource)
+        # Find the sort key values of the resources on the requested
+        # page by selecting only the key columns, along with one extra
+        # row to determine whether there is another page beyond this
+        # one. The page itself is then selected, in the requested
+        # order, starting at its first row, so that it remains a query
+        # that can be serialized or streamed like any other page.
+        columns = [getattr(model, name) for name, ascending in keys]
+        bounds = seek(items, model, keys, values, before=backward)
+        bounds = bounds.with_entities(*columns).limit(page_size + 1).all()
+        more = len(bounds) > page_size
+        bounds = [list(row) for row in bounds[:page_size]]
+        if backward:
+            bounds.reverse()
+        first = (PAGE_AFTER_PARAM, '')
+        last = (PAGE_BEFORE_PARAM, '')
+        if not bounds:
+            items = items.limit(0)
+            prev = next_ = None
+        else:
+            items = seek(items, model, keys, bounds[0], inclusive=True)
+            items = items.limit(len(bounds))
+            has_prev = more if backward else values is not None
+            has_next = values is not None if backward else more
+            prev = next_ = None
+            if has_prev:
+                prev = (PAGE_BEFORE_PARAM, encode_cursor(bounds[0]))
+            if has_next:
+                next_ = (PAGE_AFTER_PARAM, encode_cursor(bounds[-1]))
+        return Paginated(items, num_results=num_results, first=first,
+                         last=last, next_=next_, prev=prev,
+                         page_size=page_size, filters=filters, sort=sort)
+
     def _get_resource_helper(self, resource, primary_resource=None,
                              relation_name=None, related_resource=False):
         is_relationship = self.use_resource_identifiers()
@@ -1655,14 +2130,40 @@ class APIBase(ModelView):
                              ' not None')
         # Compute the result of the search on the model.
         is_relation = resource is not None
+        min_length = self.value_list_min_length
         if is_relation:
             search_ = partial(search_relationship, self.session, resource,
-                              relation_name)
+                              relation_name, value_list_min_length=min_length)
+            count_ = partial(count_relationship_query, self.session,
+                             resource, relation_name,
+                             value_list_min_length=min_length)
+        else:
+            search_ = partial(search, self.session, self.model,
+                              value_list_min_length=min_length)
+            count_ = partial(count_query, self.session, self.model,
+                             value_list_min_length=min_length)
+        # Related resources to be included in the compound document are
+        # loaded along with the primary data, except when fetching
+        # linkage objects, whose inclusions are not computed from the
+        # search results.
+        if self.use_resource_identifiers():
+            include = None
         else:
-            search_ = partial(search, self.session, self.model)
+            include = self.include_paths()
+        # Only the columns that will be serialized are loaded from the
+        # database.
+        if is_relation:
+            model = get_related_model(get_model(resource), relation_name)
+        else:
+            model = self.model
+        columns = self.columns_to_load(model)
         try:
             search_items = search_(filters=filters, sort=sort,
-                                   group_by=group_by)
+                                   group_by=group_by, include=include,
+                                   columns=columns)
+            # The resources are counted with a separate query that omits
+            # the ordering and any joins that do not affect the count.
+            counted = count_(filters=filters, sort=sort, group_by=group_by)
         except (FilterParsingError, FilterCreationError) as exception:
             detail = 'invalid filter object: {0}'.format(str(exception))
             return error_response(400, cause=exception, detail=detail)
@@ -1671,6 +2172,15 @@ class APIBase(ModelView):
             return error_response(400, cause=exception, detail=detail)
 
         is_relationship = self.use_resource_identifiers()
+        # This method could have been called on either a request to
+        # fetch a collection of resources or a to-many relation.
+        processor_type = \
+            self.collection_processor_type(is_relation=is_relation)
+        processor_type = 'GET_{0}'.format(processor_type)
+        # Postprocessors expect to receive the complete document, so the
+        # response can only be streamed if there are none.
+        stream = (self.streaming and not single and
+                  not self.postprocessors[processor_type])
         # Add the primary data (and any necessary links) to the JSON API
         # response object.
         #
@@ -1679,7 +2189,9 @@ class APIBase(ModelView):
         if not single:
             try:
                 paginated = self._paginated(search_items, filters=filters,
-                                            sort=sort, group_by=group_by)
+                                            sort=sort, group_by=group_by,
+                                            model=model, resource=resource,
+                                            counted=counted)
             except PaginationError as exception:
                 detail = exception.args[0]
                 return error_response(400, cause=exception, detail=detail)
@@ -1691,10 +2203,10 @@ class APIBase(ModelView):
             # - a to-many relation (as in `GET /person/1/articles`),
             # - a to-many relationship (as in `GET /person/1/relationships/articles`)
             #
-            items = paginated.items
             # This covers the relationship object case...
             if is_relationship:
-                result = simple_relationship_serialize_many(items)
+                serializer = None
+                serialize_many = simple_relationship_serialize_many
             # ...and this covers the primary resource collection and
             # to-many relation cases.
             else:
@@ -1722,8 +2234,34 @@ class APIBase(ModelView):
                 # This may raise ValueError
                 _type = collection_name(model)
                 only = self.sparse_fields.get(_type)
+                serialize_many = partial(serializer.serialize_many, only=only)
+            # A serializer that supports it may build the resource
+            # objects directly from the rows of the query, without
+            # loading any instances. Included resources, however, are
+            # computed from instances.
+            serialize_query = getattr(serializer, 'serialize_query', None)
+            rows = None
+            if (serialize_query is not None and not stream and not include
+                    and not group_by and isinstance(paginated.items, Query)):
+                rows = serialize_query(model, paginated.items, only=only)
+            # The page is loaded into a list here so that the same
+            # instances can be used both for serialization and for
+            # computing included resources, without querying twice. A
+            # streamed page is instead loaded and serialized in batches,
+            # with the included resources collected along the way.
+            if rows is not None:
+                items = []
+                result = rows
+            elif stream:
+                items = batched(paginated.items)
+                result = JsonApiDocument()
+                to_include = None if is_relationship else set()
+                result['data'] = self._streamed_data(items, serialize_many,
+                                                     to_include)
+            else:
+                items = list(paginated.items)
                 try:
-                    result = serializer.serialize_many(items, only=only)
+                    result = serialize_many(items)
                 except MultipleExceptions as e:
                     return errors_from_serialization_exceptions(e.exceptions)
                 except SerializationException as exception:
@@ -1787,29 +2325,34 @@ class APIBase(ModelView):
             num_results = 1
 
         # Determine the resources to include (in a compound document).
-        if self.use_resource_identifiers():
+        #
+        # Only the resources that actually appear as primary data in
+        # this response (that is, the current page of the collection)
+        # are considered, not every resource matching the search.
+        if self.use_resource_identifiers() or single:
             instances = resource
         else:
-            instances = search_items
+            instances = items
         # Include any requested resources in a compound document.
-        try:
-            included = self.get_all_inclusions(instances)
-        except MultipleExceptions as e:
-            # By the way we defined `get_all_inclusions()`, we are
-            # guaranteed that each of the underlying exceptions is a
-            # `SerializationException`. Thus we can use
-            # `errors_from_serialization_exception()`.
-            return errors_from_serialization_exceptions(e.exceptions,
-                                                        included=True)
-        if 'included' not in result:
-            result['included'] = []
-        result['included'].extend(included)
+        #
+        # The resources to include in a streamed collection of resources
+        # are only known once the primary data has been generated.
+        if stream and not is_relationship:
+            result['included'] = self._streamed_inclusions(to_include)
+        else:
+            try:
+                included = self.get_all_inclusions(instances)
+            except MultipleExceptions as e:
+                # By the way we defined `get_all_inclusions()`, we are
+                # guaranteed that each of the underlying exceptions is a
+                # `SerializationException`. Thus we can use
+                # `errors_from_serialization_exception()`.
+                return errors_from_serialization_exceptions(e.exceptions,
+                                                            included=True)
+            if 'included' not in result:
+                result['included'] = []
+            result['included'].extend(included)
 
-        # This method could have been called on either a request to
-        # fetch a collection of resources or a to-many relation.
-        processor_type = \
-            self.collection_processor_type(is_relation=is_relation)
-        processor_type = 'GET_{0}'.format(processor_type)
         for postprocessor in self.postprocessors[processor_type]:
             postprocessor(result=result, filters=filters, sort=sort,
                           group_by=group_by, single=single)
@@ -1820,12 +2363,51 @@ class APIBase(ModelView):
         # for more information. They don't really need to be under the ``meta``
         # key, that's just for semantic consistency.
         status = 200
-        meta = {_HEADERS: headers, _STATUS: status, 'total': num_results}
+        meta = {_HEADERS: headers, _STATUS: status}
+        if num_results is not None:
+            meta['total'] = num_results
+        if stream:
+            meta[_STREAM] = True
         if 'meta' not in result:
             result['meta'] = {}
         result['meta'].update(meta)
         return result, status, headers
 
+    def _streamed_data(self, items, serialize_many, to_include=None):
+        """Yields the serialization of each of the given instances.
+
+        `items` is an iterable of instances of a SQLAlchemy model, which
+        are serialized :data:`STREAM_BATCH_SIZE` at a time by the
+        function `serialize_many`.
+
+        If `to_include` is not ``None``, it must be a set, to which the
+        resources to include in the compound document are added as each
+        batch of instances is serialized.
+
+        Since the response has already begun by the time this generator
+        is consumed, a serialization exception cannot be reported to the
+        client as an error response. Instead the exception is raised and
+        the response ends prematurely.
+
+        """
+        for chunk in chunks(items, STREAM_BATCH_SIZE):
+            for resource in serialize_many(chunk)['data']:
+                yield resource
+            if to_include is not None:
+                to_include.update(chain(map(self.resources_to_include,
+                                            chunk)))
+
+    def _streamed_inclusions(self, to_include):
+        """Yields the serialization of each of the resources in the set
+        `to_include`, as computed by :meth:`_streamed_data`.
+
+        """
+        only = self.sparse_fields
+        for chunk in chunks(to_include, STREAM_BATCH_SIZE):
+            for resource in simple_heterogeneous_serialize_many(chunk,
+                                                                only=only):
+                yield resource
+
     def resources_to_include(self, instance):
         """Returns a set of resources to include in a compound document
         response based on the ``include`` query parameter and the default
@@ -1838,17 +2420,29 @@ class APIBase(ModelView):
 
         .. _Inclusion of Related Resources: http://jsonapi.org/format/#fetching-includes
 
+        """
+        toinclude = self.include_paths()
+        if not toinclude:
+            return {}
+        return set(chain(resources_from_path(instance, path)
+                         for path in toinclude))
+
+    def include_paths(self):
+        """Returns the set of relationship paths naming the resources to
+        include in a compound document response, based on the
+        ``include`` query parameter and the default includes specified
+        in the constructor of this class.
+
+        If the client specified the ``include`` query parameter, it
+        overrides the default includes. If there are no resources to
+        include, this method returns ``None``.
+
         """
         # Add any links requested to be included by URL parameters.
         #
         # We expect `toinclude` to be a comma-separated list of relationship
         # paths.
         toinclude = request.args.get('include')
-        if toinclude is None and self.default_includes is None:
-            return {}
-        elif toinclude is None and self.default_includes is not None:
-            toinclude = self.default_includes
-        else:
-            toinclude = set(toinclude.split(','))
-        return set(chain(resources_from_path(instance, path)
-                         for path in toinclude))
+        if toinclude is None:
+            return self.default_includes
+        return set(toinclude.split(','))
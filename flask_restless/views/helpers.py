@@ -10,9 +10,24 @@
 # License version 3 and under the 3-clause BSD license. For more
 # information, see LICENSE.AGPL and LICENSE.BSD.
 """Helper functions for view classes."""
+from base64 import urlsafe_b64decode
+from base64 import urlsafe_b64encode
+from collections import defaultdict
+import datetime
+from itertools import islice
+import json
+from time import time
+
+from sqlalchemy import event
+from sqlalchemy import Table
+from sqlalchemy.engine import Engine
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.inspection import inspect as sqlalchemy_inspect
+from sqlalchemy.sql import and_
+from sqlalchemy.sql import text
 from sqlalchemy.sql import func
+from sqlalchemy.sql.expression import UpdateBase
+from sqlalchemy.sql.util import find_tables
 
 
 def upper_keys(dictionary):
@@ -27,6 +42,60 @@ def upper_keys(dictionary):
     return dict((k.upper(), v) for k, v in dictionary.items())
 
 
+def chunks(iterable, size):
+    """Yields lists of at most `size` consecutive elements of `iterable`.
+
+    Only one list is held in memory at a time, so this can be used to
+    process an iterable that is too large to be loaded all at once.
+
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def _cursor_default(value):
+    """Encodes values of sort keys that are not JSON serializable."""
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.days * 86400 + value.seconds
+    return str(value)
+
+
+def encode_cursor(values):
+    """Returns an opaque string, suitable for use in a URL, that encodes
+    the list of sort key values of a row.
+
+    Dates, times, and datetimes are encoded in ISO 8601 format, so they
+    must be parsed again after decoding (for example, by
+    :func:`~flask.ext.restless.helpers.string_to_datetime`).
+
+    """
+    document = json.dumps(list(values), default=_cursor_default,
+                          separators=(',', ':'))
+    cursor = urlsafe_b64encode(document.encode('utf-8'))
+    return cursor.decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns the list of sort key values encoded in the specified
+    string by :func:`encode_cursor`.
+
+    If `cursor` is not a valid cursor, this function raises
+    :exc:`ValueError`.
+
+    """
+    cursor = cursor.encode('ascii')
+    cursor += b'=' * (-len(cursor) % 4)
+    values = json.loads(urlsafe_b64decode(cursor).decode('utf-8'))
+    if not isinstance(values, list):
+        raise ValueError('cursor must encode a list')
+    return values
+
+
 def count(session, query):
     """Returns the count of the specified `query`.
 
@@ -42,6 +111,245 @@ def count(session, query):
     return num_results
 
 
+def has_results(session, query, offset):
+    """Returns whether `query` has at least ``offset + 1`` results.
+
+    This can be used to determine whether there is a page of results
+    after a certain offset without counting all the results.
+
+    """
+    page = query.order_by(None).limit(1).offset(offset)
+    return session.query(page.exists()).scalar()
+
+
+#: The query that selects the planner's estimate of the number of rows
+#: in a table, for each supported database dialect.
+#:
+#: Each query takes the name of the table as the ``name`` parameter.
+ESTIMATED_COUNT_QUERIES = {
+    'postgresql': text('SELECT reltuples FROM pg_class'
+                       ' WHERE oid = to_regclass(:name)'),
+    'mysql': text('SELECT table_rows FROM information_schema.tables'
+                  ' WHERE table_schema = DATABASE() AND table_name = :name'),
+    # The first number in each row of this table is the number of rows
+    # in the table, whether the row describes the table or one of its
+    # indices. The table only exists once ``ANALYZE`` has been run.
+    'sqlite': text('SELECT stat FROM sqlite_stat1 WHERE tbl = :name'
+                   ' LIMIT 1'),
+}
+
+
+def estimated_count(session, model):
+    """Returns an estimate of the number of instances of `model` in the
+    database, or ``None`` if no estimate is available.
+
+    The estimate is read from the statistics that the database keeps
+    for its query planner (see :data:`ESTIMATED_COUNT_QUERIES`), so it
+    is only as accurate as the last time those statistics were updated,
+    but reading it does not require scanning the table.
+
+    """
+    mapper = sqlalchemy_inspect(model)
+    # The rows in the table of a model with single table inheritance
+    # may be instances of other models.
+    if mapper.single or mapper.polymorphic_on is not None:
+        return None
+    table = mapper.local_table
+    bind = session.get_bind(mapper=mapper)
+    query = ESTIMATED_COUNT_QUERIES.get(bind.dialect.name)
+    if query is None:
+        return None
+    name = table.fullname if bind.dialect.name == 'postgresql' else table.name
+    try:
+        result = session.execute(query, {'name': name},
+                                 mapper=mapper).scalar()
+    except OperationalError:
+        return None
+    if result is None:
+        return None
+    if bind.dialect.name == 'sqlite':
+        result = result.split()[0]
+    result = int(float(result))
+    # PostgreSQL reports -1 for a table that has never been analyzed.
+    return result if result >= 0 else None
+
+
+#: A mapping from the full name of a table to the number of insert,
+#: update, and delete statements executed on that table, plus the number
+#: of transactions that wrote to it and were then committed or rolled
+#: back, used by :class:`CountCache` to detect writes.
+table_generations = defaultdict(int)
+
+#: The key in the :attr:`~sqlalchemy.engine.Connection.info` dictionary
+#: of a connection under which the set of full names of the tables
+#: written in its current transaction is stored.
+_WRITTEN_TABLES = 'flask_restless.written_tables'
+
+
+def _count_write(conn, clauseelement, *args):
+    """Counts the execution of `clauseelement` in
+    :data:`table_generations` if it is an insert, update, or delete
+    statement, and remembers the table it writes until the transaction
+    on `conn` ends.
+
+    """
+    if isinstance(clauseelement, UpdateBase):
+        table = getattr(clauseelement, 'table', None)
+        if isinstance(table, Table):
+            table_generations[table.fullname] += 1
+            conn.info.setdefault(_WRITTEN_TABLES, set()).add(table.fullname)
+
+
+def _count_end(conn):
+    """Counts the end of the transaction on `conn` in
+    :data:`table_generations` for each table written in it.
+
+    A count computed by another connection between a write and its
+    commit does not see the write, but is stored with the generations
+    that follow it; counting the commit (or the rollback) as well
+    invalidates such a count.
+
+    """
+    for table in conn.info.pop(_WRITTEN_TABLES, ()):
+        table_generations[table] += 1
+
+
+def _listen_for_writes():
+    """Starts counting the writes to each table executed by any engine,
+    and the ends of the transactions containing them, if that has not
+    been started yet.
+
+    """
+    if not event.contains(Engine, 'after_execute', _count_write):
+        event.listen(Engine, 'after_execute', _count_write)
+        event.listen(Engine, 'commit', _count_end)
+        event.listen(Engine, 'rollback', _count_end)
+
+
+def query_tables(query):
+    """Returns the set of full names of the tables referenced anywhere
+    in the given query, including joins, subqueries, and the secondary
+    tables of relationships.
+
+    """
+    tables = find_tables(query.statement, check_columns=True,
+                         include_aliases=True)
+    # TODO In Python 2.7 and later, this should be a set comprehension.
+    return frozenset(table.fullname for table in tables
+                     if isinstance(table, Table))
+
+
+class CountCache(object):
+    """A cache of the counts of collections, which expire after a
+    certain time or as soon as a table on which they depend is written.
+
+    `ttl` is the number of seconds for which a count remains valid.
+
+    A write is detected by listening for the insert, update, and delete
+    statements executed by any SQLAlchemy engine in this process, and
+    for the commit or rollback of the transactions containing them, so
+    writes to many-to-many association tables, to the tables of related
+    models joined by filters, and bulk updates all invalidate the counts
+    that depend on them. Writes by other processes, and writes executed
+    as textual SQL, are only noticed when the count expires.
+
+    """
+
+    #: The maximum number of counts to cache; when the cache is full, it
+    #: is emptied.
+    maxsize = 1024
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._counts = {}
+        _listen_for_writes()
+
+    def get(self, key, query, compute):
+        """Returns the cached count for `key`, or the result of calling
+        `compute` if there is no valid cached count.
+
+        `query` is the query whose results are counted; the count is
+        invalidated when any table it references is written. `compute`
+        is a function of no arguments that returns the count.
+
+        """
+        entry = self._counts.get(key)
+        if entry is not None:
+            value, expires, tables, cached_generations = entry
+            generations = tuple(table_generations[table]
+                                for table in tables)
+            if expires > time() and cached_generations == generations:
+                return value
+        tables = tuple(query_tables(query))
+        # The generations are read before computing the count, so that
+        # a write during the computation invalidates it.
+        generations = tuple(table_generations[table] for table in tables)
+        value = compute()
+        if len(self._counts) >= self.maxsize:
+            self._counts.clear()
+        self._counts[key] = (value, time() + self.ttl, tables, generations)
+        return value
+
+
+def page_and_count(session, query, limit, offset):
+    """Returns a two-tuple containing the list of results of `query` on
+    the page given by `limit` and `offset`, and the count of all results
+    of `query`.
+
+    The count is computed in the same statement as the page with a
+    ``count(*) OVER ()`` window function, instead of with a separate
+    statement as in :func:`count`, so the database must support window
+    functions. If the page is empty, the count cannot be read from it,
+    so it is computed separately unless `offset` is zero.
+
+    """
+    page = query.limit(limit).offset(offset)
+    rows = page.add_columns(func.count().over()).all()
+    if rows:
+        return [row[0] for row in rows], rows[0][-1]
+    if not offset:
+        return [], 0
+    return [], count(session, query)
+
+
+#: The smallest offset at which :func:`page_query` selects the primary keys of
+#: the page before selecting the page itself.
+#:
+#: For smaller offsets, the cost of the additional subquery outweighs
+#: the cost of reading the skipped rows.
+DEFERRED_JOIN_MIN_OFFSET = 1000
+
+
+def page_query(query, model, limit, offset):
+    """Returns a query for the page of results of `query` given by
+    `limit` and `offset`.
+
+    `query` must be a query whose sole entity is `model`.
+
+    If `offset` is at least :data:`DEFERRED_JOIN_MIN_OFFSET`, the page
+    is found with a "deferred join": a subquery selects only the primary
+    keys of the instances on the page, with the same filters, order,
+    limit, and offset as `query`, and the page is selected by joining
+    `query` to that subquery. The database then skips over narrow rows
+    (often read entirely from an index) instead of over the full rows
+    of the table, and reads the full rows of only the instances on the
+    page.
+
+    """
+    if offset < DEFERRED_JOIN_MIN_OFFSET:
+        return query.limit(limit).offset(offset)
+    mapper = sqlalchemy_inspect(model)
+    columns = [getattr(model, mapper.get_property_by_column(column).key)
+               for column in mapper.primary_key]
+    keys = query.with_entities(*columns).limit(limit).offset(offset)
+    keys = keys.subquery()
+    condition = and_(*(column == key
+                       for column, key in zip(columns, keys.c)))
+    # The outer query keeps the order of `query`, since the order of the
+    # rows of a subquery is not preserved by the join.
+    return query.join(keys, condition)
+
+
 def changes_on_update(model):
     """Returns a best guess at whether the specified SQLAlchemy model class is
     modified on updates.
@@ -16,7 +16,6 @@ The main class in this module, :class:`API`, is a
 SQLAlchemy models compatible with the JSON API specification.
 
 """
-from flask import json
 from flask import request
 from werkzeug.exceptions import BadRequest
 
@@ -400,7 +399,7 @@ class API(APIBase):
         """
         # try to read the parameters for the model from the body of the request
         try:
-            document = json.loads(request.get_data()) or {}
+            document = self.json_backend.loads(request.get_data()) or {}
         except (BadRequest, TypeError, ValueError, OverflowError) as exception:
             detail = 'Unable to decode data'
             return error_response(400, cause=exception, detail=detail)
@@ -591,7 +590,7 @@ class API(APIBase):
         """
         # try to load the fields/values to update from the body of the request
         try:
-            data = json.loads(request.get_data()) or {}
+            data = self.json_backend.loads(request.get_data()) or {}
         except (BadRequest, TypeError, ValueError, OverflowError) as exception:
             # this also happens when request.data is empty
             detail = 'Unable to decode data'
@@ -14,6 +14,7 @@ from datetime import date
 from datetime import datetime
 from datetime import time
 from datetime import timedelta
+from contextlib import contextmanager
 from functools import wraps
 from json import JSONEncoder
 import sys
@@ -35,6 +36,7 @@ from sqlalchemy import create_engine
 from sqlalchemy import event
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import clear_mappers
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm.session import Session as SessionBase
@@ -47,6 +49,15 @@ from flask.ext.restless import DefaultSerializer
 from flask.ext.restless import DefaultDeserializer
 from flask.ext.restless import DeserializationException
 from flask.ext.restless import SerializationException
+from flask.ext.restless import collection_name
+from flask.ext.restless import model_for
+from flask.ext.restless import primary_key_for
+from flask.ext.restless import serializer_for
+from flask.ext.restless import url_for
+from flask_restless.helpers import api_index
+from flask_restless.helpers import model_infos
+from flask_restless.search import filter_cache
+from flask_restless.search import filter_schemas
 
 dumps = json.dumps
 loads = json.loads
@@ -128,6 +139,31 @@ def parse_version(version_string):
     return tuple(int(n) for n in version_string.split('.'))
 
 
+def unregister_managers():
+    """Clears the :class:`~flask.ext.restless.APIManager` objects known
+    by the global helper functions, such as :func:`url_for` and
+    :func:`model_for`.
+
+    Each :class:`~flask.ext.restless.APIManager` registers itself with
+    these functions, and keeps a reference to each model for which it
+    has created an API. If the managers from previous tests are not
+    cleared, the models they reference outlive the test, and SQLAlchemy
+    will try (and fail) to configure their mappers during later tests.
+    For the same reason, this function also clears the index of created
+    APIs, the cache of compiled filters, the filter schemas, and the
+    metadata of the models, which are keyed by model.
+
+    """
+    finders = (collection_name, model_for, primary_key_for, serializer_for,
+               url_for)
+    for finder in finders:
+        finder.created_managers.clear()
+    api_index.clear()
+    filter_cache.clear()
+    filter_schemas.clear()
+    model_infos.clear()
+
+
 def unregister_fsa_session_signals():
     """Unregisters Flask-SQLAlchemy session commit and rollback signal
     handlers.
@@ -158,6 +194,33 @@ def unregister_fsa_session_signals():
         event.remove(SessionBase, signal_name, signal)
 
 
+@contextmanager
+def count_statements(engine):
+    """Context manager that records the SQL statements executed on the
+    specified SQLAlchemy engine.
+
+    The context manager yields a list which, on exiting the context,
+    contains the string of each SQL statement that was executed within
+    the context. This is useful for asserting that a request issues a
+    bounded number of queries::
+
+        with count_statements(engine) as statements:
+            self.app.get('/api/person')
+        assert len(statements) <= 3
+
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
 def check_sole_error(response, status, strings):
     """Asserts that the response is an errors response with a single
     error object whose detail message contains all of the given strings.
@@ -333,12 +396,16 @@ class FlaskSQLAlchemyTestBase(FlaskTestBase, DatabaseMixin):
         self.session = self.db.session
 
     def tearDown(self):
-        """Drops all tables and unregisters Flask-SQLAlchemy session
-        signals.
+        """Drops all tables, unregisters Flask-SQLAlchemy session
+        signals, clears the :class:`~flask.ext.restless.APIManager`
+        objects known by the global helper functions, and disposes of
+        the mappers of the models created for this test.
 
         """
         self.db.drop_all()
         unregister_fsa_session_signals()
+        unregister_managers()
+        clear_mappers()
 
 
 class SQLAlchemyTestBase(FlaskTestBase, DatabaseMixin):
@@ -369,9 +436,20 @@ class SQLAlchemyTestBase(FlaskTestBase, DatabaseMixin):
         self.Base.metadata.bind = engine
 
     def tearDown(self):
-        """Drops all tables from the temporary database."""
+        """Drops all tables from the temporary database, clears the
+        :class:`~flask.ext.restless.APIManager` objects known by the
+        global helper functions, and disposes of the mappers of the
+        models created for this test.
+
+        Disposing of the mappers prevents a mapper left unconfigured by
+        this test from breaking the configuration of mappers in a later
+        test, depending on when the garbage collector runs.
+
+        """
         self.session.remove()
         self.Base.metadata.drop_all()
+        unregister_managers()
+        clear_mappers()
 
 
 class ManagerTestBase(SQLAlchemyTestBase):
@@ -397,3 +475,26 @@ class ManagerTestBase(SQLAlchemyTestBase):
         """
         super(ManagerTestBase, self).setUp()
         self.manager = APIManager(self.flaskapp, session=self.session)
+
+    def fetch(self, url, query_string=None):
+        """Makes a :http:method:`get` request for `url`, which must
+        succeed, and returns the response document along with the list
+        of SQL statements executed to compute it.
+
+        """
+        engine = self.Base.metadata.bind
+        with count_statements(engine) as statements:
+            response = self.app.get(url, query_string=query_string)
+        assert response.status_code == 200
+        return loads(response.data), statements
+
+    def fetch_counts(self, url, query_string=None):
+        """Returns the response document for `url`, as :meth:`fetch`
+        does, along with the SQL statements that counted resources to
+        compute it.
+
+        """
+        document, statements = self.fetch(url, query_string)
+        counts = [statement for statement in statements
+                  if 'count(' in statement.lower()]
+        return document, counts
@@ -18,23 +18,33 @@ Flask-Restless meets the minimum requirements of the JSON API
 specification.
 
 """
+from datetime import date
+from itertools import chain
 from itertools import product
 from operator import itemgetter
 from unittest2 import skip
 
 from sqlalchemy import Column
+from sqlalchemy import Date
+from sqlalchemy import event
 from sqlalchemy import ForeignKey
 from sqlalchemy import Integer
 from sqlalchemy import Unicode
+from sqlalchemy import UnicodeText
 from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import backref
 from sqlalchemy.orm import relationship
 
 from flask.ext.restless import APIManager
+from flask.ext.restless import CONTENT_TYPE
 from flask.ext.restless import DefaultSerializer
 from flask.ext.restless import ProcessingException
+from flask.ext.restless import RowSerializer
+from flask_restless.views import helpers
 
 from .helpers import check_sole_error
+from .helpers import count_statements
 from .helpers import dumps
 from .helpers import FlaskSQLAlchemyTestBase
 from .helpers import loads
@@ -280,6 +290,40 @@ class TestFetchCollection(ManagerTestBase):
         assert base_url in pagination['last']
         assert 'foo=bar' in pagination['last']
 
+    def test_include_only_current_page(self):
+        """Tests that related resources are included only for the
+        resources on the requested page, so the number of database
+        queries does not grow with the size of the collection.
+
+        """
+        engine = self.Base.metadata.bind
+
+        def statements_for_collection_of_size(n):
+            self.session.query(self.Article).delete()
+            self.session.query(self.Person).delete()
+            for i in range(1, n + 1):
+                person = self.Person(id=i)
+                article = self.Article(id=i, author=person)
+                self.session.add_all([person, article])
+            self.session.commit()
+            # Expire everything so that related resources must be
+            # loaded from the database during the request.
+            self.session.expunge_all()
+            query_string = {'include': 'author', 'page[size]': 2}
+            with count_statements(engine) as statements:
+                response = self.app.get('/api/article',
+                                        query_string=query_string)
+            assert response.status_code == 200
+            document = loads(response.data)
+            articles = document['data']
+            included = document['included']
+            assert ['1', '2'] == sorted(article['id'] for article in articles)
+            assert ['1', '2'] == sorted(person['id'] for person in included)
+            return len(statements)
+
+        assert statements_for_collection_of_size(5) == \
+            statements_for_collection_of_size(50)
+
     def test_sorting_null_field(self):
         """Tests that sorting by a nullable field causes resources with
         a null attribute value to appear first.
@@ -303,6 +347,889 @@ class TestFetchCollection(ManagerTestBase):
         assert set(['1', '4']) == set(person_ids[:2])
 
 
+class TestEagerLoading(ManagerTestBase):
+    """Tests for eagerly loading related resources that will be included
+    in a compound document.
+
+    """
+
+    def setUp(self):
+        super(TestEagerLoading, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship('Person')
+
+        class Comment(self.Base):
+            __tablename__ = 'comment'
+            id = Column(Integer, primary_key=True)
+            article_id = Column(Integer, ForeignKey('article.id'))
+            article = relationship('Article', backref=backref('comments'))
+
+        self.Article = Article
+        self.Comment = Comment
+        self.Person = Person
+        self.Base.metadata.create_all()
+        # Exclude the to-many relationship from the representation of
+        # articles, so that only the cost of including resources is
+        # measured, not the cost of serializing relationships.
+        self.manager.create_api(Article, exclude=['comments'])
+        self.manager.create_api(Comment)
+        self.manager.create_api(Person)
+
+    def statements_for_page(self, url, include, num_resources):
+        """Creates `num_resources` comments, each on its own article by
+        its own author, then returns the number of SQL statements
+        executed when requesting a page of size `num_resources` from
+        `url` with the given ``include`` query parameter.
+
+        """
+        for i in range(1, num_resources + 1):
+            person = self.Person(id=i)
+            article = self.Article(id=i, author=person)
+            comment = self.Comment(id=i, article=article)
+            self.session.add_all([person, article, comment])
+        self.session.commit()
+        # Expire everything so that related resources must be loaded
+        # from the database during the request.
+        self.session.expunge_all()
+        query_string = {'include': include, 'page[size]': num_resources}
+        document, statements = self.fetch(url, query_string)
+        assert len(document['data']) == num_resources
+        assert len(document['included']) == 2 * num_resources
+        return len(statements)
+
+    def test_to_one_path(self):
+        """Tests that including resources along a path of to-one
+        relationships issues a number of queries independent of the
+        number of primary resources.
+
+        """
+        few = self.statements_for_page('/api/comment', 'article.author', 2)
+        self.session.query(self.Comment).delete()
+        self.session.query(self.Article).delete()
+        self.session.query(self.Person).delete()
+        self.session.commit()
+        many = self.statements_for_page('/api/comment', 'article.author', 10)
+        assert few == many
+
+    def test_to_many_path(self):
+        """Tests that including resources along a path that starts with
+        a to-many relationship issues a number of queries independent
+        of the number of primary resources.
+
+        """
+        few = self.statements_for_page('/api/article', 'comments,author', 2)
+        self.session.query(self.Comment).delete()
+        self.session.query(self.Article).delete()
+        self.session.query(self.Person).delete()
+        self.session.commit()
+        many = self.statements_for_page('/api/article', 'comments,author', 10)
+        assert few == many
+
+
+class TestStreaming(ManagerTestBase):
+    """Tests for streaming responses for collections of resources."""
+
+    def setUp(self):
+        super(TestStreaming, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship('Person', backref=backref('articles'))
+
+        self.Article = Article
+        self.Person = Person
+        self.Base.metadata.create_all()
+
+    def create_articles(self, num_articles):
+        """Creates `num_articles` articles, each written by its own
+        author.
+
+        """
+        for i in range(1, num_articles + 1):
+            person = self.Person(id=i)
+            article = self.Article(id=i, author=person)
+            self.session.add_all([person, article])
+        self.session.commit()
+
+    def test_streamed(self):
+        """Tests that a collection larger than a single batch is
+        streamed in its entirety, along with its included resources.
+
+        """
+        self.manager.create_api(self.Article, page_size=0, streaming=True)
+        self.manager.create_api(self.Person)
+        self.create_articles(250)
+        query_string = {'include': 'author', 'sort': 'id'}
+        response = self.app.get('/api/article', query_string=query_string)
+        assert response.status_code == 200
+        assert 'Content-Length' not in response.headers
+        assert response.mimetype == CONTENT_TYPE
+        document = loads(response.data)
+        articles = document['data']
+        assert [str(i) for i in range(1, 251)] == [a['id'] for a in articles]
+        author = articles[0]['relationships']['author']['data']
+        assert {'type': 'person', 'id': '1'} == author
+        people = document['included']
+        assert [str(i) for i in range(1, 251)] == \
+            sorted((p['id'] for p in people), key=int)
+        assert all(person['type'] == 'person' for person in people)
+        assert document['meta']['total'] == 250
+        assert document['links']['self'].endswith('/api/article')
+
+    def test_same_document(self):
+        """Tests that a streamed response contains the same document as
+        the response that would have been sent otherwise.
+
+        """
+        self.manager.create_api(self.Article)
+        self.manager.create_api(self.Person, streaming=True)
+        self.manager.create_api(self.Person, url_prefix='/api2')
+        self.create_articles(3)
+        streamed = self.app.get('/api/person?include=articles')
+        assert 'Content-Length' not in streamed.headers
+        response = self.app.get('/api2/person?include=articles')
+        assert 'Content-Length' in response.headers
+        document = loads(response.data)
+        streamed_document = loads(streamed.data)
+        for resource in chain(document['data'], document['included']):
+            resource['links']['self'] = None
+        for resource in chain(streamed_document['data'],
+                              streamed_document['included']):
+            resource['links']['self'] = None
+        document['links'] = streamed_document['links'] = None
+        # The order of included resources is unspecified.
+        for doc in document, streamed_document:
+            doc['included'].sort(key=itemgetter('id'))
+        assert document == streamed_document
+
+    def test_relationship(self):
+        """Tests that a response containing resource linkage for a
+        to-many relationship can be streamed.
+
+        """
+        self.manager.create_api(self.Article)
+        self.manager.create_api(self.Person, streaming=True)
+        person = self.Person(id=1)
+        articles = [self.Article(id=i, author=person)
+                    for i in range(1, 151)]
+        self.session.add_all([person] + articles)
+        self.session.commit()
+        response = self.app.get('/api/person/1/relationships/articles')
+        assert response.status_code == 200
+        assert 'Content-Length' not in response.headers
+        document = loads(response.data)
+        identifiers = document['data']
+        assert len(identifiers) == 10
+        assert all(i['type'] == 'article' for i in identifiers)
+        assert document['meta']['total'] == 150
+
+    def test_jsonp(self):
+        """Tests for a JSON-P callback on a streamed response."""
+        self.manager.create_api(self.Article)
+        self.manager.create_api(self.Person, streaming=True)
+        self.create_articles(2)
+        response = self.app.get('/api/person?callback=foo')
+        assert 'Content-Length' not in response.headers
+        assert response.mimetype == 'application/javascript'
+        assert response.data.startswith(b'foo(')
+        assert response.data.endswith(b')')
+        document = loads(response.data[4:-1])
+        people = document['data']
+        assert ['1', '2'] == sorted(person['id'] for person in people)
+        assert document['meta']['status'] == 200
+
+    def test_postprocessor(self):
+        """Tests that a response is not streamed if a postprocessor must
+        be applied to the complete document.
+
+        """
+
+        def count_data(result=None, **kw):
+            result['meta']['foo'] = len(result['data'])
+
+        postprocessors = dict(GET_COLLECTION=[count_data])
+        self.manager.create_api(self.Article, streaming=True,
+                                postprocessors=postprocessors)
+        self.manager.create_api(self.Person)
+        self.create_articles(2)
+        response = self.app.get('/api/article')
+        assert 'Content-Length' in response.headers
+        document = loads(response.data)
+        assert document['meta']['foo'] == 2
+
+
+class TestCountPolicy(ManagerTestBase):
+    """Tests for the policies for counting the total number of resources
+    in a collection.
+
+    """
+
+    def setUp(self):
+        super(TestCountPolicy, self).setUp()
+
+        class PersonTag(self.Base):
+            __tablename__ = 'person_tag'
+            person_id = Column(Integer, ForeignKey('person.id'),
+                               primary_key=True)
+            tag_id = Column(Integer, ForeignKey('tag.id'), primary_key=True)
+
+        class Tag(self.Base):
+            __tablename__ = 'tag'
+            id = Column(Integer, primary_key=True)
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+            tags = relationship(Tag, secondary='person_tag')
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship(Person, backref=backref('articles'))
+
+        self.Article = Article
+        self.Person = Person
+        self.PersonTag = PersonTag
+        self.Tag = Tag
+        self.Base.metadata.create_all()
+        self.session.add_all(Person(id=i) for i in range(1, 16))
+        self.session.commit()
+
+    def test_exact(self):
+        """Tests that the exact count is computed by default."""
+        self.manager.create_api(self.Person)
+        document, counts = self.fetch_counts('/api/person')
+        assert document['meta']['total'] == 15
+        assert len(counts) == 1
+
+    def test_none(self):
+        """Tests that the resources are not counted if the count policy
+        is ``'none'``, but the next link is still correct.
+
+        """
+        self.manager.create_api(self.Person, count_policy='none')
+        document, counts = self.fetch_counts('/api/person')
+        assert 'total' not in document['meta']
+        assert len(counts) == 0
+        links = document['links']
+        assert links['last'] is None
+        assert 'page[number]=2' in links['next']
+        query_string = {'page[number]': 2}
+        document, counts = self.fetch_counts('/api/person', query_string)
+        assert len(document['data']) == 5
+        links = document['links']
+        assert links['last'] is None
+        assert links['next'] is None
+        assert 'page[number]=1' in links['prev']
+
+    def test_client_disables_count(self):
+        """Tests that the client can request that the resources not be
+        counted.
+
+        """
+        self.manager.create_api(self.Person)
+        query_string = {'page[count]': 'false'}
+        document, counts = self.fetch_counts('/api/person', query_string)
+        assert 'total' not in document['meta']
+        assert len(counts) == 0
+        links = document['links']
+        assert links['last'] is None
+        # The parameter is preserved in the pagination links.
+        assert 'page[count]=false' in links['next']
+
+    def test_bad_count_parameter(self):
+        """Tests that an invalid value for the ``page[count]`` query
+        parameter causes an error response.
+
+        """
+        self.manager.create_api(self.Person)
+        query_string = {'page[count]': 'bogus'}
+        response = self.app.get('/api/person', query_string=query_string)
+        check_sole_error(response, 400, ['page[count]', 'true or false'])
+
+    def test_cached(self):
+        """Tests that counts are cached until a resource is written."""
+        self.manager.create_api(self.Person, methods=['GET', 'POST'],
+                                count_policy='cached')
+        document, counts = self.fetch_counts('/api/person')
+        assert document['meta']['total'] == 15
+        assert len(counts) == 1
+        document, counts = self.fetch_counts('/api/person')
+        assert document['meta']['total'] == 15
+        assert len(counts) == 0
+        # Filtered collections are counted separately.
+        filters = [dict(name='id', op='gt', val=10)]
+        query_string = {'filter[objects]': dumps(filters)}
+        document, counts = self.fetch_counts('/api/person', query_string)
+        assert document['meta']['total'] == 5
+        assert len(counts) == 1
+        # Creating a resource invalidates the cached counts.
+        data = dict(data=dict(type='person'))
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 201
+        document, counts = self.fetch_counts('/api/person')
+        assert document['meta']['total'] == 16
+        assert len(counts) == 1
+        # So does a write that does not go through the API.
+        self.session.add(self.Person(id=17))
+        self.session.commit()
+        document, counts = self.fetch_counts('/api/person', query_string)
+        assert document['meta']['total'] == 7
+
+    def test_cached_relation(self):
+        """Tests that the cached count of a to-many relation is
+        invalidated when a related resource is written.
+
+        """
+        self.manager.create_api(self.Person, count_policy='cached')
+        self.manager.create_api(self.Article)
+        person = self.session.query(self.Person).get(1)
+        self.session.add(self.Article(id=1, author=person))
+        self.session.commit()
+        document, counts = self.fetch_counts('/api/person/1/articles')
+        assert document['meta']['total'] == 1
+        document, counts = self.fetch_counts('/api/person/2/articles')
+        assert document['meta']['total'] == 0
+        self.session.add(self.Article(id=2, author=person))
+        self.session.commit()
+        document, counts = self.fetch_counts('/api/person/1/articles')
+        assert document['meta']['total'] == 2
+
+    def test_cached_many_to_many(self):
+        """Tests that the cached count of a many-to-many relation is
+        invalidated when only the association table is written, even
+        outside of the unit of work.
+
+        """
+        self.manager.create_api(self.Person, count_policy='cached')
+        self.manager.create_api(self.Tag)
+        tag = self.Tag(id=1)
+        self.session.add(tag)
+        self.session.commit()
+        document, counts = self.fetch_counts('/api/person/1/tags')
+        assert document['meta']['total'] == 0
+        insert = self.PersonTag.__table__.insert()
+        self.session.execute(insert.values(person_id=1, tag_id=1))
+        self.session.commit()
+        document, counts = self.fetch_counts('/api/person/1/tags')
+        assert document['meta']['total'] == 1
+
+    def test_cached_count_before_commit(self):
+        """Tests that a count computed after a write but before its
+        commit, which may not see the write, is invalidated by the
+        commit.
+
+        """
+        cache = helpers.CountCache()
+        query = self.session.query(self.Person)
+        engine = self.Base.metadata.bind
+        connection = engine.connect()
+        transaction = connection.begin()
+        connection.execute(self.Person.__table__.insert().values(id=16))
+        # Another connection, which cannot see the uncommitted row,
+        # counts the people in the meantime.
+        assert cache.get('key', query, lambda: 15) == 15
+        transaction.commit()
+        connection.close()
+        assert cache.get('key', query, lambda: 16) == 16
+
+    def test_cached_filter_on_related_model(self):
+        """Tests that the cached count of a collection filtered by a
+        related model is invalidated when the related model is written.
+
+        """
+        self.manager.create_api(self.Article, count_policy='cached')
+        self.manager.create_api(self.Person)
+        person = self.session.query(self.Person).get(1)
+        self.session.add(self.Article(id=1, author=person))
+        self.session.commit()
+        filters = [dict(name='author', op='has',
+                        val=dict(name='name', op='eq', val='foo'))]
+        query_string = {'filter[objects]': dumps(filters)}
+        document, counts = self.fetch_counts('/api/article', query_string)
+        assert document['meta']['total'] == 0
+        person = self.session.query(self.Person).get(1)
+        person.name = u'foo'
+        self.session.commit()
+        document, counts = self.fetch_counts('/api/article', query_string)
+        assert document['meta']['total'] == 1
+
+    def test_cache_expires(self):
+        """Tests that cached counts expire."""
+        self.manager.create_api(self.Person, count_policy='cached',
+                                count_ttl=0)
+        self.fetch_counts('/api/person')
+        document, counts = self.fetch_counts('/api/person')
+        assert len(counts) == 1
+
+    def test_estimated(self):
+        """Tests that the count of an unfiltered collection is estimated
+        from the statistics of the database.
+
+        """
+        self.manager.create_api(self.Person, count_policy='estimated')
+        # Without statistics, the resources are counted exactly.
+        document, counts = self.fetch_counts('/api/person')
+        assert document['meta']['total'] == 15
+        assert len(counts) == 1
+        self.session.execute('ANALYZE')
+        self.session.add(self.Person(id=16))
+        self.session.commit()
+        # The statistics have not been updated since the new resource
+        # was created.
+        document, counts = self.fetch_counts('/api/person')
+        assert document['meta']['total'] == 15
+        assert len(counts) == 0
+        # A filtered collection is always counted exactly.
+        filters = [dict(name='id', op='gt', val=10)]
+        query_string = {'filter[objects]': dumps(filters)}
+        document, counts = self.fetch_counts('/api/person', query_string)
+        assert document['meta']['total'] == 6
+
+
+class TestCountQuery(ManagerTestBase):
+    """Tests that the query that counts the resources in a collection
+    omits the ordering and any joins that do not change the count.
+
+    """
+
+    def setUp(self):
+        super(TestCountQuery, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'),
+                               nullable=False)
+            author = relationship(Person, backref=backref('articles'))
+
+        class Comment(self.Base):
+            __tablename__ = 'comment'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship(Person)
+
+        self.Article = Article
+        self.Comment = Comment
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.manager.create_api(Article)
+        self.manager.create_api(Comment)
+        self.manager.create_api(Person)
+
+    def test_sort_by_to_one(self):
+        """Tests that a join added only to sort by a field of a related
+        model is omitted from the count if the foreign key is not
+        nullable.
+
+        """
+        person1 = self.Person(id=1, name=u'foo')
+        person2 = self.Person(id=2, name=u'bar')
+        self.session.add_all([person1, person2])
+        self.session.add_all(self.Article(id=i, author=person1 if i % 2
+                                          else person2)
+                             for i in range(1, 5))
+        self.session.commit()
+        query_string = {'sort': 'author.name'}
+        document, counts = self.fetch_counts('/api/article', query_string)
+        assert document['meta']['total'] == 4
+        articles = document['data']
+        assert set(['2', '4']) == set(a['id'] for a in articles[:2])
+        assert len(counts) == 1
+        statement = counts[0].upper()
+        assert 'JOIN' not in statement
+        assert 'ORDER BY' not in statement
+
+    def test_sort_by_nullable_to_one(self):
+        """Tests that a join on a nullable foreign key is kept in the
+        count, since it excludes the resources with no related resource.
+
+        """
+        person = self.Person(id=1, name=u'foo')
+        self.session.add_all([self.Comment(id=1, author=person),
+                              self.Comment(id=2)])
+        self.session.commit()
+        query_string = {'sort': 'author.name'}
+        document, counts = self.fetch_counts('/api/comment', query_string)
+        assert document['meta']['total'] == len(document['data']) == 1
+        assert 'JOIN' in counts[0].upper()
+
+    def test_filtered_relation(self):
+        """Tests that the count of a filtered to-many relation does not
+        include the ordering.
+
+        """
+        person = self.Person(id=1)
+        self.session.add(person)
+        self.session.add_all(self.Article(id=i, author=person)
+                             for i in range(1, 5))
+        self.session.commit()
+        filters = [dict(name='id', op='gt', val=2)]
+        query_string = {'filter[objects]': dumps(filters), 'sort': '-id'}
+        document, counts = self.fetch_counts('/api/person/1/articles',
+                                      query_string)
+        assert document['meta']['total'] == 2
+        assert 'ORDER BY' not in counts[0].upper()
+
+
+class TestDeferredJoin(ManagerTestBase):
+    """Tests that deep pages are selected by first selecting the primary
+    keys of the resources on the page.
+
+    """
+
+    def setUp(self):
+        super(TestDeferredJoin, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.session.add_all(Person(id=i, name=u'{0:02d}'.format(i % 7))
+                             for i in range(1, 31))
+        self.session.commit()
+        self.manager.create_api(Person)
+        # Use a deferred join for every page after the first.
+        self.min_offset = helpers.DEFERRED_JOIN_MIN_OFFSET
+        helpers.DEFERRED_JOIN_MIN_OFFSET = 1
+
+    def tearDown(self):
+        helpers.DEFERRED_JOIN_MIN_OFFSET = self.min_offset
+        super(TestDeferredJoin, self).tearDown()
+
+    def fetch_ids(self, query_string):
+        """Returns the IDs of the people on the requested page and the
+        SQL statements executed to fetch it.
+
+        """
+        document, statements = self.fetch('/api/person', query_string)
+        return [int(person['id']) for person in document['data']], statements
+
+    def test_deep_page(self):
+        """Tests that a deep page is selected by a deferred join and
+        contains the same resources as it would otherwise.
+
+        """
+        query_string = {'page[number]': 3, 'page[size]': 10, 'sort': '-id'}
+        ids, statements = self.fetch_ids(query_string)
+        assert ids == list(range(10, 0, -1))
+        selects = [statement for statement in statements
+                   if 'OFFSET' in statement.upper()]
+        assert len(selects) == 1
+        assert 'JOIN' in selects[0].upper()
+
+    def test_filtered_and_sorted(self):
+        """Tests that the filters and the order of the collection apply
+        to a page selected by a deferred join.
+
+        """
+        filters = [dict(name='id', op='gt', val=10)]
+        query_string = {'filter[objects]': dumps(filters),
+                        'page[number]': 2, 'page[size]': 5,
+                        'sort': 'name,id'}
+        ids, statements = self.fetch_ids(query_string)
+        people = sorted((self.session.query(self.Person)
+                         .filter(self.Person.id > 10)),
+                        key=lambda person: (person.name, person.id))
+        assert ids == [person.id for person in people][5:10]
+
+    def test_first_page(self):
+        """Tests that the first page is selected without a deferred
+        join.
+
+        """
+        ids, statements = self.fetch_ids({'page[size]': 10})
+        assert ids == list(range(1, 11))
+        assert not any('JOIN' in statement.upper()
+                       for statement in statements)
+
+
+class TestCursorPagination(ManagerTestBase):
+    """Tests for paginating collections by cursor, with the
+    ``page[after]`` and ``page[before]`` query parameters.
+
+    """
+
+    def setUp(self):
+        super(TestCursorPagination, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+            birthday = Column(Date)
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship(Person, backref=backref('articles'))
+
+        self.Article = Article
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.manager.create_api(Article)
+        self.manager.create_api(Person, page_size=3)
+        # There are only three distinct names, so the primary key must
+        # break ties between people with the same name.
+        people = [Person(id=i, name=u'abc'[i % 3],
+                         birthday=date(2000, 1, 1 + (i * 7) % 10))
+                  for i in range(1, 11)]
+        self.session.add_all(people)
+        self.session.commit()
+
+    def follow(self, url, rel, query_string=None):
+        """Follows the `rel` pagination links starting from `url` and
+        returns the list of the IDs of the resources on each page.
+
+        """
+        pages = []
+        while url is not None:
+            response = self.app.get(url, query_string=query_string)
+            assert response.status_code == 200
+            document = loads(response.data)
+            pages.append([person['id'] for person in document['data']])
+            assert document['meta']['total'] == 10
+            url = document['links'][rel]
+            query_string = None
+        return pages
+
+    def test_forward(self):
+        """Tests that following the next links from the first page
+        yields each resource once, in order.
+
+        """
+        query_string = {'page[after]': ''}
+        pages = self.follow('/api/person', 'next', query_string)
+        assert pages == [['1', '2', '3'], ['4', '5', '6'], ['7', '8', '9'],
+                         ['10']]
+
+    def test_backward(self):
+        """Tests that following the prev links from the last page yields
+        each resource once, in order.
+
+        """
+        query_string = {'page[before]': ''}
+        pages = self.follow('/api/person', 'prev', query_string)
+        assert pages == [['8', '9', '10'], ['5', '6', '7'], ['2', '3', '4'],
+                         ['1']]
+
+    def test_sorted(self):
+        """Tests that pagination by cursor respects the requested sort
+        order, with the primary key breaking ties.
+
+        """
+        expected = sorted(range(1, 11), key=lambda i: ('abc'[i % 3], -i),
+                          reverse=True)
+        expected = [str(i) for i in expected]
+        query_string = {'page[after]': '', 'sort': '-name'}
+        pages = self.follow('/api/person', 'next', query_string)
+        assert list(chain(*pages)) == expected
+        query_string = {'page[before]': '', 'sort': '-name'}
+        pages = self.follow('/api/person', 'prev', query_string)
+        assert list(chain(*reversed(pages))) == expected
+
+    def test_date(self):
+        """Tests that a cursor may contain the value of a date."""
+        expected = sorted(range(1, 11), key=lambda i: (i * 7) % 10)
+        expected = [str(i) for i in expected]
+        query_string = {'page[after]': '', 'sort': 'birthday'}
+        pages = self.follow('/api/person', 'next', query_string)
+        assert list(chain(*pages)) == expected
+
+    def test_links(self):
+        """Tests for the pagination links on a page in the middle of the
+        collection.
+
+        """
+        query_string = {'page[after]': ''}
+        response = self.app.get('/api/person', query_string=query_string)
+        document = loads(response.data)
+        response = self.app.get(document['links']['next'])
+        document = loads(response.data)
+        links = document['links']
+        assert 'page[after]=&' in links['first'] + '&'
+        assert 'page[before]=&' in links['last'] + '&'
+        assert 'page[before]=' in links['prev']
+        assert 'page[after]=' in links['next']
+        assert 'page[number]' not in links['next']
+        response = self.app.get(links['prev'])
+        document = loads(response.data)
+        assert ['1', '2', '3'] == [p['id'] for p in document['data']]
+        assert document['links']['prev'] is None
+
+    def test_seek(self):
+        """Tests that a page is found by filtering on the sort keys
+        instead of by skipping rows.
+
+        """
+        query_string = {'page[after]': ''}
+        response = self.app.get('/api/person', query_string=query_string)
+        document = loads(response.data)
+        document, statements = self.fetch(document['links']['next'])
+        selects = [statement for statement in statements
+                   if 'person.name AS person_name' in statement]
+        assert len(selects) == 1
+        assert 'WHERE person.id >= ?' in selects[0]
+
+    def test_to_many_relation(self):
+        """Tests for paginating a to-many relation by cursor."""
+        person = self.session.query(self.Person).get(1)
+        articles = [self.Article(id=i, author=person) for i in range(1, 6)]
+        self.session.add_all(articles)
+        self.session.commit()
+        query_string = {'page[after]': '', 'page[size]': 2}
+        response = self.app.get('/api/person/1/articles',
+                                query_string=query_string)
+        assert response.status_code == 200
+        document = loads(response.data)
+        assert ['1', '2'] == [article['id'] for article in document['data']]
+        response = self.app.get(document['links']['next'])
+        document = loads(response.data)
+        assert ['3', '4'] == [article['id'] for article in document['data']]
+
+    def test_invalid_cursor(self):
+        """Tests that an invalid cursor causes an error response."""
+        query_string = {'page[after]': 'bogus'}
+        response = self.app.get('/api/person', query_string=query_string)
+        check_sole_error(response, 400, ['Invalid cursor'])
+
+    def test_both_cursors(self):
+        """Tests that specifying both an after and a before cursor
+        causes an error response.
+
+        """
+        query_string = {'page[after]': '', 'page[before]': ''}
+        response = self.app.get('/api/person', query_string=query_string)
+        check_sole_error(response, 400, ['Cannot specify both'])
+
+    def test_sort_by_relationship(self):
+        """Tests that sorting by a field of a related model while
+        paginating by cursor causes an error response.
+
+        """
+        query_string = {'page[after]': '', 'sort': 'author.name'}
+        response = self.app.get('/api/article', query_string=query_string)
+        check_sole_error(response, 400, ['related model'])
+
+
+class TestWindowCount(ManagerTestBase):
+    """Tests for counting the resources in a collection with a window
+    function in the same query as the requested page.
+
+    """
+
+    def setUp(self):
+        super(TestWindowCount, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship(Person, backref=backref('articles'))
+
+        self.Article = Article
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.manager.create_api(Article, window_count=True)
+        self.manager.create_api(Person, window_count=True)
+
+    def test_single_query(self):
+        """Tests that the page and the total are fetched in a single
+        query.
+
+        """
+        self.session.add_all(self.Person(id=i) for i in range(1, 26))
+        self.session.commit()
+        query_string = {'page[number]': 2}
+        document, statements = self.fetch('/api/person', query_string)
+        assert len(statements) == 2
+        assert 'OVER ()' in statements[0]
+        assert document['meta']['total'] == 25
+        people = document['data']
+        assert [str(i) for i in range(11, 21)] == [p['id'] for p in people]
+        links = document['links']
+        assert 'page[number]=3' in links['last']
+        assert 'page[number]=3' in links['next']
+
+    def test_empty_collection(self):
+        """Tests that an empty collection needs no separate count."""
+        document, statements = self.fetch('/api/person')
+        assert document['data'] == []
+        assert document['meta']['total'] == 0
+        assert len(statements) == 1
+
+    def test_past_last_page(self):
+        """Tests that the total is counted separately for an empty page
+        past the end of the collection.
+
+        """
+        self.session.add_all(self.Person(id=i) for i in range(1, 6))
+        self.session.commit()
+        query_string = {'page[number]': 3}
+        document, statements = self.fetch('/api/person', query_string)
+        assert document['data'] == []
+        assert document['meta']['total'] == 5
+
+    def test_include(self):
+        """Tests that the total is correct when related resources are
+        loaded along with the page.
+
+        """
+        person = self.Person(id=1)
+        articles = [self.Article(id=i, author=person) for i in range(1, 16)]
+        self.session.add(person)
+        self.session.add_all(articles)
+        self.session.commit()
+        query_string = {'include': 'author'}
+        document, statements = self.fetch('/api/article', query_string)
+        assert document['meta']['total'] == 15
+        assert len(document['data']) == 10
+        assert [p['id'] for p in document['included']] == ['1']
+        query_string = {'include': 'articles'}
+        document, statements = self.fetch('/api/person', query_string)
+        assert document['meta']['total'] == 1
+        assert len(document['included']) == 15
+
+    def test_filter(self):
+        """Tests that the total counts only the filtered resources."""
+        self.session.add_all(self.Person(id=i) for i in range(1, 26))
+        self.session.commit()
+        filters = [dict(name='id', op='gt', val=20)]
+        query_string = {'filter[objects]': dumps(filters)}
+        document, statements = self.fetch('/api/person', query_string)
+        assert document['meta']['total'] == 5
+        assert len(document['data']) == 5
+
+
 class TestFetchResource(ManagerTestBase):
 
     def setUp(self):
@@ -533,6 +1460,26 @@ class TestFetchRelation(ManagerTestBase):
         assert ['a', 'b'] == sorted(article['attributes']['title']
                                     for article in articles)
 
+    def test_to_many_not_loaded(self):
+        """Tests that fetching a page of a to-many relation restricts
+        the query by the join condition of the relationship instead of
+        loading every related resource first.
+
+        """
+        person = self.Person(id=1)
+        articles = [self.Article(id=i) for i in range(10)]
+        person.articles = articles
+        self.session.add(person)
+        self.session.add_all(articles)
+        self.session.commit()
+        self.session.expunge_all()
+        params = {'page[number]': 2, 'page[size]': 3}
+        document, statements = self.fetch('/api/person/1/articles', params)
+        articles = document['data']
+        assert ['3', '4', '5'] == sorted(article['id'] for article in articles)
+        assert document['meta']['total'] == 10
+        assert not any('article.id IN' in s for s in statements)
+
 
 class TestFetchRelatedResource(ManagerTestBase):
 
@@ -994,6 +1941,279 @@ class TestServerSparseFieldsets(ManagerTestBase):
         assert 'person' == author['type']
 
 
+class TestColumnLoading(ManagerTestBase):
+    """Tests that only the columns needed to serialize the requested
+    fields are loaded from the database.
+
+    """
+
+    def setUp(self):
+        super(TestColumnLoading, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            title = Column(Unicode)
+            body = Column(UnicodeText)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship(Person, backref=backref('articles'))
+
+            @hybrid_property
+            def summary(self):
+                return self.body[:5]
+
+        self.Article = Article
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.manager.create_api(Person)
+
+    def fetch_select(self, url, query_string=None):
+        """Creates an article and returns the response document for
+        `url` along with the last SQL statement that selected articles.
+
+        """
+        person = self.Person(id=1)
+        article = self.Article(id=1, title=u'foo', body=u'bar baz',
+                               author=person)
+        self.session.add_all([person, article])
+        self.session.commit()
+        self.session.expunge_all()
+        document, statements = self.fetch(url, query_string)
+        selects = [statement for statement in statements
+                   if 'article.id AS article_id' in statement]
+        return document, selects[-1]
+
+    def test_sparse_fieldsets(self):
+        """Tests that columns not in the requested sparse fieldset are
+        not loaded, but primary and foreign keys are.
+
+        """
+        self.manager.create_api(self.Article)
+        query_string = {'fields[article]': 'title,author'}
+        document, select = self.fetch_select('/api/article', query_string)
+        assert 'article.body' not in select
+        assert 'article.title' in select
+        assert 'article.id' in select
+        assert 'article.author_id' in select
+        article = document['data'][0]
+        assert article['attributes'] == {'title': u'foo'}
+        author = article['relationships']['author']['data']
+        assert author == {'type': 'person', 'id': '1'}
+
+    def test_exclude(self):
+        """Tests that columns excluded by the server are not loaded."""
+        self.manager.create_api(self.Article, exclude=['body', 'summary'])
+        document, select = self.fetch_select('/api/article')
+        assert 'article.body' not in select
+        article = document['data'][0]
+        assert article['attributes'] == {'title': u'foo'}
+
+    def test_hybrid_property(self):
+        """Tests that all columns are loaded if a hybrid property, whose
+        value may depend on any column, is requested.
+
+        """
+        self.manager.create_api(self.Article)
+        query_string = {'fields[article]': 'summary'}
+        document, select = self.fetch_select('/api/article', query_string)
+        assert 'article.body' in select
+        article = document['data'][0]
+        assert article['attributes'] == {'summary': u'bar b'}
+
+    def test_relationship(self):
+        """Tests that only the primary and foreign keys are loaded when
+        fetching the resource linkage of a to-many relationship.
+
+        """
+        self.manager.create_api(self.Article)
+        url = '/api/person/1/relationships/articles'
+        document, select = self.fetch_select(url)
+        assert 'article.title' not in select
+        assert 'article.body' not in select
+        assert document['data'] == [{'type': 'article', 'id': '1'}]
+
+
+class TestRowMode(ManagerTestBase):
+    """Tests for serializing collections directly from the rows of a
+    query.
+
+    """
+
+    def setUp(self):
+        super(TestRowMode, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            title = Column(Unicode)
+            date_published = Column(Date)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship(Person, backref=backref('articles'))
+
+        class Comment(self.Base):
+            __tablename__ = 'comment'
+            id = Column(Integer, primary_key=True)
+            text = Column(Unicode)
+
+            @hybrid_property
+            def shout(self):
+                return self.text.upper()
+
+        self.Article = Article
+        self.Comment = Comment
+        self.Person = Person
+        self.Base.metadata.create_all()
+
+        person1 = Person(id=1, name=u'foo')
+        person2 = Person(id=2, name=u'bar')
+        article1 = Article(id=1, title=u'baz', author=person1,
+                           date_published=date(2016, 1, 2))
+        article2 = Article(id=2, title=u'qux', author=person1)
+        article3 = Article(id=3, title=u'quux')
+        comment = Comment(id=1, text=u'baz')
+        self.session.add_all([person1, person2, article1, article2,
+                              article3, comment])
+        self.session.commit()
+        self.session.expunge_all()
+
+        # Record each instance of a model loaded from the database.
+        self.loaded = []
+
+        def record(instance, context):
+            self.loaded.append(instance)
+
+        event.listen(Article, 'load', record)
+        event.listen(Person, 'load', record)
+        event.listen(Comment, 'load', record)
+
+    def test_no_instances(self):
+        """Tests that fetching a collection in row mode does not load
+        any instances of the model.
+
+        """
+        self.manager.create_api(self.Article, row_mode=True)
+        self.manager.create_api(self.Person, row_mode=True)
+        query_string = {'sort': 'id'}
+        response = self.app.get('/api/article', query_string=query_string)
+        assert response.status_code == 200
+        document = loads(response.data)
+        articles = document['data']
+        assert ['1', '2', '3'] == [article['id'] for article in articles]
+        assert len(self.loaded) == 0
+        response = self.app.get('/api/person', query_string=query_string)
+        assert response.status_code == 200
+        assert len(self.loaded) == 0
+
+    def test_same_document(self):
+        """Tests that the resource objects serialized in row mode are
+        the same as those serialized from instances.
+
+        """
+        self.manager.create_api(self.Article, row_mode=True)
+        self.manager.create_api(self.Person, row_mode=True)
+        query_string = {'sort': 'id'}
+        response = self.app.get('/api/article', query_string=query_string)
+        rows = loads(response.data)['data']
+        # Serializing a single resource always uses instances.
+        instances = [loads(self.app.get('/api/article/{0}'.format(i)).data)
+                     for i in range(1, 4)]
+        assert rows == [document['data'] for document in instances]
+        response = self.app.get('/api/person', query_string=query_string)
+        rows = loads(response.data)['data']
+        instances = [loads(self.app.get('/api/person/{0}'.format(i)).data)
+                     for i in range(1, 3)]
+        assert rows == [document['data'] for document in instances]
+
+    def test_values(self):
+        """Tests for the attribute values and resource linkage of
+        resource objects serialized in row mode.
+
+        """
+        self.manager.create_api(self.Article, row_mode=True)
+        self.manager.create_api(self.Person, row_mode=True)
+        query_string = {'sort': 'id'}
+        response = self.app.get('/api/article', query_string=query_string)
+        article1, article2, article3 = loads(response.data)['data']
+        assert article1['attributes']['date_published'] == '2016-01-02'
+        assert article2['attributes']['date_published'] is None
+        author = article1['relationships']['author']['data']
+        assert author == {'type': 'person', 'id': '1'}
+        assert article3['relationships']['author']['data'] is None
+        response = self.app.get('/api/person', query_string=query_string)
+        person1, person2 = loads(response.data)['data']
+        articles = person1['relationships']['articles']['data']
+        assert sorted(article['id'] for article in articles) == ['1', '2']
+        assert person2['relationships']['articles']['data'] == []
+
+    def test_sparse_fieldsets(self):
+        """Tests that row mode respects sparse fieldsets."""
+        self.manager.create_api(self.Article, row_mode=True)
+        query_string = {'sort': 'id', 'fields[article]': 'title'}
+        response = self.app.get('/api/article', query_string=query_string)
+        article = loads(response.data)['data'][0]
+        assert article['attributes'] == {'title': u'baz'}
+        assert 'relationships' not in article
+        assert len(self.loaded) == 0
+
+    def test_hybrid_property(self):
+        """Tests that instances are loaded when a hybrid property is
+        requested.
+
+        """
+        self.manager.create_api(self.Comment, row_mode=True)
+        response = self.app.get('/api/comment')
+        assert response.status_code == 200
+        comment = loads(response.data)['data'][0]
+        assert comment['attributes'] == {'text': u'baz', 'shout': u'BAZ'}
+        assert len(self.loaded) > 0
+
+    def test_include(self):
+        """Tests that instances are loaded when related resources are
+        included.
+
+        """
+        self.manager.create_api(self.Article, row_mode=True)
+        self.manager.create_api(self.Person, row_mode=True)
+        query_string = {'sort': 'id', 'include': 'author',
+                        'page[size]': 2}
+        response = self.app.get('/api/article', query_string=query_string)
+        assert response.status_code == 200
+        document = loads(response.data)
+        assert len(document['data']) == 2
+        assert [person['id'] for person in document['included']] == ['1']
+
+    def test_serializer_class(self):
+        """Tests that row mode uses a subclass of
+        :class:`RowSerializer` specified by the user.
+
+        """
+
+        class MySerializer(RowSerializer):
+
+            def serialize_query(self, model, query, only=None):
+                result = super(MySerializer, self).serialize_query(model,
+                                                                  query,
+                                                                  only=only)
+                result['meta'] = {'foo': 'bar'}
+                return result
+
+        self.manager.create_api(self.Article, row_mode=True,
+                                serializer_class=MySerializer)
+        self.manager.create_api(self.Person)
+        response = self.app.get('/api/article')
+        document = loads(response.data)
+        assert document['meta']['foo'] == 'bar'
+
+
 class TestProcessors(ManagerTestBase):
     """Tests for pre- and postprocessors."""
 
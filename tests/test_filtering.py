@@ -13,7 +13,7 @@
 from datetime import date
 from datetime import datetime
 from datetime import time
-from unittest2 import skip
+from threading import Thread
 
 # This import is unused but is required for testing on PyPy. CPython can
 # use psycopg2, but PyPy can only use psycopg2cffi.
@@ -35,7 +35,13 @@ from sqlalchemy.orm import backref
 from sqlalchemy.orm import relationship
 from testing.postgresql import PostgresqlFactory as PGFactory
 
+from flask_restless.search import filter_cache
+from flask_restless.search import filter_schemas
+from flask_restless.search import operators
+from flask_restless.search.filters import FilterCache
+
 from .helpers import check_sole_error
+from .helpers import count_statements
 from .helpers import dumps
 from .helpers import loads
 from .helpers import ManagerTestBase
@@ -701,8 +707,6 @@ class TestFiltering(SearchTestBase):
         assert len(people) == 2
         assert ['2', '3'] == sorted(person['id'] for person in people)
 
-    @skip("I'm not certain in what situations an invalid value should cause"
-          " a SQLAlchemy error")
     def test_invalid_value(self):
         """Tests for an error response on an invalid value in a filter object.
 
@@ -781,6 +785,339 @@ class TestFiltering(SearchTestBase):
         assert ['3', '4'] == sorted(article['id'] for article in articles)
 
 
+class TestFilterCache(SearchTestBase):
+    """Tests that filters that differ only in their values are compiled
+    once and give the same results as filters compiled separately.
+
+    """
+
+    def setUp(self):
+        super(TestFilterCache, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+            birthday = Column(Date)
+
+        class Comment(self.Base):
+            __tablename__ = 'comment'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship(Person, backref=backref('comments'))
+
+        self.Person = Person
+        self.Comment = Comment
+        self.Base.metadata.create_all()
+        self.manager.create_api(Person)
+        self.manager.create_api(Comment)
+        people = [Person(id=i, name=u'person{0}'.format(i),
+                         birthday=date(1990, 1, i)) for i in range(1, 11)]
+        self.session.add_all(people)
+        self.session.add_all(Comment(id=i, author=people[i % 3])
+                             for i in range(1, 7))
+        self.session.commit()
+
+    def search_ids(self, filters):
+        """Returns the IDs of the people that match `filters`."""
+        response = self.search('/api/person', filters)
+        assert response.status_code == 200
+        document = loads(response.data)
+        return sorted(int(person['id']) for person in document['data'])
+
+    def test_same_shape(self):
+        """Tests that filters of the same shape with different values
+        share a cache entry.
+
+        """
+        filters = [dict(name='id', op='gt', val=5)]
+        assert self.search_ids(filters) == [6, 7, 8, 9, 10]
+        assert len(filter_cache._entries) == 1
+        filters = [dict(name='id', op='gt', val=8)]
+        assert self.search_ids(filters) == [9, 10]
+        assert len(filter_cache._entries) == 1
+        filters = [dict(name='id', op='lt', val=3)]
+        assert self.search_ids(filters) == [1, 2]
+        assert len(filter_cache._entries) == 2
+
+    def test_boolean_formula(self):
+        """Tests for values in nested Boolean formulas and lists."""
+        def filters(low, ids):
+            in_ = dict(name='id', op='in', val=ids)
+            like = dict(name='name', op='like', val='person%')
+            return [{'or': [dict(name='id', op='lt', val=low),
+                            {'and': [like, in_]}]}]
+        assert self.search_ids(filters(2, [7, 8])) == [1, 7, 8]
+        assert self.search_ids(filters(4, [9, 10])) == [1, 2, 3, 9, 10]
+        # A list of a different length has a different shape.
+        assert self.search_ids(filters(1, [5])) == [5]
+        assert len(filter_cache._entries) == 2
+
+    def test_dates(self):
+        """Tests that date strings are converted before they are bound,
+        and that comparisons to the current date are not cached.
+
+        """
+        filters = [dict(name='birthday', op='ge', val='1990-01-08')]
+        assert self.search_ids(filters) == [8, 9, 10]
+        filters = [dict(name='birthday', op='ge', val='1990-01-09')]
+        assert self.search_ids(filters) == [9, 10]
+        filters = [dict(name='birthday', op='lt', val='CURRENT_DATE')]
+        assert self.search_ids(filters) == list(range(1, 11))
+
+    def test_relationship_operator(self):
+        """Tests for values in the filter of a relationship operator."""
+        def filters(value):
+            return [dict(name='comments', op='any',
+                         val=dict(name='id', op='gt', val=value))]
+        assert self.search_ids(filters(3)) == [1, 2, 3]
+        assert self.search_ids(filters(5)) == [1]
+        assert len(filter_cache._entries) == 1
+
+    def test_errors_not_cached(self):
+        """Tests that filters that cannot be parsed are reported as
+        usual and not cached.
+
+        """
+        filters = [dict(name='bogus', op='eq', val=1)]
+        response = self.search('/api/person', filters)
+        assert response.status_code == 400
+        filters = [dict(name='id', op='eq', val=None)]
+        response = self.search('/api/person', filters)
+        assert response.status_code == 400
+        assert len(filter_cache._entries) == 0
+
+    def test_concurrent_eviction(self):
+        """Tests that entries can be stored from several threads at once
+        while the cache evicts its least recently used entries.
+
+        """
+        cache = FilterCache(maxsize=8)
+
+        def fill(thread):
+            for i in range(200):
+                cache.put(self.Person, (thread, i), i)
+                cache.get(self.Person, (thread, i - 1))
+
+        threads = [Thread(target=fill, args=(i, )) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert 0 < len(cache._entries) <= 8
+
+
+class TestFilterSchema(SearchTestBase):
+    """Tests for the schema of the fields on which the resources of a
+    model can be filtered.
+
+    """
+
+    def setUp(self):
+        super(TestFilterSchema, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+            birthday = Column(Date)
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship(Person, backref=backref('articles'))
+
+        self.Article = Article
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.manager.create_api(Article)
+        self.manager.create_api(Person)
+
+    def test_created_on_first_use(self):
+        """Tests that the filter schema of a model is computed when its
+        resources are first filtered, including relationships defined by
+        backrefs.
+
+        """
+        assert self.Person not in filter_schemas
+        filters = [dict(name='name', op='eq', val=u'foo')]
+        response = self.search('/api/person', filters)
+        assert response.status_code == 200
+        schema = filter_schemas[self.Person]
+        assert set(['id', 'name', 'birthday', 'articles']) <= \
+            set(schema.fields)
+        assert schema.fields['articles'].related_model is self.Article
+
+    def test_wrong_relationship_operator(self):
+        """Tests that applying the relationship operator for to-one
+        relationships to a to-many relationship causes an error.
+
+        """
+        filters = [dict(name='articles', op='has',
+                        val=dict(name='id', op='eq', val=1))]
+        response = self.search('/api/person', filters)
+        check_sole_error(response, 400, ['operator', 'has', 'articles'])
+
+    def test_relationship_operator_on_column(self):
+        """Tests that applying a relationship operator to a column
+        causes an error.
+
+        """
+        filters = [dict(name='name', op='any',
+                        val=dict(name='id', op='eq', val=1))]
+        response = self.search('/api/person', filters)
+        check_sole_error(response, 400, ['operator', 'any', 'name'])
+
+    def test_numeric_strings(self):
+        """Tests that strings compared to a numeric column are converted
+        to numbers.
+
+        """
+        self.session.add_all(self.Person(id=i) for i in range(1, 12))
+        self.session.commit()
+        filters = [dict(name='id', op='gt', val='9')]
+        response = self.search('/api/person', filters)
+        document = loads(response.data)
+        assert ['10', '11'] == sorted(p['id'] for p in document['data'])
+
+    def test_date_is_null(self):
+        """Tests that a unary operator can be applied to a date column."""
+        self.session.add_all([self.Person(id=1, birthday=date(1990, 1, 1)),
+                              self.Person(id=2)])
+        self.session.commit()
+        filters = [dict(name='birthday', op='is_null')]
+        response = self.search('/api/person', filters)
+        document = loads(response.data)
+        assert ['2'] == [person['id'] for person in document['data']]
+
+
+class TestRelationshipFilterPlanning(SearchTestBase):
+    """Tests that filters on to-one relationships are planned as
+    comparisons of foreign keys or as joins instead of as correlated
+    ``EXISTS`` subqueries.
+
+    """
+
+    def setUp(self):
+        super(TestRelationshipFilterPlanning, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship(Person, foreign_keys=[author_id],
+                                  backref=backref('articles'))
+            editor_id = Column(Integer, ForeignKey('person.id'))
+            editor = relationship(Person, foreign_keys=[editor_id])
+
+        self.Article = Article
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.manager.create_api(Article)
+        self.manager.create_api(Person)
+        person1 = Person(id=1, name=u'foo')
+        person2 = Person(id=2, name=u'bar')
+        self.session.add_all([person1, person2])
+        self.session.add_all([Article(id=1, author=person1, editor=person2),
+                              Article(id=2, author=person2, editor=person2),
+                              Article(id=3)])
+        self.session.commit()
+
+    def search_articles(self, filters):
+        """Returns the IDs of the articles that match `filters` along
+        with the SQL statements executed to find them.
+
+        """
+        engine = self.Base.metadata.bind
+        with count_statements(engine) as statements:
+            response = self.search('/api/article', filters)
+        assert response.status_code == 200
+        document = loads(response.data)
+        ids = sorted(article['id'] for article in document['data'])
+        return ids, statements
+
+    def test_foreign_key(self):
+        """Tests that filtering by the primary key of a related resource
+        compares the foreign key without a subquery.
+
+        """
+        filters = [dict(name='author', op='has',
+                        val=dict(name='id', op='in', val=[1, 2]))]
+        ids, statements = self.search_articles(filters)
+        assert ids == ['1', '2']
+        assert not any('EXISTS' in s for s in statements)
+        assert any('article.author_id IN' in s for s in statements)
+
+    def test_negated_foreign_key(self):
+        """Tests that negating a comparison of the foreign key includes
+        resources whose foreign key is null.
+
+        """
+        filters = [{'not': dict(name='author', op='has',
+                                val=dict(name='id', op='eq', val=1))}]
+        ids, statements = self.search_articles(filters)
+        assert ids == ['2', '3']
+        assert not any('EXISTS' in s for s in statements)
+
+    def test_join(self):
+        """Tests that filtering by another field of a related resource
+        joins the related table.
+
+        """
+        filters = [dict(name='author', op='has',
+                        val=dict(name='name', op='eq', val=u'bar')),
+                   dict(name='author', op='has',
+                        val=dict(name='id', op='lt', val=5))]
+        ids, statements = self.search_articles(filters)
+        assert ids == ['2']
+        assert not any('EXISTS' in s for s in statements)
+        assert any('JOIN person' in s for s in statements)
+
+    def test_negated_join(self):
+        """Tests that a negated relationship filter on another field
+        keeps its semantics, including resources without a related
+        resource.
+
+        """
+        filters = [{'not': dict(name='author', op='has',
+                                val=dict(name='name', op='eq',
+                                         val=u'foo'))}]
+        ids, statements = self.search_articles(filters)
+        assert ids == ['2', '3']
+
+    def test_join_same_model_twice(self):
+        """Tests that filters on two relationships to the same model join
+        the related table only once, leaving the other filter to a
+        subquery, so that the names of the columns are not ambiguous.
+
+        """
+        filters = [dict(name='author', op='has',
+                        val=dict(name='name', op='eq', val=u'foo')),
+                   dict(name='editor', op='has',
+                        val=dict(name='name', op='eq', val=u'bar'))]
+        ids, statements = self.search_articles(filters)
+        assert ids == ['1']
+        assert any('JOIN person' in s for s in statements)
+        assert any('EXISTS' in s for s in statements)
+
+    def test_to_many_uses_exists(self):
+        """Tests that filters on to-many relationships still use a
+        subquery, so that each resource appears at most once.
+
+        """
+        filters = [dict(name='articles', op='any',
+                        val=dict(name='id', op='gt', val=0))]
+        response = self.search('/api/person', filters)
+        document = loads(response.data)
+        assert ['1', '2'] == sorted(p['id'] for p in document['data'])
+
+
 class TestSimpleFiltering(ManagerTestBase):
     """Unit tests for "simple" filter query parameters.
 
@@ -1151,6 +1488,80 @@ class TestOperators(SearchTestBase):
         people = document['data']
         assert ['2'] == sorted(person['id'] for person in people)
 
+    def test_in_value_list(self):
+        """Tests that a long list of values given to the ``in`` operator
+        is bound to a single parameter.
+
+        """
+        self.session.add_all(self.Person(id=i) for i in range(1, 11))
+        self.session.commit()
+        engine = self.Base.metadata.bind
+        filters = [dict(name='id', op='in', val=list(range(2, 2000, 2)))]
+        with count_statements(engine) as statements:
+            response = self.search('/api/person', filters)
+        document = loads(response.data)
+        people = document['data']
+        assert ['10', '2', '4', '6', '8'] == sorted(p['id'] for p in people)
+        assert any('json_each' in s for s in statements)
+        assert all(s.count('?') <= 3 for s in statements)
+
+    def test_not_in_value_list(self):
+        """Tests that a long list of values given to the ``not_in``
+        operator is bound to a single parameter.
+
+        """
+        self.session.add_all(self.Person(id=i) for i in range(1, 11))
+        self.session.commit()
+        filters = [dict(name='id', op='not_in', val=list(range(2, 2000, 2)))]
+        response = self.search('/api/person', filters)
+        document = loads(response.data)
+        people = document['data']
+        assert ['1', '3', '5', '7', '9'] == sorted(p['id'] for p in people)
+
+    def test_value_list_min_length(self):
+        """Tests that the number of values from which a list given to
+        the ``in`` operator is bound to a single parameter can be set
+        when creating the API.
+
+        """
+        self.manager.create_api(self.Person, collection_name='people',
+                                value_list_min_length=3)
+        self.session.add_all(self.Person(id=i) for i in range(1, 11))
+        self.session.commit()
+        engine = self.Base.metadata.bind
+        filters = [dict(name='id', op='in', val=[2, 4, 6])]
+        with count_statements(engine) as statements:
+            response = self.search('/api/people', filters)
+        document = loads(response.data)
+        people = document['data']
+        assert ['2', '4', '6'] == sorted(p['id'] for p in people)
+        assert any('json_each' in s for s in statements)
+        with count_statements(engine) as statements:
+            response = self.search('/api/person', filters)
+        document = loads(response.data)
+        people = document['data']
+        assert ['2', '4', '6'] == sorted(p['id'] for p in people)
+        assert not any('json_each' in s for s in statements)
+
+    def test_value_list_unsupported(self):
+        """Tests that a long list of values given to the ``in`` operator
+        is bound with one parameter for each value if the database does
+        not support binding it to a single parameter.
+
+        """
+        self.session.add_all(self.Person(id=i) for i in range(1, 11))
+        self.session.commit()
+        engine = self.Base.metadata.bind
+        # Pretend that the SQLite library lacks the JSON functions.
+        operators._value_list_support[engine] = False
+        filters = [dict(name='id', op='in', val=list(range(2, 1200, 2)))]
+        with count_statements(engine) as statements:
+            response = self.search('/api/person', filters)
+        document = loads(response.data)
+        people = document['data']
+        assert ['10', '2', '4', '6', '8'] == sorted(p['id'] for p in people)
+        assert not any('json_each' in s for s in statements)
+
     def test_is_null(self):
         """Tests for the ``is_null`` operator."""
         person1 = self.Person(id=1)
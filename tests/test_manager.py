@@ -17,17 +17,26 @@ from sqlalchemy import Column
 from sqlalchemy import ForeignKey
 from sqlalchemy import Integer
 from sqlalchemy import Unicode
+from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.orm import backref
 from sqlalchemy.orm import relationship
+from werkzeug.routing import BuildError
 
 from flask.ext.restless import APIManager
 from flask.ext.restless import collection_name
 from flask.ext.restless import DefaultSerializer
+from flask.ext.restless import CONTENT_TYPE
 from flask.ext.restless import IllegalArgumentError
+from flask.ext.restless import JSONBackend
 from flask.ext.restless import model_for
+from flask.ext.restless import ProcessingException
 from flask.ext.restless import serializer_for
 from flask.ext.restless import url_for
+from flask_restless.helpers import model_info
+from flask_restless.helpers import model_infos
+from flask_restless.json_backends import JSON_BACKENDS
 
+from .helpers import dumps
 from .helpers import FlaskSQLAlchemyTestBase
 from .helpers import force_content_type_jsonapi
 from .helpers import loads
@@ -246,6 +255,88 @@ class TestLocalAPIManager(SQLAlchemyTestBase):
         response = self.app.get('/foo/article')
         assert response.status_code == 404
 
+    def test_json_backend(self):
+        """Tests that a custom JSON backend is used to decode request
+        bodies and encode responses.
+
+        """
+        calls = []
+
+        def json_dumps(obj):
+            calls.append('dumps')
+            return dumps(obj).encode('utf-8')
+
+        def json_loads(s):
+            calls.append('loads')
+            return loads(s)
+
+        backend = JSONBackend('test', json_dumps, json_loads)
+        manager = APIManager(self.flaskapp, session=self.session,
+                             json_backend=backend)
+        manager.create_api(self.Person, methods=['GET', 'POST'])
+        data = dict(data=dict(type='person'))
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 201
+        assert calls == ['loads', 'dumps']
+        del calls[:]
+        response = self.app.get('/api/person')
+        assert response.status_code == 200
+        assert response.mimetype == CONTENT_TYPE
+        document = loads(response.data)
+        assert ['1'] == [person['id'] for person in document['data']]
+        assert calls == ['dumps']
+
+    def test_json_backend_jsonp(self):
+        """Tests that a JSONP response is encoded only once."""
+        calls = []
+
+        def json_dumps(obj):
+            calls.append('dumps')
+            return dumps(obj).encode('utf-8')
+
+        def json_loads(s):
+            calls.append('loads')
+            return loads(s)
+
+        backend = JSONBackend('test', json_dumps, json_loads)
+        manager = APIManager(self.flaskapp, session=self.session,
+                             json_backend=backend)
+        manager.create_api(self.Person)
+        self.session.add(self.Person(id=1))
+        self.session.commit()
+        response = self.app.get('/api/person/1?callback=foo')
+        assert response.status_code == 200
+        assert response.mimetype == 'application/javascript'
+        assert response.data.startswith(b'foo(')
+        assert response.data.endswith(b')')
+        document = loads(response.data[4:-1])
+        assert document['data']['id'] == '1'
+        assert document['meta']['status'] == 200
+        assert calls == ['dumps']
+
+    def test_json_backend_fallback(self):
+        """Tests that the Flask JSON backend is used if none of the
+        preferred backends is installed.
+
+        """
+        names = [name for name in ('orjson', 'ujson')
+                 if name not in JSON_BACKENDS]
+        manager = APIManager(self.flaskapp, session=self.session,
+                             json_backend=names)
+        assert manager.json_backend.name == 'flask'
+        manager.create_api(self.Person)
+        response = self.app.get('/api/person')
+        assert response.status_code == 200
+
+    def test_unknown_json_backend(self):
+        """Tests that providing the name of an unknown JSON backend
+        causes an exception.
+
+        """
+        with self.assertRaises(ValueError):
+            APIManager(self.flaskapp, session=self.session,
+                       json_backend='bogus')
+
     # # This is a possible feature, but we will not support this for now.
     # def test_append_url_prefix(self):
     #     """Tests that a call to :meth:`APIManager.create_api` can
@@ -340,6 +431,54 @@ class TestAPIManager(ManagerTestBase):
         assert author_links['self'] == (
             '/api/article/my_article/relationships/author')
 
+    def test_url_for_quotes_values(self):
+        """Tests that the values of URL arguments are quoted in the URL
+        returned by the global :func:`flask.ext.restless.url_for`
+        function.
+
+        """
+        self.manager.create_api(self.Person)
+        with self.flaskapp.test_request_context():
+            url = url_for(self.Person, resource_id=u'a b%c')
+            assert url.endswith('/api/person/a%20b%25c')
+            url = url_for(self.Person, resource_id=u'\u00e9')
+            assert url.endswith('/api/person/%C3%A9')
+
+    def test_url_for_script_root(self):
+        """Tests that links in responses reflect the script root of each
+        request.
+
+        """
+        article = self.Article(id=1)
+        self.session.add(article)
+        self.session.commit()
+        self.manager.create_api(self.Article)
+        for script_root in ('', '/foo', '/bar'):
+            base_url = 'http://localhost{0}'.format(script_root)
+            response = self.app.get('/api/article/1', base_url=base_url)
+            document = loads(response.data)
+            article = document['data']
+            expected = 'http://localhost{0}/api/article/1'.format(script_root)
+            assert article['links']['self'] == expected
+            author_links = article['relationships']['author']['links']
+            expected = '{0}/api/article/1/relationships/author'
+            assert author_links['self'] == expected.format(script_root)
+
+    def test_url_for_blueprint_registered_later(self):
+        """Tests that URLs can be built for an API whose blueprint is
+        registered on the application only after an attempt to build a
+        URL for it.
+
+        """
+        manager = APIManager(session=self.session)
+        manager.create_api(self.Person)
+        with self.flaskapp.test_request_context():
+            with self.assertRaises(BuildError):
+                url_for(self.Person, resource_id=1)
+        manager.init_app(self.flaskapp)
+        with self.flaskapp.test_request_context():
+            assert url_for(self.Person, resource_id=1).endswith('/person/1')
+
     def test_url_for_nonexistent(self):
         """Tests that attempting to get the URL for an unknown model yields an
         error.
@@ -406,6 +545,24 @@ class TestAPIManager(ManagerTestBase):
         assert collection_name(model_for('people')) == 'people'
         assert model_for(collection_name(self.Person)) is self.Person
 
+    def test_multiple_managers(self):
+        """Tests that the global functions find the APIs created by each
+        of several :class:`~flask.ext.restless.APIManager` objects.
+
+        """
+        manager2 = APIManager(self.flaskapp, session=self.session)
+        self.manager.create_api(self.Person, collection_name='people')
+        manager2.create_api(self.Article, url_prefix='/api2')
+        assert model_for('people') is self.Person
+        assert model_for('article') is self.Article
+        assert collection_name(self.Article) == 'article'
+        assert isinstance(serializer_for(self.Article), DefaultSerializer)
+        with self.flaskapp.test_request_context():
+            assert url_for(self.Person).endswith('/api/people')
+            assert url_for(self.Article).endswith('/api2/article')
+        with self.assertRaises(ValueError):
+            collection_name(self.Article, _apimanager=self.manager)
+
     def test_disallowed_methods(self):
         """Tests that disallowed methods respond with :http:status:`405`."""
         self.manager.create_api(self.Person, methods=[])
@@ -430,6 +587,24 @@ class TestAPIManager(ManagerTestBase):
         with self.assertRaises(IllegalArgumentError):
             self.manager.create_api(self.Person, collection_name='')
 
+    def test_bad_count_policy(self):
+        """Tests that calling :meth:`APIManager.create_api` with an
+        unknown count policy raises an exception.
+
+        """
+        with self.assertRaises(IllegalArgumentError):
+            self.manager.create_api(self.Person, count_policy='bogus')
+
+    def test_row_mode_serializer_class(self):
+        """Tests that calling :meth:`APIManager.create_api` in row mode
+        with a serializer class that does not support it raises an
+        exception.
+
+        """
+        with self.assertRaises(IllegalArgumentError):
+            self.manager.create_api(self.Person, row_mode=True,
+                                    serializer_class=DefaultSerializer)
+
     def test_disallow_functions(self):
         """Tests that if the ``allow_functions`` keyword argument is ``False``,
         no endpoint will be made available at :http:get:`/api/eval/:type`.
@@ -477,6 +652,319 @@ class TestAPIManager(ManagerTestBase):
             self.manager.create_api(self.Person, exclude=['extra'],
                                     additional_attributes=['extra'])
 
+    def test_model_info(self):
+        """Tests that the metadata of a model is computed when it is first
+        needed, including relationships defined by backrefs.
+
+        """
+        self.manager.create_api(self.Person)
+        assert self.Person not in model_infos
+        response = self.app.get('/api/person')
+        assert response.status_code == 200
+        info = model_infos[self.Person]
+        assert info.relations == ('articles', )
+        assert info.related_models['articles'] is self.Article
+        assert info.uselist['articles']
+        assert info.primary_key_names == ('id', )
+        assert info.settable['name']
+
+    def test_create_api_before_related_model(self):
+        """Tests that an API can be created for a model before a model
+        to which it is related has been defined.
+
+        """
+
+        class Author(self.Base):
+            __tablename__ = 'author'
+            id = Column(Integer, primary_key=True)
+            books = relationship('Book')
+
+        self.manager.create_api(Author)
+
+        class Book(self.Base):
+            __tablename__ = 'book'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('author.id'))
+
+        self.manager.create_api(Book)
+        self.Base.metadata.create_all()
+        self.session.add(Author(id=1, books=[Book(id=1)]))
+        self.session.commit()
+        response = self.app.get('/api/author')
+        assert response.status_code == 200
+        document = loads(response.data)
+        authors = document['data']
+        assert ['1'] == [author['id'] for author in authors]
+        books = authors[0]['relationships']['books']['data']
+        assert ['1'] == [book['id'] for book in books]
+
+    def test_model_info_association_proxy(self):
+        """Tests that the metadata of a model with an association proxy
+        can be computed before the proxy has been accessed via the
+        model.
+
+        """
+
+        class Post(self.Base):
+            __tablename__ = 'post'
+            id = Column(Integer, primary_key=True)
+            post_tags = relationship('PostTag')
+            tags = association_proxy('post_tags', 'tag')
+
+        class PostTag(self.Base):
+            __tablename__ = 'post_tag'
+            post_id = Column(Integer, ForeignKey('post.id'),
+                             primary_key=True)
+            tag_name = Column(Unicode, ForeignKey('tag.name'),
+                              primary_key=True)
+            tag = relationship(self.Tag)
+
+        info = model_info(Post)
+        assert set(info.association_proxies) == set(['tags'])
+        assert info.relations == ('tags', )
+        assert info.related_models['tags'] is self.Tag
+        assert info.uselist['tags']
+
+    def test_view_instance_reused(self):
+        """Tests that a single view instance serves every request to an
+        API, and that the sparse fieldsets requested in one request do
+        not leak into the next.
+
+        """
+        self.manager.create_api(self.Person)
+        person = self.Person(id=1, name=u'foo')
+        self.session.add(person)
+        self.session.commit()
+        views = [view for view in self.flaskapp.view_functions.values()
+                 if getattr(view, 'view_class', None) is not None]
+        assert all(view.view_instance.model is self.Person
+                   for view in views)
+        query_string = {'fields[person]': 'name'}
+        response = self.app.get('/api/person/1', query_string=query_string)
+        document = loads(response.data)
+        assert document['data']['attributes'] == dict(name=u'foo')
+        query_string = {'fields[person]': 'articles'}
+        response = self.app.get('/api/person/1', query_string=query_string)
+        document = loads(response.data)
+        assert 'attributes' not in document['data'] or \
+            'name' not in document['data']['attributes']
+        response = self.app.get('/api/person/1')
+        document = loads(response.data)
+        assert document['data']['attributes']['name'] == u'foo'
+
+
+class TestSharedRoutes(ManagerTestBase):
+    """Tests for an :class:`flask.ext.restless.APIManager` whose APIs
+    share URL rules.
+
+    """
+
+    def setUp(self):
+        super(TestSharedRoutes, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship(Person, backref=backref('articles'))
+
+        self.Article = Article
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.manager = APIManager(self.flaskapp, session=self.session,
+                                  shared_routes=True)
+
+    def test_rules_shared(self):
+        """Tests that creating more APIs does not add URL rules to the
+        application.
+
+        """
+        self.manager.create_api(self.Person)
+        num_rules = len(list(self.flaskapp.url_map.iter_rules()))
+        self.manager.create_api(self.Article)
+        assert len(list(self.flaskapp.url_map.iter_rules())) == num_rules
+        assert len(self.manager.blueprints) == 1
+
+    def test_fetch(self):
+        """Tests for fetching resources, related resources, and
+        relationships through the shared URL rules.
+
+        """
+        person = self.Person(id=1)
+        article = self.Article(id=2, author=person)
+        self.session.add_all([person, article])
+        self.session.commit()
+        self.manager.create_api(self.Person, collection_name='people')
+        self.manager.create_api(self.Article)
+        response = self.app.get('/api/people')
+        document = loads(response.data)
+        assert ['1'] == [person['id'] for person in document['data']]
+        response = self.app.get('/api/people/1')
+        document = loads(response.data)
+        assert document['data']['id'] == '1'
+        response = self.app.get('/api/people/1/articles')
+        document = loads(response.data)
+        assert ['2'] == [article['id'] for article in document['data']]
+        response = self.app.get('/api/people/1/articles/2')
+        document = loads(response.data)
+        assert document['data']['id'] == '2'
+        response = self.app.get('/api/article/2/relationships/author')
+        document = loads(response.data)
+        assert document['data'] == dict(id='1', type='people')
+
+    def test_unknown_collection(self):
+        """Tests that a request for a collection without an API yields
+        an error response.
+
+        """
+        self.manager.create_api(self.Person)
+        response = self.app.get('/api/article')
+        assert response.status_code == 404
+        response = self.app.get('/api/eval/person')
+        assert response.status_code == 404
+
+    def test_disallowed_methods(self):
+        """Tests that methods not allowed by an API respond with
+        :http:status:`405`, even if another API allows them.
+
+        """
+        self.manager.create_api(self.Person, methods=['GET', 'DELETE'])
+        self.manager.create_api(self.Article)
+        response = self.app.delete('/api/article/1')
+        assert response.status_code == 405
+        response = self.app.patch('/api/article/1/relationships/author')
+        assert response.status_code == 405
+
+    def test_url_prefixes(self):
+        """Tests that APIs with different URL prefixes are routed by
+        different blueprints.
+
+        """
+        self.manager.create_api(self.Person)
+        self.manager.create_api(self.Article, url_prefix='/other')
+        assert len(self.manager.blueprints) == 2
+        response = self.app.get('/other/article')
+        assert response.status_code == 200
+        response = self.app.get('/api/article')
+        assert response.status_code == 404
+
+    def test_url_for(self):
+        """Tests that :func:`flask.ext.restless.url_for` builds the
+        same URLs as with URL rules for each API.
+
+        """
+        self.manager.create_api(self.Person, collection_name='people')
+        with self.flaskapp.test_request_context():
+            url1 = url_for(self.Person)
+            url2 = url_for(self.Person, resource_id=1)
+            url3 = url_for(self.Person, resource_id=1,
+                           relation_name='articles', relationship=True)
+            url4 = url_for(self.Person, resource_id=u'a b')
+            assert url1.endswith('/api/people')
+            assert url2.endswith('/api/people/1')
+            assert url3.endswith('/api/people/1/relationships/articles')
+            assert url4.endswith('/api/people/a%20b')
+
+    def test_create_api_after_init_app(self):
+        """Tests that an API created after the shared URL rules have
+        been registered on an application is available on it.
+
+        """
+        manager = APIManager(session=self.session, url_prefix='/late',
+                             shared_routes=True)
+        manager.create_api(self.Person)
+        manager.init_app(self.flaskapp)
+        manager.create_api(self.Article)
+        response = self.app.get('/late/article')
+        assert response.status_code == 200
+
+
+class TestLazyAPIs(ManagerTestBase):
+    """Tests for creating lazy APIs with
+    :meth:`flask.ext.restless.APIManager.create_apis`.
+
+    """
+
+    def setUp(self):
+        super(TestLazyAPIs, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship(Person, backref=backref('articles'))
+
+        class Tag(self.Base):
+            __tablename__ = 'tag'
+            name = Column(Unicode, primary_key=True)
+
+        self.Article = Article
+        self.Person = Person
+        self.Tag = Tag
+        self.Base.metadata.create_all()
+
+    def test_create_apis(self):
+        """Tests that an API is created for each model with an ``id``
+        attribute, and that its views are created by its first request.
+
+        """
+        self.manager.create_apis(self.Base, methods=['GET', 'POST'])
+        assert self.Person in self.manager.created_apis_for
+        assert self.Article in self.manager.created_apis_for
+        assert self.Tag not in self.manager.created_apis_for
+        assert all(api.views is None for api in self.manager.lazy_apis)
+        data = dict(data=dict(type='person', attributes=dict(name=u'foo')))
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 201
+        response = self.app.get('/api/person/1/articles')
+        assert response.status_code == 200
+        num_created = sum(api.views is not None
+                          for api in self.manager.lazy_apis)
+        assert num_created == 1
+
+    def test_warmup(self):
+        """Tests that :meth:`flask.ext.restless.APIManager.warmup`
+        creates the views of all lazy APIs.
+
+        """
+        self.manager.create_apis(self.Base)
+        self.manager.warmup()
+        assert all(api.views is not None for api in self.manager.lazy_apis)
+        response = self.app.get('/api/article')
+        assert response.status_code == 200
+
+    def test_processors(self):
+        """Tests that the preprocessors of a lazy API are applied."""
+
+        def forbid(*args, **kw):
+            raise ProcessingException(status=403)
+
+        preprocessors = dict(GET_COLLECTION=[forbid])
+        self.manager.create_api(self.Person, lazy=True,
+                                preprocessors=preprocessors)
+        response = self.app.get('/api/person')
+        assert response.status_code == 403
+
+    def test_shared_routes(self):
+        """Tests for lazy APIs whose URL rules are shared."""
+        manager = APIManager(self.flaskapp, session=self.session,
+                             url_prefix='/shared', shared_routes=True)
+        manager.create_apis(self.Base)
+        response = self.app.get('/shared/person')
+        assert response.status_code == 200
+        response = self.app.get('/shared/tag')
+        assert response.status_code == 404
+
 
 class TestFSA(FlaskSQLAlchemyTestBase):
     """Tests which use models defined using Flask-SQLAlchemy instead of pure
@@ -40,8 +40,10 @@ from sqlalchemy.orm import relationship
 from flask.ext.restless import DefaultSerializer
 from flask.ext.restless import MultipleExceptions
 from flask.ext.restless import SerializationException
+from flask_restless.serialization import serializers
 
 from .helpers import check_sole_error
+from .helpers import count_statements
 from .helpers import GUID
 from .helpers import loads
 from .helpers import ManagerTestBase
@@ -695,3 +697,210 @@ class TestFetchRelatedResource(ManagerTestBase):
         check_sole_error(response, 500, ['Failed to serialize',
                                          'included resource', 'type', 'person',
                                          'ID', '1'])
+
+
+class TestRelationshipLinkage(ManagerTestBase):
+    """Tests for serializing resource linkage when fetching a collection."""
+
+    def setUp(self):
+        super(TestRelationshipLinkage, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            parent_id = Column(Integer, ForeignKey('person.id'))
+            parent = relationship('Person', remote_side=[id])
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship(Person, backref=backref('articles'))
+
+        class Topic(self.Base):
+            __tablename__ = 'topic'
+            id = Column(Integer, primary_key=True)
+
+        class Comment(self.Base):
+            __tablename__ = 'comment'
+            id = Column(Integer, primary_key=True)
+            article_id = Column(Integer, ForeignKey('article.id'))
+            article = relationship(Article, backref=backref('comments'))
+            topic_id = Column(Integer, ForeignKey('topic.id'))
+            topic = relationship(Topic, backref=backref('comments'))
+
+        self.Article = Article
+        self.Comment = Comment
+        self.Person = Person
+        self.Topic = Topic
+        self.Base.metadata.create_all()
+        self.manager.create_api(Article)
+        self.manager.create_api(Comment)
+        self.manager.create_api(Person)
+        self.manager.create_api(Topic)
+
+    def test_linkage(self):
+        """Tests that the resource linkage of to-one and to-many
+        relationships is correct for each resource in a collection.
+
+        """
+        person = self.Person(id=1)
+        article1 = self.Article(id=1, author=person)
+        article2 = self.Article(id=2)
+        comment1 = self.Comment(id=1, article=article1)
+        comment2 = self.Comment(id=2, article=article1)
+        self.session.add_all([person, article1, article2, comment1, comment2])
+        self.session.commit()
+        response = self.app.get('/api/article')
+        document = loads(response.data)
+        article1, article2 = sorted(document['data'], key=lambda a: a['id'])
+        author = article1['relationships']['author']['data']
+        assert author == {'id': '1', 'type': 'person'}
+        comments = article1['relationships']['comments']['data']
+        assert comments == [{'id': '1', 'type': 'comment'},
+                            {'id': '2', 'type': 'comment'}]
+        assert article2['relationships']['author']['data'] is None
+        assert article2['relationships']['comments']['data'] == []
+
+    def test_self_referential(self):
+        """Tests that the resource linkage of a self-referential
+        relationship is correct for each resource in a collection.
+
+        """
+        person1 = self.Person(id=1)
+        person2 = self.Person(id=2, parent=person1)
+        self.session.add_all([person1, person2])
+        self.session.commit()
+        response = self.app.get('/api/person')
+        document = loads(response.data)
+        person1, person2 = sorted(document['data'], key=lambda p: p['id'])
+        assert person1['relationships']['parent']['data'] is None
+        parent = person2['relationships']['parent']['data']
+        assert parent == {'id': '1', 'type': 'person'}
+
+    def test_queries_independent_of_page_size(self):
+        """Tests that the number of queries required to compute the
+        resource linkage does not depend on the number of resources on
+        the page.
+
+        """
+        for i in range(1, 11):
+            person = self.Person(id=i)
+            article = self.Article(id=i, author=person)
+            comment = self.Comment(id=i, article=article)
+            self.session.add_all([person, article, comment])
+        self.session.commit()
+        engine = self.Base.metadata.bind
+
+        def statements_for_page(size):
+            # Start with an empty identity map, so that nothing has
+            # been loaded before the request.
+            self.session.remove()
+            query_string = {'page[size]': size}
+            with count_statements(engine) as statements:
+                response = self.app.get('/api/article',
+                                        query_string=query_string)
+            assert response.status_code == 200
+            document = loads(response.data)
+            assert len(document['data']) == size
+            return len(statements)
+
+        assert statements_for_page(2) == statements_for_page(10)
+
+    def test_to_one_from_foreign_key(self):
+        """Tests that the resource linkage of a many-to-one relationship
+        is built from the foreign key, without loading the related
+        resource.
+
+        """
+        person = self.Person(id=1)
+        article1 = self.Article(id=1, author=person)
+        article2 = self.Article(id=2)
+        self.session.add_all([person, article1, article2])
+        self.session.commit()
+        self.session.remove()
+        engine = self.Base.metadata.bind
+        with count_statements(engine) as statements:
+            response = self.app.get('/api/article/1')
+        document = loads(response.data)
+        author = document['data']['relationships']['author']['data']
+        assert author == {'id': '1', 'type': 'person'}
+        assert not any('FROM person' in s for s in statements)
+        self.session.remove()
+        with count_statements(engine) as statements:
+            response = self.app.get('/api/article')
+        document = loads(response.data)
+        article1, article2 = sorted(document['data'], key=lambda a: a['id'])
+        author = article1['relationships']['author']['data']
+        assert author == {'id': '1', 'type': 'person'}
+        assert article2['relationships']['author']['data'] is None
+        assert not any('FROM person' in s for s in statements)
+
+    def test_different_sparse_fieldsets(self):
+        """Tests that consecutive requests for different sparse fieldsets
+        of the same type each get the requested fields.
+
+        """
+        article = self.Article(id=1)
+        self.session.add(article)
+        self.session.commit()
+        query_string = {'fields[article]': 'author'}
+        response = self.app.get('/api/article', query_string=query_string)
+        document = loads(response.data)
+        article = document['data'][0]
+        assert ['author'] == list(article['relationships'])
+        query_string = {'fields[article]': 'comments'}
+        response = self.app.get('/api/article', query_string=query_string)
+        document = loads(response.data)
+        article = document['data'][0]
+        assert ['comments'] == list(article['relationships'])
+        response = self.app.get('/api/article')
+        document = loads(response.data)
+        article = document['data'][0]
+        assert ['author', 'comments'] == sorted(article['relationships'])
+
+    def test_many_chunks(self):
+        """Tests that the resource linkage is correct when the primary
+        keys of the resources on the page do not fit in a single query.
+
+        """
+        for i in range(1, 11):
+            article = self.Article(id=i)
+            comment = self.Comment(id=i, article=article)
+            self.session.add_all([article, comment])
+        self.session.commit()
+        max_linkage_ids = serializers.MAX_LINKAGE_IDS
+        serializers.MAX_LINKAGE_IDS = 3
+        try:
+            query_string = {'page[size]': 10}
+            response = self.app.get('/api/article', query_string=query_string)
+        finally:
+            serializers.MAX_LINKAGE_IDS = max_linkage_ids
+        document = loads(response.data)
+        assert len(document['data']) == 10
+        for article in document['data']:
+            comments = article['relationships']['comments']['data']
+            assert comments == [{'id': article['id'], 'type': 'comment'}]
+
+    def test_heterogeneous(self):
+        """Tests that the resource linkage is computed separately for
+        the instances of each model when serializing instances of
+        different models together.
+
+        """
+        article = self.Article(id=1)
+        topic = self.Topic(id=1)
+        comment1 = self.Comment(id=1, article=article)
+        comment2 = self.Comment(id=2, topic=topic)
+        self.session.add_all([article, topic, comment1, comment2])
+        self.session.commit()
+        self.session.remove()
+        article = self.session.query(self.Article).get(1)
+        topic = self.session.query(self.Topic).get(1)
+        with self.flaskapp.test_request_context():
+            document = DefaultSerializer().serialize_many([article, topic])
+        article, topic = document['data']
+        comments = article['relationships']['comments']['data']
+        assert comments == [{'id': '1', 'type': 'comment'}]
+        comments = topic['relationships']['comments']['data']
+        assert comments == [{'id': '2', 'type': 'comment'}]